@@ -3,6 +3,10 @@
 -- ============================================
 
 -- Eliminar tablas si existen
+DROP TABLE IF EXISTS geocercas CASCADE;
+DROP TABLE IF EXISTS lecturas_rollup_ubicacion CASCADE;
+DROP TABLE IF EXISTS lecturas_rollup_sensor CASCADE;
+DROP TABLE IF EXISTS lecturas_ultimas CASCADE;
 DROP TABLE IF EXISTS lecturas CASCADE;
 DROP TABLE IF EXISTS sensores CASCADE;
 DROP TABLE IF EXISTS vehiculos CASCADE;
@@ -103,9 +107,9 @@ CREATE TABLE sensores (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
--- Tabla de Lecturas
+-- Tabla de Lecturas (particionada por mes sobre timestamp)
 CREATE TABLE lecturas (
-    id VARCHAR(50) PRIMARY KEY,
+    id VARCHAR(50) NOT NULL,
     sensor_id VARCHAR(50) NOT NULL REFERENCES sensores(id) ON DELETE CASCADE,
     ubicacion_id VARCHAR(50) NOT NULL,
     timestamp TIMESTAMP NOT NULL,
@@ -117,6 +121,68 @@ CREATE TABLE lecturas (
     alerta_activa BOOLEAN DEFAULT false,
     tiempo_fuera_rango INTEGER DEFAULT 0,
     cadena_rota BOOLEAN DEFAULT false,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- La clave de partición debe formar parte de la clave primaria
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+-- Última lectura de cada sensor (mantenida por trigger al insertar en lecturas)
+CREATE TABLE lecturas_ultimas (
+    sensor_id VARCHAR(50) PRIMARY KEY REFERENCES sensores(id) ON DELETE CASCADE,
+    ubicacion_id VARCHAR(50) NOT NULL,
+    lectura_id VARCHAR(50) NOT NULL,
+    timestamp TIMESTAMP NOT NULL,
+    temperatura NUMERIC(5, 2) NOT NULL,
+    latitud NUMERIC(10, 7) NOT NULL,
+    longitud NUMERIC(10, 7) NOT NULL,
+    altitud NUMERIC(7, 2),
+    estado VARCHAR(50) NOT NULL,
+    alerta_activa BOOLEAN DEFAULT false,
+    tiempo_fuera_rango INTEGER DEFAULT 0,
+    cadena_rota BOOLEAN DEFAULT false,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Agregados de lecturas por sensor y por ubicación (granularidad minute/hour/day),
+-- mantenidos por trigger al insertar en lecturas. La media es suma_temperatura / total.
+CREATE TABLE lecturas_rollup_sensor (
+    sensor_id VARCHAR(50) NOT NULL REFERENCES sensores(id) ON DELETE CASCADE,
+    granularidad VARCHAR(10) NOT NULL CHECK (granularidad IN ('minute', 'hour', 'day')),
+    bucket TIMESTAMP NOT NULL,
+    total INTEGER NOT NULL,
+    suma_temperatura NUMERIC(16, 2) NOT NULL,
+    temperatura_min NUMERIC(5, 2) NOT NULL,
+    temperatura_max NUMERIC(5, 2) NOT NULL,
+    lecturas_normales INTEGER NOT NULL,
+    lecturas_alerta INTEGER NOT NULL,
+    lecturas_criticas INTEGER NOT NULL,
+    tiempo_max_fuera_rango INTEGER NOT NULL,
+    cadena_rota BOOLEAN NOT NULL,
+    PRIMARY KEY (sensor_id, granularidad, bucket)
+);
+
+CREATE TABLE lecturas_rollup_ubicacion (
+    ubicacion_id VARCHAR(50) NOT NULL,
+    granularidad VARCHAR(10) NOT NULL CHECK (granularidad IN ('minute', 'hour', 'day')),
+    bucket TIMESTAMP NOT NULL,
+    total INTEGER NOT NULL,
+    suma_temperatura NUMERIC(16, 2) NOT NULL,
+    temperatura_min NUMERIC(5, 2) NOT NULL,
+    temperatura_max NUMERIC(5, 2) NOT NULL,
+    lecturas_normales INTEGER NOT NULL,
+    lecturas_alerta INTEGER NOT NULL,
+    lecturas_criticas INTEGER NOT NULL,
+    tiempo_max_fuera_rango INTEGER NOT NULL,
+    cadena_rota BOOLEAN NOT NULL,
+    PRIMARY KEY (ubicacion_id, granularidad, bucket)
+);
+
+-- Geocercas (depósitos, zonas de cliente): polígono [[longitud, latitud], ...]
+CREATE TABLE geocercas (
+    id VARCHAR(50) PRIMARY KEY,
+    nombre VARCHAR(255) NOT NULL,
+    tipo VARCHAR(50) NOT NULL CHECK (tipo IN ('deposito', 'cliente', 'otro')),
+    poligono JSONB NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -128,9 +194,86 @@ CREATE INDEX idx_sensores_ubicacion ON sensores(ubicacion_id);
 CREATE INDEX idx_sensores_tipo_alimento ON sensores(tipo_alimento);
 CREATE INDEX idx_lecturas_sensor ON lecturas(sensor_id);
 CREATE INDEX idx_lecturas_ubicacion ON lecturas(ubicacion_id);
-CREATE INDEX idx_lecturas_timestamp ON lecturas(timestamp);
+CREATE INDEX idx_lecturas_timestamp_id ON lecturas(timestamp, id);
+CREATE INDEX idx_rollup_sensor_bucket ON lecturas_rollup_sensor(bucket);
+CREATE INDEX idx_rollup_ubicacion_bucket ON lecturas_rollup_ubicacion(bucket);
 CREATE INDEX idx_lecturas_estado ON lecturas(estado);
 CREATE INDEX idx_lecturas_cadena_rota ON lecturas(cadena_rota);
+CREATE INDEX idx_lecturas_ubicacion_timestamp ON lecturas(ubicacion_id, timestamp, id);
+CREATE INDEX idx_lecturas_sensor_timestamp ON lecturas(sensor_id, timestamp DESC, id DESC);
+CREATE INDEX idx_lecturas_alerta_timestamp ON lecturas(timestamp, id) WHERE alerta_activa;
+CREATE INDEX idx_lecturas_cadena_rota_timestamp ON lecturas(timestamp, id) WHERE cadena_rota;
+CREATE INDEX idx_lecturas_ultimas_ubicacion ON lecturas_ultimas(ubicacion_id, timestamp DESC);
+
+-- Particiones mensuales de lecturas (lecturas_AAAA_MM). La clave primaria incluye el
+-- timestamp, así que cada partición lleva además un índice único sobre id: el id es único
+-- dentro del mes sin bloqueos ni tablas auxiliares y el índice desaparece con la partición
+CREATE OR REPLACE FUNCTION crear_particion_lecturas(fecha TIMESTAMP)
+RETURNS TEXT AS $$
+DECLARE
+    inicio TIMESTAMP := date_trunc('month', fecha);
+    nombre TEXT := 'lecturas_' || to_char(inicio, 'YYYY_MM');
+BEGIN
+    -- Solo se bloquea la tabla padre si la partición no existe todavía
+    IF to_regclass(nombre) IS NULL THEN
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF lecturas FOR VALUES FROM (%L) TO (%L)',
+            nombre, inicio, inicio + INTERVAL '1 month'
+        );
+        EXECUTE format('CREATE UNIQUE INDEX IF NOT EXISTS %I ON %I (id)', nombre || '_id_key', nombre);
+    END IF;
+    RETURN nombre;
+END;
+$$ language 'plpgsql';
+
+-- Crea las particiones desde el mes de `desde` hasta `meses_adelante` meses después del actual
+CREATE OR REPLACE FUNCTION crear_particiones_lecturas(desde TIMESTAMP, meses_adelante INTEGER DEFAULT 3)
+RETURNS SETOF TEXT AS $$
+DECLARE
+    mes TIMESTAMP;
+BEGIN
+    FOR mes IN
+        SELECT generate_series(
+            date_trunc('month', desde),
+            date_trunc('month', LOCALTIMESTAMP) + make_interval(months => meses_adelante),
+            INTERVAL '1 month'
+        )
+    LOOP
+        RETURN NEXT crear_particion_lecturas(mes);
+    END LOOP;
+END;
+$$ language 'plpgsql';
+
+-- Retención: elimina las particiones completas anteriores a `retencion` (DROP en lugar de DELETE)
+-- y con ellas los agregados del mismo periodo, para que el histórico agregado
+-- cubra exactamente las lecturas conservadas
+CREATE OR REPLACE FUNCTION purgar_particiones_lecturas(retencion INTERVAL)
+RETURNS SETOF TEXT AS $$
+DECLARE
+    particion RECORD;
+    limite DATE := date_trunc('month', LOCALTIMESTAMP - retencion)::date;
+BEGIN
+    -- Los buckets (minuto, hora, día) nunca cruzan un inicio de mes
+    DELETE FROM lecturas_rollup_sensor WHERE bucket < limite;
+    DELETE FROM lecturas_rollup_ubicacion WHERE bucket < limite;
+    FOR particion IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'lecturas'::regclass
+          AND c.relname ~ '^lecturas_[0-9]{4}_[0-9]{2}$'
+        ORDER BY c.relname
+    LOOP
+        IF to_date(substr(particion.relname, 10), 'YYYY_MM') < limite THEN
+            EXECUTE format('DROP TABLE %I', particion.relname);
+            RETURN NEXT particion.relname;
+        END IF;
+    END LOOP;
+END;
+$$ language 'plpgsql';
+
+-- Particiones iniciales: desde el mes de los datos semilla hasta 3 meses por delante
+SELECT crear_particiones_lecturas('2025-11-01', 3);
 
 -- Triggers para updated_at
 CREATE OR REPLACE FUNCTION update_updated_at_column()
@@ -157,4 +300,123 @@ CREATE TRIGGER update_vehiculos_updated_at BEFORE UPDATE ON vehiculos
     FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 
 CREATE TRIGGER update_sensores_updated_at BEFORE UPDATE ON sensores
-    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
\ No newline at end of file
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+-- Trigger para descartar ids de lectura repetidos entre particiones: si el id ya existe
+-- (en cualquier mes o antes en la misma sentencia) la fila no se inserta ni aparece en
+-- RETURNING. Solo consulta los índices de id de las particiones conservadas, así que su
+-- coste depende de la retención y no del histórico. Dos inserciones concurrentes del
+-- mismo id en el mismo mes las resuelve el índice único de la partición; solo dos
+-- inserciones concurrentes del mismo id en meses distintos podrían entrar ambas.
+CREATE OR REPLACE FUNCTION descartar_id_lectura_repetido()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM lecturas WHERE id = NEW.id) THEN
+        RETURN NULL;
+    END IF;
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER descartar_ids_repetidos_lecturas BEFORE INSERT ON lecturas
+    FOR EACH ROW EXECUTE FUNCTION descartar_id_lectura_repetido();
+
+-- Trigger para mantener lecturas_ultimas (solo avanza si la lectura es más reciente)
+CREATE OR REPLACE FUNCTION actualizar_lectura_ultima()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO lecturas_ultimas (
+        sensor_id, ubicacion_id, lectura_id, timestamp, temperatura, latitud, longitud,
+        altitud, estado, alerta_activa, tiempo_fuera_rango, cadena_rota
+    ) VALUES (
+        NEW.sensor_id, NEW.ubicacion_id, NEW.id, NEW.timestamp, NEW.temperatura, NEW.latitud, NEW.longitud,
+        NEW.altitud, NEW.estado, NEW.alerta_activa, NEW.tiempo_fuera_rango, NEW.cadena_rota
+    )
+    ON CONFLICT (sensor_id) DO UPDATE SET
+        ubicacion_id = EXCLUDED.ubicacion_id,
+        lectura_id = EXCLUDED.lectura_id,
+        timestamp = EXCLUDED.timestamp,
+        temperatura = EXCLUDED.temperatura,
+        latitud = EXCLUDED.latitud,
+        longitud = EXCLUDED.longitud,
+        altitud = EXCLUDED.altitud,
+        estado = EXCLUDED.estado,
+        alerta_activa = EXCLUDED.alerta_activa,
+        tiempo_fuera_rango = EXCLUDED.tiempo_fuera_rango,
+        cadena_rota = EXCLUDED.cadena_rota,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE lecturas_ultimas.timestamp <= EXCLUDED.timestamp;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER actualizar_lecturas_ultimas AFTER INSERT ON lecturas
+    FOR EACH ROW EXECUTE FUNCTION actualizar_lectura_ultima();
+
+-- Trigger de sentencia para acumular los agregados: cada INSERT (fila a fila o por lotes)
+-- agrupa sus lecturas nuevas y actualiza una fila por clave, granularidad y bucket.
+-- El ORDER BY fija el orden de bloqueo entre lotes concurrentes.
+CREATE OR REPLACE FUNCTION acumular_rollups_lecturas()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO lecturas_rollup_sensor AS r (
+        sensor_id, granularidad, bucket, total, suma_temperatura, temperatura_min, temperatura_max,
+        lecturas_normales, lecturas_alerta, lecturas_criticas, tiempo_max_fuera_rango, cadena_rota
+    )
+    SELECT
+        n.sensor_id, g.granularidad, date_trunc(g.granularidad, n.timestamp),
+        COUNT(*), SUM(n.temperatura), MIN(n.temperatura), MAX(n.temperatura),
+        COUNT(*) FILTER (WHERE n.estado = 'normal'),
+        COUNT(*) FILTER (WHERE n.estado = 'alerta'),
+        COUNT(*) FILTER (WHERE n.estado = 'critico'),
+        COALESCE(MAX(n.tiempo_fuera_rango), 0),
+        COALESCE(BOOL_OR(n.cadena_rota), false)
+    FROM nuevas n
+    CROSS JOIN (VALUES ('minute'), ('hour'), ('day')) AS g(granularidad)
+    GROUP BY 1, 2, 3
+    ORDER BY 1, 2, 3
+    ON CONFLICT (sensor_id, granularidad, bucket) DO UPDATE SET
+        total = r.total + EXCLUDED.total,
+        suma_temperatura = r.suma_temperatura + EXCLUDED.suma_temperatura,
+        temperatura_min = LEAST(r.temperatura_min, EXCLUDED.temperatura_min),
+        temperatura_max = GREATEST(r.temperatura_max, EXCLUDED.temperatura_max),
+        lecturas_normales = r.lecturas_normales + EXCLUDED.lecturas_normales,
+        lecturas_alerta = r.lecturas_alerta + EXCLUDED.lecturas_alerta,
+        lecturas_criticas = r.lecturas_criticas + EXCLUDED.lecturas_criticas,
+        tiempo_max_fuera_rango = GREATEST(r.tiempo_max_fuera_rango, EXCLUDED.tiempo_max_fuera_rango),
+        cadena_rota = r.cadena_rota OR EXCLUDED.cadena_rota;
+
+    INSERT INTO lecturas_rollup_ubicacion AS r (
+        ubicacion_id, granularidad, bucket, total, suma_temperatura, temperatura_min, temperatura_max,
+        lecturas_normales, lecturas_alerta, lecturas_criticas, tiempo_max_fuera_rango, cadena_rota
+    )
+    SELECT
+        n.ubicacion_id, g.granularidad, date_trunc(g.granularidad, n.timestamp),
+        COUNT(*), SUM(n.temperatura), MIN(n.temperatura), MAX(n.temperatura),
+        COUNT(*) FILTER (WHERE n.estado = 'normal'),
+        COUNT(*) FILTER (WHERE n.estado = 'alerta'),
+        COUNT(*) FILTER (WHERE n.estado = 'critico'),
+        COALESCE(MAX(n.tiempo_fuera_rango), 0),
+        COALESCE(BOOL_OR(n.cadena_rota), false)
+    FROM nuevas n
+    CROSS JOIN (VALUES ('minute'), ('hour'), ('day')) AS g(granularidad)
+    GROUP BY 1, 2, 3
+    ORDER BY 1, 2, 3
+    ON CONFLICT (ubicacion_id, granularidad, bucket) DO UPDATE SET
+        total = r.total + EXCLUDED.total,
+        suma_temperatura = r.suma_temperatura + EXCLUDED.suma_temperatura,
+        temperatura_min = LEAST(r.temperatura_min, EXCLUDED.temperatura_min),
+        temperatura_max = GREATEST(r.temperatura_max, EXCLUDED.temperatura_max),
+        lecturas_normales = r.lecturas_normales + EXCLUDED.lecturas_normales,
+        lecturas_alerta = r.lecturas_alerta + EXCLUDED.lecturas_alerta,
+        lecturas_criticas = r.lecturas_criticas + EXCLUDED.lecturas_criticas,
+        tiempo_max_fuera_rango = GREATEST(r.tiempo_max_fuera_rango, EXCLUDED.tiempo_max_fuera_rango),
+        cadena_rota = r.cadena_rota OR EXCLUDED.cadena_rota;
+
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER acumular_rollups AFTER INSERT ON lecturas
+    REFERENCING NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION acumular_rollups_lecturas();
@@ -3,7 +3,7 @@
 -- ============================================
 
 -- Limpiar datos existentes
-TRUNCATE TABLE lecturas, sensores, vehiculos, productos_pedido, pedidos, conductores, proveedores, clientes RESTART IDENTITY CASCADE;
+TRUNCATE TABLE lecturas_rollup_ubicacion, lecturas_rollup_sensor, lecturas_ultimas, lecturas, sensores, vehiculos, productos_pedido, pedidos, conductores, proveedores, clientes RESTART IDENTITY CASCADE;
 
 -- ============================================
 -- DATOS CRM
@@ -0,0 +1,8 @@
+#!/bin/bash
+# Usuario de replicación y acceso desde las réplicas (se ejecuta al inicializar el primario)
+set -e
+
+psql -v ON_ERROR_STOP=1 -U "$POSTGRES_USER" -d "$POSTGRES_DB" \
+    -c "CREATE ROLE replicador WITH REPLICATION LOGIN PASSWORD 'replicador';"
+
+echo "host replication replicador all scram-sha-256" >> "$PGDATA/pg_hba.conf"
@@ -0,0 +1,237 @@
+"""Difusión en vivo (Server-Sent Events) de alertas y cambios de estado de la cadena de frío"""
+import asyncio
+import json
+import os
+from collections import defaultdict
+import consultas
+import db
+
+# Eventos pendientes por suscriptor antes de descartar los más antiguos
+COLA_MAX = int(os.getenv('ALERTAS_COLA_MAX', '256'))
+MAX_SUSCRIPTORES = int(os.getenv('ALERTAS_MAX_SUSCRIPTORES', '10000'))
+# Segundos sin eventos tras los que se envía un comentario para mantener viva la conexión
+HEARTBEAT = float(os.getenv('ALERTAS_HEARTBEAT', '15'))
+
+# Gravedad de cada estado, para calcular el estado general de un vehículo
+GRAVEDAD = {"normal": 0, "alerta": 1, "critico": 2, "cadena_rota": 3}
+
+SQL_SENSORES = consultas.registrar("alertas_sensores", """
+    SELECT s.id, s.ubicacion_id, s.tipo_alimento, u.timestamp, u.estado, u.cadena_rota
+    FROM sensores s
+    LEFT JOIN lecturas_ultimas u ON u.sensor_id = s.id
+""", primario=True)
+
+# Solo los sensores que faltan en caché (dados de alta después de cargar)
+SQL_SENSORES_IDS = consultas.registrar(
+    "alertas_sensores_ids", SQL_SENSORES.sql + "    WHERE s.id = ANY(%s)\n", primario=True
+)
+
+
+class Suscripcion:
+    """Cola acotada de un cliente; si se llena se descartan los eventos más antiguos"""
+    __slots__ = ("vehiculo_id", "sensor_id", "tipo_alimento", "cola", "perdidos")
+
+    def __init__(self, vehiculo_id=None, sensor_id=None, tipo_alimento=None, maxsize=COLA_MAX):
+        self.vehiculo_id = vehiculo_id
+        self.sensor_id = sensor_id
+        self.tipo_alimento = tipo_alimento
+        self.cola = asyncio.Queue(maxsize)
+        self.perdidos = 0
+
+    def clave(self):
+        # Se indexa por el filtro más selectivo
+        if self.sensor_id:
+            return ('sensor', self.sensor_id)
+        if self.vehiculo_id:
+            return ('vehiculo', self.vehiculo_id)
+        if self.tipo_alimento:
+            return ('tipo', self.tipo_alimento)
+        return None
+
+    def acepta(self, evento):
+        return (
+            (self.vehiculo_id is None or evento['vehiculoId'] == self.vehiculo_id) and
+            (self.sensor_id is None or evento.get('sensorId') == self.sensor_id) and
+            (self.tipo_alimento is None or evento.get('tipoAlimento') == self.tipo_alimento)
+        )
+
+    def entregar(self, mensaje):
+        """Encola sin bloquear: un cliente lento nunca frena al publicador"""
+        if self.cola.full():
+            self.cola.get_nowait()
+            self.perdidos += 1
+        self.cola.put_nowait(mensaje)
+
+
+def formatear_sse(tipo, secuencia, datos):
+    return f"event: {tipo}\nid: {secuencia}\ndata: {json.dumps(datos, default=str)}\n\n"
+
+
+class DifusorAlertas:
+    """
+    Reparte los eventos de la ingesta entre los suscriptores conectados. Cada evento
+    se serializa una sola vez y solo se evalúa contra los suscriptores de su sensor,
+    vehículo, tipo de alimento o sin filtro. Mantiene el último estado de cada sensor
+    para detectar cambios del estado general de cada vehículo.
+    """
+
+    def __init__(self):
+        self.suscripciones = defaultdict(set)
+        self.total_suscriptores = 0
+        self.sensores = {}       # sensor_id -> (vehiculo_id, tipo_alimento)
+        self.estados = {}        # sensor_id -> (timestamp, estado)
+        self.por_vehiculo = defaultdict(set)
+        self.secuencia = 0
+        self.publicados = 0
+
+    async def cargar(self):
+        """Carga sensores y su último estado desde lecturas_ultimas"""
+        filas = await db.ejecutar(SQL_SENSORES)
+        self.sensores = {f['id']: (f['ubicacion_id'], f['tipo_alimento']) for f in filas}
+        self.por_vehiculo = defaultdict(set)
+        for f in filas:
+            self.por_vehiculo[f['ubicacion_id']].add(f['id'])
+        self.estados = {
+            f['id']: (f['timestamp'], 'cadena_rota' if f['cadena_rota'] else f['estado'])
+            for f in filas if f['timestamp'] is not None
+        }
+
+    async def asegurar_sensores(self, filas):
+        """
+        Carga solo los sensores del lote que no están en caché. lecturas_ultimas ya
+        incluye el lote, así que su estado solo se toma como previo si es posterior a
+        las lecturas del lote; si no, el sensor empieza sin estado y el lote lo fija.
+        """
+        ultimo = {}
+        for fila in filas:
+            if fila[1] not in self.sensores:
+                ultimo[fila[1]] = max(ultimo.get(fila[1], fila[3]), fila[3])
+        if not ultimo:
+            return
+        for f in await db.ejecutar(SQL_SENSORES_IDS, [list(ultimo)]):
+            self.sensores[f['id']] = (f['ubicacion_id'], f['tipo_alimento'])
+            self.por_vehiculo[f['ubicacion_id']].add(f['id'])
+            if f['timestamp'] is not None and f['timestamp'] > ultimo[f['id']]:
+                estado = 'cadena_rota' if f['cadena_rota'] else f['estado']
+                self.estados.setdefault(f['id'], (f['timestamp'], estado))
+
+    def admite(self):
+        return self.total_suscriptores < MAX_SUSCRIPTORES
+
+    def suscribir(self, vehiculo_id=None, sensor_id=None, tipo_alimento=None):
+        if not self.admite():
+            return None
+        suscripcion = Suscripcion(vehiculo_id, sensor_id, tipo_alimento)
+        self.suscripciones[suscripcion.clave()].add(suscripcion)
+        self.total_suscriptores += 1
+        return suscripcion
+
+    def cancelar(self, suscripcion):
+        clave = suscripcion.clave()
+        grupo = self.suscripciones.get(clave)
+        if grupo and suscripcion in grupo:
+            grupo.discard(suscripcion)
+            self.total_suscriptores -= 1
+            if not grupo:
+                del self.suscripciones[clave]
+
+    def publicar(self, tipo, evento):
+        if not self.total_suscriptores:
+            return
+        self.secuencia += 1
+        self.publicados += 1
+        mensaje = None
+        claves = (
+            ('sensor', evento.get('sensorId')),
+            ('vehiculo', evento['vehiculoId']),
+            ('tipo', evento.get('tipoAlimento')),
+            None
+        )
+        for clave in claves:
+            for suscripcion in self.suscripciones.get(clave, ()):
+                if suscripcion.acepta(evento):
+                    if mensaje is None:
+                        mensaje = formatear_sse(tipo, self.secuencia, evento)
+                    suscripcion.entregar(mensaje)
+
+    def estado_vehiculo(self, vehiculo_id):
+        estados = [self.estados[s][1] for s in self.por_vehiculo.get(vehiculo_id, ()) if s in self.estados]
+        return max(estados, key=GRAVEDAD.get, default="normal")
+
+    async def publicar_lote(self, filas):
+        """
+        Publica las lecturas insertadas (tuplas de ingesta.COLUMNAS, ordenadas por
+        timestamp) en alerta, críticas o con cadena rota, y los cambios de estado general.
+        """
+        await self.asegurar_sensores(filas)
+
+        for (lectura_id, sensor_id, vehiculo_id, timestamp, temperatura, latitud, longitud,
+             altitud, estado, alerta_activa, tiempo_fuera_rango, cadena_rota) in filas:
+            tipo_alimento = self.sensores.get(sensor_id, (vehiculo_id, None))[1]
+
+            if estado != "normal" or cadena_rota:
+                self.publicar("cadena_rota" if cadena_rota else estado, {
+                    "id": lectura_id,
+                    "sensorId": sensor_id,
+                    "vehiculoId": vehiculo_id,
+                    "tipoAlimento": tipo_alimento,
+                    "timestamp": timestamp.isoformat(),
+                    "temperatura": temperatura,
+                    "latitud": latitud,
+                    "longitud": longitud,
+                    "estado": estado,
+                    "tiempoFueraRango": tiempo_fuera_rango,
+                    "cadenRota": cadena_rota
+                })
+
+            # Las lecturas atrasadas no cambian el estado actual del sensor
+            actual = self.estados.get(sensor_id)
+            if actual is not None and timestamp < actual[0]:
+                continue
+            anterior = self.estado_vehiculo(vehiculo_id)
+            self.estados[sensor_id] = (timestamp, "cadena_rota" if cadena_rota else estado)
+            self.por_vehiculo[vehiculo_id].add(sensor_id)
+            nuevo = self.estado_vehiculo(vehiculo_id)
+            if nuevo != anterior:
+                self.publicar("estado_vehiculo", {
+                    "vehiculoId": vehiculo_id,
+                    "timestamp": timestamp.isoformat(),
+                    "estado_anterior": anterior,
+                    "estado_general": nuevo
+                })
+
+    async def eventos(self, vehiculo_id=None, sensor_id=None, tipo_alimento=None):
+        """
+        Genera el flujo SSE de una suscripción hasta que el cliente se desconecta. La
+        suscripción se crea dentro del generador: si el cliente se va antes de la primera
+        iteración no queda ninguna registrada ocupando plaza.
+        """
+        suscripcion = self.suscribir(vehiculo_id, sensor_id, tipo_alimento)
+        if suscripcion is None:
+            # Se llenó entre la comprobación del endpoint y el inicio del flujo
+            yield f"event: error\ndata: {json.dumps({'error': 'Demasiados suscriptores conectados'})}\n\n"
+            return
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    mensaje = await asyncio.wait_for(suscripcion.cola.get(), HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if suscripcion.perdidos:
+                    perdidos, suscripcion.perdidos = suscripcion.perdidos, 0
+                    yield f"event: perdidos\ndata: {json.dumps({'perdidos': perdidos})}\n\n"
+                yield mensaje
+        finally:
+            self.cancelar(suscripcion)
+
+    def stats(self):
+        return {
+            "suscriptores": self.total_suscriptores,
+            "eventos_publicados": self.publicados,
+            "cola_max": COLA_MAX
+        }
+
+
+difusor = DifusorAlertas()
@@ -0,0 +1,93 @@
+"""
+Benchmark del coste de serialización por lectura en los endpoints de lecturas.
+
+Compara el camino anterior (NUMERIC como Decimal, dict con float(), jsonable_encoder
+y JSONResponse) con el actual (NUMERIC como float, serializacion.lectura y
+RespuestaJSON). No necesita base de datos.
+
+    python bench_serializacion.py [filas] [repeticiones]
+"""
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+import serializacion
+
+
+def generar_filas(n, numerico):
+    inicio = datetime(2025, 11, 22, 8, 0, 0)
+    filas = []
+    for i in range(n):
+        filas.append({
+            'id': f'LECT{i:07d}',
+            'sensor_id': f'SENS{i % 50:03d}',
+            'ubicacion_id': f'VEH{i % 10:03d}',
+            'timestamp': inicio + timedelta(minutes=5 * i),
+            'temperatura': numerico(f'{-19.5 + (i % 40) / 10:.2f}'),
+            'latitud': numerico(f'{37.3886 + i / 1e5:.7f}'),
+            'longitud': numerico(f'{-5.9845 - i / 1e5:.7f}'),
+            'altitud': numerico('12.00'),
+            'estado': 'normal',
+            'alerta_activa': False,
+            'tiempo_fuera_rango': 0,
+            'cadena_rota': False,
+            'created_at': inicio
+        })
+    return filas
+
+
+def antes(filas):
+    data = []
+    for l in filas:
+        data.append({
+            "id": l['id'],
+            "sensorId": l['sensor_id'],
+            "ubicacionId": l['ubicacion_id'],
+            "timestamp": l['timestamp'].isoformat(),
+            "temperatura": float(l['temperatura']),
+            "gps": {
+                "latitud": float(l['latitud']),
+                "longitud": float(l['longitud']),
+                "altitud": float(l['altitud']) if l['altitud'] else None
+            },
+            "estado": l['estado'],
+            "alertaActiva": l['alerta_activa'],
+            "tiempoFueraRango": l['tiempo_fuera_rango'],
+            "cadenRota": l['cadena_rota']
+        })
+    return JSONResponse(jsonable_encoder({"total": len(data), "data": data})).body
+
+
+def despues(filas):
+    data = [serializacion.lectura(l) for l in filas]
+    return serializacion.RespuestaJSON({"total": len(data), "data": data}).body
+
+
+def medir(funcion, filas, repeticiones):
+    mejor = float('inf')
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        cuerpo = funcion(filas)
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor / len(filas) * 1e6, len(cuerpo)
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    repeticiones = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    us_antes, bytes_antes = medir(antes, generar_filas(n, Decimal), repeticiones)
+    us_despues, bytes_despues = medir(despues, generar_filas(n, float), repeticiones)
+
+    print(json.dumps({
+        "filas": n,
+        "orjson": serializacion.orjson is not None,
+        "antes_us_por_fila": round(us_antes, 3),
+        "despues_us_por_fila": round(us_despues, 3),
+        "mejora": round(us_antes / us_despues, 2),
+        "bytes_antes": bytes_antes,
+        "bytes_despues": bytes_despues
+    }, indent=2))
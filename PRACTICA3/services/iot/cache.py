@@ -0,0 +1,77 @@
+"""Caché en memoria con TTL y single-flight para respuestas calculadas"""
+import asyncio
+import os
+import time
+
+# TTL por defecto: 5 segundos
+CACHE_TTL = float(os.getenv('CACHE_TTL', '5'))
+
+
+class TTLCache:
+    """
+    Guarda valores durante `ttl` segundos. Si varias peticiones piden la misma
+    clave caducada a la vez, solo una la recalcula y el resto espera su resultado.
+    """
+
+    def __init__(self, ttl=CACHE_TTL):
+        self.ttl = ttl
+        self.entradas = {}
+        self.en_curso = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get_or_set(self, clave, calcular):
+        entrada = self.entradas.get(clave)
+        if entrada and entrada[0] > time.monotonic():
+            self.hits += 1
+            return entrada[1]
+
+        self.misses += 1
+        futuro = self.en_curso.get(clave)
+        while futuro is not None:
+            try:
+                return await asyncio.shield(futuro)
+            except asyncio.CancelledError:
+                # Si se canceló quien calculaba (y no esta petición), se vuelve a intentar
+                if not futuro.cancelled():
+                    raise
+            futuro = self.en_curso.get(clave)
+
+        futuro = asyncio.get_running_loop().create_future()
+        self.en_curso[clave] = futuro
+        try:
+            valor = await calcular()
+        except Exception as e:
+            futuro.set_exception(e)
+            # Evita el aviso de excepción no recuperada si nadie más esperaba
+            futuro.exception()
+            raise
+        except BaseException:
+            # Cancelación (o salida) de quien calculaba: los que esperan no deben quedarse colgados
+            futuro.cancel()
+            raise
+        else:
+            self.entradas[clave] = (time.monotonic() + self.ttl, valor)
+            futuro.set_result(valor)
+            return valor
+        finally:
+            del self.en_curso[clave]
+
+    def delete(self, clave=None):
+        if clave is None:
+            self.entradas.clear()
+        else:
+            self.entradas.pop(clave, None)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "ttl_s": self.ttl,
+            "keys": len(self.entradas),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total * 100, 2) if total else 0
+        }
+
+
+cache = TTLCache()
@@ -0,0 +1,83 @@
+"""Registro de consultas: cada sentencia se declara una vez, con nombre y semántica de lectura o escritura"""
+import os
+
+# Sentencias preparadas que psycopg mantiene por conexión (descarta las menos usadas al superarlo)
+MAX_PREPARADAS = int(os.getenv('DB_MAX_PREPARADAS', '256'))
+# Variantes de consultas dinámicas (combinaciones de filtros) que se preparan; las demás se ejecutan sin preparar
+MAX_VARIANTES = int(os.getenv('DB_MAX_VARIANTES', '200'))
+
+
+class Consulta:
+    """
+    Sentencia del registro. Las de lectura se ejecutan en transacciones READ ONLY
+    y se reparten entre las réplicas salvo las marcadas `primario` (deben ver las
+    últimas escrituras); las escrituras van siempre al primario. Las preparadas se
+    preparan en cada conexión la primera vez que se usan.
+    """
+    __slots__ = ("nombre", "sql", "escritura", "preparar", "primario")
+
+    def __init__(self, nombre, sql, escritura=False, preparar=True, primario=False):
+        self.nombre = nombre
+        self.sql = sql
+        self.escritura = escritura
+        self.preparar = preparar
+        self.primario = primario
+
+    def __repr__(self):
+        return f"Consulta({self.nombre!r}, escritura={self.escritura})"
+
+
+_registro = {}
+_variantes = {}   # (plantilla, sql) -> Consulta
+
+
+def registrar(nombre, sql, escritura=False, primario=False, preparar=True):
+    """
+    Declara una sentencia fija; registrar dos veces el mismo nombre con otra sentencia
+    es un error. `preparar=False` para las que PostgreSQL no admite preparar (DDL, COPY).
+    """
+    existente = _registro.get(nombre)
+    if existente is not None:
+        if (existente.sql, existente.escritura, existente.primario, existente.preparar) != (sql, escritura, primario, preparar):
+            raise ValueError(f"La consulta '{nombre}' ya está registrada con otra sentencia")
+        return existente
+    consulta = Consulta(nombre, sql, escritura, preparar, primario)
+    _registro[nombre] = consulta
+    return consulta
+
+
+def variante(plantilla, sql, escritura=False):
+    """
+    Consulta construida a partir de filtros opcionales: cada combinación de filtros
+    es una sentencia distinta y se registra la primera vez como `plantilla#n`.
+    Superado MAX_VARIANTES, las nuevas combinaciones se ejecutan sin preparar.
+    """
+    clave = (plantilla, sql)
+    consulta = _variantes.get(clave)
+    if consulta is None:
+        if len(_variantes) >= MAX_VARIANTES:
+            return Consulta(plantilla, sql, escritura, preparar=False)
+        numero = sum(1 for p, _ in _variantes if p == plantilla) + 1
+        consulta = Consulta(f"{plantilla}#{numero}", sql, escritura)
+        _variantes[clave] = consulta
+    return consulta
+
+
+def obtener(consulta):
+    """Devuelve la consulta registrada con ese nombre (o la propia consulta)"""
+    if isinstance(consulta, Consulta):
+        return consulta
+    try:
+        return _registro[consulta]
+    except KeyError:
+        raise KeyError(f"Consulta no registrada: {consulta}")
+
+
+def resumen():
+    """Sentencias registradas (GET /pool/stats)"""
+    return {
+        "registradas": len(_registro),
+        "variantes": len(_variantes),
+        "max_variantes": MAX_VARIANTES,
+        "max_preparadas_por_conexion": MAX_PREPARADAS
+    }
@@ -1,78 +1,493 @@
-import psycopg2
-from psycopg2 import pool
-from psycopg2.extras import RealDictCursor
+import psycopg
+from psycopg.rows import dict_row
+from psycopg.types.numeric import FloatLoader
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+from contextlib import AsyncExitStack, asynccontextmanager
+import asyncio
+import itertools
 import os
+import time
 from dotenv import load_dotenv
+import consultas
+from metricas import PoolMetrics, registro
 
 load_dotenv()
 
-# Pool de conexiones
+# Configuración del pool (variables de entorno)
+POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN', '1'))
+POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX', '20'))
+POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '5'))
+POOL_MAX_IDLE = float(os.getenv('DB_POOL_MAX_IDLE', '300'))
+
+# Réplicas de lectura: "host[:puerto],host[:puerto]" (misma base, usuario y contraseña que el primario)
+REPLICAS = [r.strip() for r in os.getenv('DB_REPLICAS', '').split(',') if r.strip()]
+# round_robin o menos_cargada (menos conexiones en uso y en espera)
+ESTRATEGIA = os.getenv('DB_REPLICAS_ESTRATEGIA', 'round_robin')
+REPLICA_POOL_MAX = int(os.getenv('DB_REPLICA_POOL_MAX', str(POOL_MAX_SIZE)))
+# Espera máxima de conexión en una réplica antes de pasar a la siguiente
+REPLICA_TIMEOUT = float(os.getenv('DB_REPLICA_TIMEOUT', '1'))
+# Fallos de conexión seguidos que expulsan una réplica, y segundos que pasa fuera
+REPLICA_FALLOS = int(os.getenv('DB_REPLICA_FALLOS', '3'))
+REPLICA_EXPULSION = float(os.getenv('DB_REPLICA_EXPULSION', '30'))
+# Comprobaciones correctas seguidas para readmitir una réplica (además de cumplir la expulsión)
+REPLICA_CHEQUEOS_OK = int(os.getenv('DB_REPLICA_CHEQUEOS_OK', '2'))
+# Cada cuántos segundos se comprueban las réplicas y retraso máximo tolerado (0 = sin límite)
+REPLICA_CHEQUEO = float(os.getenv('DB_REPLICA_CHEQUEO', '5'))
+REPLICA_MAX_RETRASO = float(os.getenv('DB_REPLICA_MAX_RETRASO', '0'))
+
+SQL_CHEQUEO_REPLICA = consultas.registrar("chequeo_replica", """
+    SELECT
+        pg_is_in_recovery() AS en_recuperacion,
+        COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)::float AS retraso
+""")
+
+
+# SQLSTATE de errores de conexión: clase 08 y caídas o arranque del servidor
+_SQLSTATE_CONEXION = ('57P01', '57P02', '57P03')
+
+
+def fallo_de_conexion(error):
+    """
+    True si el error es de la conexión con el servidor (no se pudo conectar o se perdió).
+    Los errores de la sentencia (QueryCanceled, conflictos de recuperación...) y la falta
+    de conexiones libres en el pool (PoolTimeout) no dicen nada de la salud del nodo.
+    """
+    if isinstance(error, PoolTimeout) or not isinstance(error, psycopg.OperationalError):
+        return False
+    sqlstate = error.sqlstate
+    return sqlstate is None or sqlstate.startswith('08') or sqlstate in _SQLSTATE_CONEXION
+
+
+def _conninfo(host=None, port=None):
+    return psycopg.conninfo.make_conninfo(
+        host=host or os.getenv('DB_HOST', 'localhost'),
+        port=port or os.getenv('DB_PORT', '5432'),
+        dbname=os.getenv('DB_NAME', 'freshgo'),
+        user=os.getenv('DB_USER', 'postgres'),
+        password=os.getenv('DB_PASSWORD')
+    )
+
+async def _configurar_conexion(conn):
+    # NUMERIC se carga como float: las filas llegan listas para serializar, sin Decimal
+    conn.adapters.register_loader("numeric", FloatLoader)
+    # Las consultas del registro se preparan explícitamente; caben todas en la caché de la conexión
+    conn.prepared_max = consultas.MAX_PREPARADAS
+
+
+class Nodo:
+    """Servidor PostgreSQL (primario o réplica) con su pool y sus contadores"""
+
+    def __init__(self, nombre, conninfo, max_size, timeout):
+        self.nombre = nombre
+        self.conninfo = conninfo
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pool = None
+        self.metrics = PoolMetrics()
+        self.lecturas = 0
+        self.fallos = 0
+        self.chequeos_ok = 0
+        self.expulsiones = 0
+        self.expulsado_hasta = 0.0
+        self.motivo = None
+        self.retraso = None
+
+    @property
+    def disponible(self):
+        # Una réplica expulsada solo vuelve por la comprobación periódica (chequeo_ok)
+        return self.motivo is None
+
+    def carga(self):
+        return self.metrics.in_use + self.metrics.waiting
+
+    async def abrir(self, esperar=True):
+        pool = AsyncConnectionPool(
+            self.conninfo,
+            min_size=POOL_MIN_SIZE,
+            max_size=self.max_size,
+            timeout=self.timeout,
+            max_idle=POOL_MAX_IDLE,
+            # Verifica las conexiones inactivas antes de entregarlas
+            check=AsyncConnectionPool.check_connection,
+            kwargs={"row_factory": dict_row},
+            configure=_configurar_conexion,
+            open=False
+        )
+        await pool.open(wait=esperar)
+        self.pool = pool
+
+    async def cerrar(self):
+        if self.pool:
+            await self.pool.close()
+            self.pool = None
+
+    def expulsar(self, motivo):
+        if self.disponible:
+            self.expulsiones += 1
+            print(f"⚠️  Réplica {self.nombre} expulsada: {motivo}")
+        self.expulsado_hasta = time.monotonic() + REPLICA_EXPULSION
+        self.motivo = motivo
+        self.fallos = 0
+        self.chequeos_ok = 0
+
+    def chequeo_ok(self):
+        """
+        Comprobación periódica correcta. Una réplica expulsada vuelve cuando ha pasado
+        la expulsión y además ha respondido REPLICA_CHEQUEOS_OK comprobaciones seguidas.
+        """
+        self.chequeos_ok += 1
+        if self.motivo is None:
+            return
+        if self.chequeos_ok >= REPLICA_CHEQUEOS_OK and time.monotonic() >= self.expulsado_hasta:
+            print(f"✅ Réplica {self.nombre} readmitida")
+            self.motivo = None
+            self.fallos = 0
+
+    def fallo(self, error):
+        self.fallos += 1
+        if self.fallos >= REPLICA_FALLOS:
+            self.expulsar(str(error) or type(error).__name__)
+
+    def estado(self):
+        stats = self.metrics.snapshot()
+        del stats["acquire_ms_histogram"]
+        stats.update({
+            "nombre": self.nombre,
+            "disponible": self.disponible,
+            "motivo": self.motivo,
+            "lecturas": self.lecturas,
+            "expulsiones": self.expulsiones,
+            "retraso_s": self.retraso
+        })
+        if self.pool:
+            stats["pool"] = self.pool.get_stats()
+        return stats
+
+
+def _nodo_replica(direccion):
+    host, _, port = direccion.partition(':')
+    return Nodo(direccion, _conninfo(host, port or None), REPLICA_POOL_MAX, REPLICA_TIMEOUT)
+
+
+primario = Nodo("primario", _conninfo(), POOL_MAX_SIZE, POOL_TIMEOUT)
+replicas = [_nodo_replica(r) for r in REPLICAS]
+_turno = itertools.count()
+
+# Pool y contadores del primario (se abre una sola vez en el startup de FastAPI)
 connection_pool = None
+metrics = primario.metrics
 
-def init_pool():
+
+async def init_pool():
     global connection_pool
+    if connection_pool is not None:
+        return connection_pool
     try:
-        connection_pool = psycopg2.pool.SimpleConnectionPool(
-            1, 20,
-            host=os.getenv('DB_HOST', 'localhost'),
-            port=os.getenv('DB_PORT', '5432'),
-            database=os.getenv('DB_NAME', 'freshgo'),
-            user=os.getenv('DB_USER', 'postgres'),
-            password=os.getenv('DB_PASSWORD')
-        )
-        print("✅ Pool de conexiones PostgreSQL creado (IoT)")
+        await primario.abrir()
+        connection_pool = primario.pool
+        print(f"✅ Pool de conexiones PostgreSQL creado (IoT) [{POOL_MIN_SIZE}-{POOL_MAX_SIZE}]")
     except Exception as e:
         print(f"❌ Error creando pool de conexiones: {e}")
         raise
+    # Sin esperar a las conexiones mínimas: una réplica caída no impide arrancar
+    for replica in replicas:
+        await replica.abrir(esperar=False)
+    if replicas:
+        print(f"✅ {len(replicas)} réplica(s) de lectura ({ESTRATEGIA}): {', '.join(REPLICAS)}")
+    return connection_pool
 
-def get_connection():
+async def close_pool():
+    global connection_pool
+    for nodo in replicas + [primario]:
+        await nodo.cerrar()
+    connection_pool = None
+
+def get_pool():
     if connection_pool:
-        return connection_pool.getconn()
+        return connection_pool
     raise Exception("Pool de conexiones no inicializado")
 
-def return_connection(conn):
+def ruta_lectura():
+    """Réplicas disponibles en el orden en que se intentan, y el primario como último recurso"""
+    disponibles = [r for r in replicas if r.disponible and r.pool]
+    if len(disponibles) > 1:
+        if ESTRATEGIA == 'menos_cargada':
+            disponibles.sort(key=Nodo.carga)
+        else:
+            inicio = next(_turno) % len(disponibles)
+            disponibles = disponibles[inicio:] + disponibles[:inicio]
+    return disponibles + [primario]
+
+@asynccontextmanager
+async def get_connection(solo_lectura=False, nodo=None, aislamiento=None):
+    """
+    Obtiene una conexión del pool del nodo (el primario por defecto) registrando la
+    espera y abre una transacción (READ ONLY si `solo_lectura`, con el nivel de
+    aislamiento indicado o el del servidor); lanza PoolTimeout si se agota el timeout.
+    """
+    nodo = nodo or primario
+    pool = nodo.pool if nodo is not primario else get_pool()
+    metricas_nodo = nodo.metrics
+    inicio = time.perf_counter()
+    metricas_nodo.waiting += 1
+    try:
+        conn = await pool.getconn()
+    except Exception:
+        metricas_nodo.timeouts += 1
+        raise
+    finally:
+        metricas_nodo.waiting -= 1
+    metricas_nodo.observe_acquire((time.perf_counter() - inicio) * 1000)
+    metricas_nodo.in_use += 1
+    try:
+        # Sin ida y vuelta al servidor: solo cambia el BEGIN de la siguiente transacción
+        await conn.set_read_only(solo_lectura)
+        await conn.set_isolation_level(aislamiento)
+        async with conn.transaction():
+            yield conn
+    finally:
+        metricas_nodo.in_use -= 1
+        await pool.putconn(conn)
+
+def pool_stats():
+    """Estado del pool: configuración, contadores propios y estadísticas de psycopg_pool"""
+    stats = metrics.snapshot()
+    stats["config"] = {
+        "min_size": POOL_MIN_SIZE,
+        "max_size": POOL_MAX_SIZE,
+        "timeout_s": POOL_TIMEOUT,
+        "max_idle_s": POOL_MAX_IDLE
+    }
+    stats["consultas"] = consultas.resumen()
     if connection_pool:
-        connection_pool.putconn(conn)
+        stats["pool"] = connection_pool.get_stats()
+    if replicas:
+        stats["replicas"] = {
+            "estrategia": ESTRATEGIA,
+            "lecturas_primario": primario.lecturas,
+            "nodos": [r.estado() for r in replicas]
+        }
+    return stats
 
-def query(sql, params=None):
-    conn = None
+async def _ejecutar_conn(conn, sql, params, preparar, una_fila):
+    """Ejecuta una sentencia en una conexión ya abierta, con sus métricas por consulta"""
+    inicio = time.perf_counter()
     try:
-        conn = get_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute(sql, params or ())
-        
-        if sql.strip().upper().startswith('SELECT'):
-            result = cursor.fetchall()
-            cursor.close()
-            return result
-        else:
-            conn.commit()
-            cursor.close()
+        async with conn.cursor() as cursor:
+            await cursor.execute(sql, params or (), prepare=preparar)
+            if una_fila:
+                fila = await cursor.fetchone()
+                registro.observar_consulta(sql, time.perf_counter() - inicio, int(fila is not None))
+                return fila
+            # Solo las sentencias que devuelven filas tienen descripción
+            if cursor.description is not None:
+                filas = await cursor.fetchall()
+                registro.observar_consulta(sql, time.perf_counter() - inicio, len(filas))
+                return filas
+            registro.observar_consulta(sql, time.perf_counter() - inicio, max(cursor.rowcount, 0))
             return None
     except Exception as e:
-        if conn:
-            conn.rollback()
+        registro.observar_consulta(sql, time.perf_counter() - inicio, error=True)
         print(f"[DB Error] {e}")
         raise
-    finally:
-        if conn:
-            return_connection(conn)
 
-def query_one(sql, params=None):
-    conn = None
+async def _ejecutar_en(nodo, sql, params, solo_lectura, preparar, una_fila):
+    async with get_connection(solo_lectura, nodo) as conn:
+        return await _ejecutar_conn(conn, sql, params, preparar, una_fila)
+
+def _cambiar_de_nodo(nodo, error):
+    """
+    Decide si una lectura fallida en una réplica se reintenta en el siguiente nodo.
+    Sin conexión libre (PoolTimeout) la sentencia no llegó a ejecutarse: se pasa al
+    siguiente sin contarlo como fallo. Un error de conexión cuenta para expulsarla.
+    Cualquier otro error es de la sentencia y se devuelve tal cual.
+    """
+    if isinstance(error, PoolTimeout):
+        return True
+    if fallo_de_conexion(error):
+        nodo.fallo(error)
+        return True
+    return False
+
+async def _ejecutar(consulta, params, una_fila):
+    if consulta.escritura or consulta.primario:
+        return await _ejecutar_en(primario, consulta.sql, params, not consulta.escritura, consulta.preparar, una_fila)
+    # Lectura: se reparte entre las réplicas; si una falla por conexión se prueba la siguiente
+    for nodo in ruta_lectura():
+        try:
+            resultado = await _ejecutar_en(nodo, consulta.sql, params, True, consulta.preparar, una_fila)
+        except psycopg.OperationalError as e:
+            if nodo is primario or not _cambiar_de_nodo(nodo, e):
+                raise
+            continue
+        nodo.lecturas += 1
+        nodo.fallos = 0
+        return resultado
+
+async def ejecutar(consulta, params=None):
+    """Ejecuta una consulta del registro (o su nombre); devuelve las filas o None si no devuelve filas"""
+    return await _ejecutar(consultas.obtener(consulta), params, False)
+
+async def ejecutar_uno(consulta, params=None):
+    """Ejecuta una consulta del registro (o su nombre) y devuelve la primera fila"""
+    return await _ejecutar(consultas.obtener(consulta), params, True)
+
+async def query(sql, params=None):
+    """SQL suelto fuera del registro: en el primario, transacción de lectura/escritura y sin preparar"""
+    return await _ejecutar_en(primario, sql, params, False, False, False)
+
+async def query_one(sql, params=None):
+    return await _ejecutar_en(primario, sql, params, False, False, True)
+
+class Transaccion:
+    """Varias sentencias del registro en una misma transacción del primario (ver `transaccion`)"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    async def ejecutar(self, consulta, params=None):
+        consulta = consultas.obtener(consulta)
+        return await _ejecutar_conn(self.conn, consulta.sql, params, consulta.preparar, False)
+
+    async def copiar(self, consulta, filas):
+        """COPY ... FROM STDIN de las filas; devuelve cuántas se enviaron"""
+        consulta = consultas.obtener(consulta)
+        inicio = time.perf_counter()
+        enviadas = 0
+        try:
+            async with self.conn.cursor() as cursor:
+                async with cursor.copy(consulta.sql) as copy:
+                    for fila in filas:
+                        await copy.write_row(fila)
+                        enviadas += 1
+        except Exception as e:
+            registro.observar_consulta(consulta.sql, time.perf_counter() - inicio, enviadas, error=True)
+            print(f"[DB Error] {e}")
+            raise
+        registro.observar_consulta(consulta.sql, time.perf_counter() - inicio, enviadas)
+        return enviadas
+
+@asynccontextmanager
+async def transaccion():
+    """Transacción de escritura en el primario para sentencias que deben ir juntas (ingesta)"""
+    async with get_connection() as conn:
+        yield Transaccion(conn)
+
+async def _stream_conn(conn, sql, params, itersize):
+    inicio = time.perf_counter()
+    filas = 0
     try:
-        conn = get_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute(sql, params or ())
-        result = cursor.fetchone()
-        cursor.close()
-        return result
+        # Los cursores de servidor (DECLARE) no usan sentencias preparadas
+        async with conn.cursor(name="stream_cursor") as cursor:
+            cursor.itersize = itersize
+            await cursor.execute(sql, params or ())
+            async for fila in cursor:
+                filas += 1
+                yield fila
+        registro.observar_consulta(sql, time.perf_counter() - inicio, filas)
     except Exception as e:
+        registro.observar_consulta(sql, time.perf_counter() - inicio, filas, error=True)
         print(f"[DB Error] {e}")
         raise
+
+async def _stream_en(nodo, sql, params, solo_lectura, itersize):
+    async with get_connection(solo_lectura, nodo) as conn:
+        async for fila in _stream_conn(conn, sql, params, itersize):
+            yield fila
+
+async def stream(consulta, params=None, itersize=2000):
+    """Itera las filas de una consulta del registro con un cursor de servidor, por bloques de `itersize`"""
+    consulta = consultas.obtener(consulta)
+    en_primario = consulta.escritura or consulta.primario
+    for nodo in [primario] if en_primario else ruta_lectura():
+        filas = 0
+        try:
+            async for fila in _stream_en(nodo, consulta.sql, params, not consulta.escritura, itersize):
+                filas += 1
+                yield fila
+        except psycopg.OperationalError as e:
+            # Solo se cambia de nodo si aún no se ha entregado ninguna fila
+            if nodo is primario or filas or not _cambiar_de_nodo(nodo, e):
+                raise
+            continue
+        nodo.lecturas += 1
+        return
+
+class Instantanea:
+    """Lecturas del registro sobre una misma instantánea de un mismo nodo (ver `instantanea`)"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    async def ejecutar(self, consulta, params=None):
+        consulta = consultas.obtener(consulta)
+        return await _ejecutar_conn(self.conn, consulta.sql, params, consulta.preparar, False)
+
+    async def ejecutar_uno(self, consulta, params=None):
+        consulta = consultas.obtener(consulta)
+        return await _ejecutar_conn(self.conn, consulta.sql, params, consulta.preparar, True)
+
+    async def stream(self, consulta, params=None, itersize=2000):
+        consulta = consultas.obtener(consulta)
+        async for fila in _stream_conn(self.conn, consulta.sql, params, itersize):
+            yield fila
+
+@asynccontextmanager
+async def instantanea():
+    """
+    Transacción READ ONLY y REPEATABLE READ en un nodo de lectura (réplica disponible
+    o primario), para consultas que deben ver los mismos datos: p. ej. un COUNT y el
+    recorrido de las mismas filas. Solo cambia de nodo si falla al obtener la conexión.
+    """
+    async with AsyncExitStack() as pila:
+        for nodo in ruta_lectura():
+            try:
+                conn = await pila.enter_async_context(
+                    get_connection(True, nodo, psycopg.IsolationLevel.REPEATABLE_READ)
+                )
+            except psycopg.OperationalError as e:
+                if nodo is primario or not _cambiar_de_nodo(nodo, e):
+                    raise
+                continue
+            nodo.lecturas += 1
+            nodo.fallos = 0
+            break
+        yield Instantanea(conn)
+
+async def _chequear(replica):
+    """
+    Comprobación con una conexión propia, fuera del pool: un pool lleno por carga no
+    hace pasar por caída a una réplica sana.
+    """
+    conn = await asyncio.wait_for(
+        psycopg.AsyncConnection.connect(replica.conninfo, autocommit=True, row_factory=dict_row),
+        REPLICA_CHEQUEO
+    )
+    try:
+        await _configurar_conexion(conn)
+        return await _ejecutar_conn(conn, SQL_CHEQUEO_REPLICA.sql, None, False, True)
     finally:
-        if conn:
-            return_connection(conn)
+        await conn.close()
+
+async def comprobar_replicas():
+    """Expulsa las réplicas que no responden o van demasiado retrasadas y readmite las recuperadas"""
+    for replica in replicas:
+        try:
+            fila = await _chequear(replica)
+        except Exception as e:
+            replica.retraso = None
+            replica.expulsar(str(e) or type(e).__name__)
+            continue
+        replica.retraso = round(fila['retraso'], 3)
+        if REPLICA_MAX_RETRASO > 0 and fila['en_recuperacion'] and fila['retraso'] > REPLICA_MAX_RETRASO:
+            replica.expulsar(f"retraso de replicación {replica.retraso}s")
+        else:
+            replica.chequeo_ok()
 
-# Inicializar pool al importar
-init_pool()
\ No newline at end of file
+async def vigilar_replicas(intervalo=REPLICA_CHEQUEO):
+    while True:
+        await asyncio.sleep(intervalo)
+        try:
+            await comprobar_replicas()
+        except Exception as e:
+            print(f"❌ Error comprobando réplicas: {e}")
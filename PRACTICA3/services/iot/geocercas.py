@@ -0,0 +1,362 @@
+"""Índice espacial en memoria (rejilla) de las últimas posiciones y geocercas con eventos de entrada/salida"""
+import asyncio
+import math
+import os
+import uuid
+from collections import defaultdict
+from itertools import chain
+from psycopg.types.json import Jsonb
+import consultas
+import db
+import serializacion
+from alertas import difusor
+
+# Tamaño de la celda de la rejilla en grados (0.05° ≈ 5 km)
+GEO_CELDA = float(os.getenv('GEO_CELDA', '0.05'))
+# Cada cuántos segundos se resincronizan las posiciones y las geocercas con la BD
+GEO_SINCRONIZACION = float(os.getenv('GEO_SINCRONIZACION', '30'))
+# Geocercas cuya caja envolvente cubre más celdas que esto no se reparten por la
+# rejilla: se guardan aparte y se comprueban por caja envolvente
+GEO_MAX_CELDAS = int(os.getenv('GEO_MAX_CELDAS', '2500'))
+
+TIPOS_GEOCERCA = ('deposito', 'cliente', 'otro')
+# Longitudes máximas de las columnas de la tabla geocercas
+MAX_ID = 50
+MAX_NOMBRE = 255
+# Vértices máximos por polígono (cada comprobación recorre todos)
+MAX_PUNTOS = 1000
+
+SQL_POSICIONES = consultas.registrar("geo_posiciones", """
+    SELECT DISTINCT ON (ubicacion_id) *
+    FROM lecturas_ultimas
+    ORDER BY ubicacion_id, timestamp DESC
+""")
+
+SQL_GEOCERCAS = consultas.registrar("geo_geocercas", "SELECT id, nombre, tipo, poligono FROM geocercas")
+
+SQL_GUARDAR = consultas.registrar("geo_guardar", """
+    INSERT INTO geocercas (id, nombre, tipo, poligono)
+    VALUES (%s, %s, %s, %s)
+    ON CONFLICT (id) DO UPDATE SET
+        nombre = EXCLUDED.nombre, tipo = EXCLUDED.tipo, poligono = EXCLUDED.poligono
+""", escritura=True)
+
+SQL_ELIMINAR = consultas.registrar("geo_eliminar", "DELETE FROM geocercas WHERE id = %s", escritura=True)
+
+
+def parsear_bbox(texto):
+    """'minLon,minLat,maxLon,maxLat' -> tupla de floats"""
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(v) for v in texto.split(','))
+    except ValueError:
+        raise ValueError("bbox inválido. Use minLon,minLat,maxLon,maxLat")
+    if min_lon > max_lon or min_lat > max_lat:
+        raise ValueError("bbox inválido: el mínimo debe ser menor que el máximo")
+    return min_lon, min_lat, max_lon, max_lat
+
+
+class Geocerca:
+    """Polígono simple en (longitud, latitud) con su caja envolvente"""
+    __slots__ = ("id", "nombre", "tipo", "poligono", "bbox")
+
+    def __init__(self, id, nombre, tipo, poligono):
+        self.id = id
+        self.nombre = nombre
+        self.tipo = tipo
+        self.poligono = [(float(lon), float(lat)) for lon, lat in poligono]
+        lons = [p[0] for p in self.poligono]
+        lats = [p[1] for p in self.poligono]
+        self.bbox = (min(lons), min(lats), max(lons), max(lats))
+
+    @classmethod
+    def desde_json(cls, datos):
+        """Valida el cuerpo de POST /geocercas; lanza ValueError si no es correcto"""
+        if not isinstance(datos, dict):
+            raise ValueError("Se esperaba un objeto JSON")
+        geocerca_id = datos.get('id')
+        nombre = datos.get('nombre')
+        tipo = datos.get('tipo', 'otro')
+        poligono = datos.get('poligono')
+        if geocerca_id is not None and (
+                not isinstance(geocerca_id, str) or not geocerca_id.strip() or len(geocerca_id) > MAX_ID):
+            raise ValueError(f"'id' debe ser un texto de 1 a {MAX_ID} caracteres")
+        if not nombre or not isinstance(nombre, str):
+            raise ValueError("'nombre' es obligatorio")
+        if len(nombre) > MAX_NOMBRE:
+            raise ValueError(f"'nombre' admite como máximo {MAX_NOMBRE} caracteres")
+        if tipo not in TIPOS_GEOCERCA:
+            raise ValueError(f"'tipo' debe ser uno de {', '.join(TIPOS_GEOCERCA)}")
+        if not isinstance(poligono, list) or len(poligono) < 3:
+            raise ValueError("'poligono' debe ser una lista de al menos 3 puntos [longitud, latitud]")
+        if len(poligono) > MAX_PUNTOS:
+            raise ValueError(f"'poligono' admite como máximo {MAX_PUNTOS} puntos")
+        for punto in poligono:
+            if (not isinstance(punto, list) or len(punto) != 2 or
+                    not all(isinstance(v, (int, float)) for v in punto) or
+                    not (-180 <= punto[0] <= 180 and -90 <= punto[1] <= 90)):
+                raise ValueError(f"Punto inválido en 'poligono': {punto}")
+        return cls(geocerca_id or f"GEO-{uuid.uuid4().hex[:8]}", nombre, tipo, poligono)
+
+    def misma_definicion(self, otra):
+        return (self.nombre, self.tipo, self.poligono) == (otra.nombre, otra.tipo, otra.poligono)
+
+    def contiene(self, lon, lat):
+        min_lon, min_lat, max_lon, max_lat = self.bbox
+        if not (min_lon <= lon <= max_lon and min_lat <= lat <= max_lat):
+            return False
+        # Ray casting
+        dentro = False
+        anterior = self.poligono[-1]
+        for actual in self.poligono:
+            if (actual[1] > lat) != (anterior[1] > lat):
+                corte = (anterior[0] - actual[0]) * (lat - actual[1]) / (anterior[1] - actual[1]) + actual[0]
+                if lon < corte:
+                    dentro = not dentro
+            anterior = actual
+        return dentro
+
+    def a_json(self, vehiculos=0):
+        return {
+            "id": self.id,
+            "nombre": self.nombre,
+            "tipo": self.tipo,
+            "poligono": [list(p) for p in self.poligono],
+            "vehiculos_dentro": vehiculos
+        }
+
+
+class IndiceGeo:
+    """
+    Rejilla de celdas fijas: cada posición está en la celda de su punto y cada
+    geocerca en todas las celdas que toca su caja envolvente. Una consulta por bbox
+    solo recorre las celdas que cubre y una posición nueva solo se compara con las
+    geocercas de su celda. Las geocercas que cubrirían más de GEO_MAX_CELDAS celdas
+    van a un conjunto aparte que se comprueba con cada posición.
+
+    Las geocercas viven en la tabla geocercas y cada proceso las resincroniza en
+    vigilar(), así que una creada o borrada en otro worker se ve aquí como mucho
+    GEO_SINCRONIZACION segundos después.
+    """
+
+    def __init__(self, celda=GEO_CELDA, max_celdas=GEO_MAX_CELDAS):
+        self.celda = celda
+        self.max_celdas = max_celdas
+        self.posiciones = {}                    # ubicacion_id -> posición (serializacion.posicion)
+        self.timestamps = {}                    # ubicacion_id -> timestamp de la posición
+        self.celda_de = {}                      # ubicacion_id -> celda
+        self.celdas = defaultdict(set)          # celda -> ubicaciones
+        self.geocercas = {}
+        self.celdas_geocerca = defaultdict(set) # celda -> ids de geocerca
+        self.grandes = set()                    # geocercas demasiado grandes para la rejilla
+        self.cambios_geocercas = 0              # cambios locales, para no pisarlos al resincronizar
+        self.dentro = defaultdict(set)          # geocerca -> ubicaciones dentro
+        self.geocercas_de = defaultdict(set)    # ubicacion -> geocercas en las que está
+        self.cargado = False                    # hasta la primera carga completa el índice no es fiable
+
+    def _celda(self, lon, lat):
+        return math.floor(lon / self.celda), math.floor(lat / self.celda)
+
+    def _celdas_bbox(self, min_lon, min_lat, max_lon, max_lat):
+        x0, y0 = self._celda(min_lon, min_lat)
+        x1, y1 = self._celda(max_lon, max_lat)
+        return x0, y0, x1, y1
+
+    def _es_grande(self, geocerca):
+        x0, y0, x1, y1 = self._celdas_bbox(*geocerca.bbox)
+        return (x1 - x0 + 1) * (y1 - y0 + 1) > self.max_celdas
+
+    # ---------- posiciones ----------
+
+    def actualizar(self, fila):
+        """Registra la última posición de una ubicación; devuelve los eventos de geocerca"""
+        ubicacion_id = fila['ubicacion_id']
+        anterior_ts = self.timestamps.get(ubicacion_id)
+        if anterior_ts is not None and fila['timestamp'] < anterior_ts:
+            return []
+
+        posicion = serializacion.posicion(fila)
+        lon, lat = posicion['longitud'], posicion['latitud']
+        celda = self._celda(lon, lat)
+        anterior = self.celda_de.get(ubicacion_id)
+        if anterior != celda:
+            if anterior is not None:
+                self.celdas[anterior].discard(ubicacion_id)
+                if not self.celdas[anterior]:
+                    del self.celdas[anterior]
+            self.celdas[celda].add(ubicacion_id)
+            self.celda_de[ubicacion_id] = celda
+        self.posiciones[ubicacion_id] = posicion
+        self.timestamps[ubicacion_id] = fila['timestamp']
+
+        nuevas = {
+            g for g in chain(self.celdas_geocerca.get(celda, ()), self.grandes)
+            if self.geocercas[g].contiene(lon, lat)
+        }
+        previas = self.geocercas_de.get(ubicacion_id, set())
+        eventos = []
+        for geocerca_id in nuevas - previas:
+            self.dentro[geocerca_id].add(ubicacion_id)
+            eventos.append(("entrada_geocerca", geocerca_id))
+        for geocerca_id in previas - nuevas:
+            self.dentro[geocerca_id].discard(ubicacion_id)
+            eventos.append(("salida_geocerca", geocerca_id))
+        if nuevas:
+            self.geocercas_de[ubicacion_id] = nuevas
+        else:
+            self.geocercas_de.pop(ubicacion_id, None)
+
+        return [
+            (tipo, {
+                "vehiculoId": ubicacion_id,
+                "geocercaId": geocerca_id,
+                "geocerca": self.geocercas[geocerca_id].nombre,
+                "timestamp": posicion['timestamp'],
+                "latitud": lat,
+                "longitud": lon
+            })
+            for tipo, geocerca_id in eventos
+        ]
+
+    def actualizar_lote(self, filas):
+        """Actualiza varias posiciones y publica los eventos en /alertas/stream"""
+        for fila in filas:
+            for tipo, evento in self.actualizar(fila):
+                difusor.publicar(tipo, evento)
+
+    def en_bbox(self, min_lon, min_lat, max_lon, max_lat):
+        x0, y0, x1, y1 = self._celdas_bbox(min_lon, min_lat, max_lon, max_lat)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(self.celdas):
+            # La caja cubre más celdas de las ocupadas: se recorren solo las ocupadas
+            candidatas = (
+                u for (x, y), ubicaciones in self.celdas.items()
+                if x0 <= x <= x1 and y0 <= y <= y1 for u in ubicaciones
+            )
+        else:
+            candidatas = (
+                u for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)
+                for u in self.celdas.get((x, y), ())
+            )
+        resultado = []
+        for ubicacion_id in candidatas:
+            posicion = self.posiciones[ubicacion_id]
+            if min_lon <= posicion['longitud'] <= max_lon and min_lat <= posicion['latitud'] <= max_lat:
+                resultado.append(posicion)
+        return resultado
+
+    def todas(self):
+        return list(self.posiciones.values())
+
+    # ---------- geocercas ----------
+
+    def agregar_geocerca(self, geocerca):
+        """Indexa una geocerca y calcula qué ubicaciones están ya dentro (sin emitir eventos)"""
+        if geocerca.id in self.geocercas:
+            self.quitar_geocerca(geocerca.id)
+        self.geocercas[geocerca.id] = geocerca
+        if self._es_grande(geocerca):
+            self.grandes.add(geocerca.id)
+            candidatas = self.posiciones
+        else:
+            x0, y0, x1, y1 = self._celdas_bbox(*geocerca.bbox)
+            candidatas = []
+            for x in range(x0, x1 + 1):
+                for y in range(y0, y1 + 1):
+                    self.celdas_geocerca[(x, y)].add(geocerca.id)
+                    candidatas.extend(self.celdas.get((x, y), ()))
+        for ubicacion_id in candidatas:
+            posicion = self.posiciones[ubicacion_id]
+            if geocerca.contiene(posicion['longitud'], posicion['latitud']):
+                self.dentro[geocerca.id].add(ubicacion_id)
+                self.geocercas_de[ubicacion_id].add(geocerca.id)
+
+    def quitar_geocerca(self, geocerca_id):
+        geocerca = self.geocercas.pop(geocerca_id, None)
+        if geocerca is None:
+            return False
+        if geocerca_id in self.grandes:
+            self.grandes.discard(geocerca_id)
+        else:
+            x0, y0, x1, y1 = self._celdas_bbox(*geocerca.bbox)
+            for x in range(x0, x1 + 1):
+                for y in range(y0, y1 + 1):
+                    grupo = self.celdas_geocerca.get((x, y))
+                    if grupo is not None:
+                        grupo.discard(geocerca_id)
+                        if not grupo:
+                            del self.celdas_geocerca[(x, y)]
+        for ubicacion_id in self.dentro.pop(geocerca_id, ()):
+            grupo = self.geocercas_de.get(ubicacion_id)
+            if grupo is not None:
+                grupo.discard(geocerca_id)
+                if not grupo:
+                    del self.geocercas_de[ubicacion_id]
+        return True
+
+    def vehiculos_en(self, geocerca_id):
+        return [self.posiciones[u] for u in sorted(self.dentro.get(geocerca_id, ()))]
+
+    def listar_geocercas(self):
+        return [g.a_json(len(self.dentro.get(g.id, ()))) for g in self.geocercas.values()]
+
+    # ---------- persistencia ----------
+
+    async def cargar(self):
+        """
+        Carga las últimas posiciones y después las geocercas guardadas: así los
+        vehículos que ya estaban dentro no generan eventos de entrada al arrancar.
+        """
+        await self.sincronizar()
+        await self.sincronizar_geocercas()
+        self.cargado = True
+
+    async def sincronizar(self):
+        """Relee las posiciones de lecturas_ultimas (incluye escrituras de otros procesos)"""
+        self.actualizar_lote(await db.ejecutar(SQL_POSICIONES))
+
+    async def sincronizar_geocercas(self):
+        """
+        Relee la tabla geocercas: añade o reemplaza las que cambiaron y quita las
+        borradas (incluye cambios de otros procesos, sin emitir eventos)
+        """
+        cambios = self.cambios_geocercas
+        filas = await db.ejecutar(SQL_GEOCERCAS)
+        if cambios != self.cambios_geocercas:
+            # Un POST/DELETE local terminó durante la consulta: se aplica en la próxima
+            return
+        guardadas = {
+            fila['id']: Geocerca(fila['id'], fila['nombre'], fila['tipo'], fila['poligono'])
+            for fila in filas
+        }
+        for geocerca_id in [g for g in self.geocercas if g not in guardadas]:
+            self.quitar_geocerca(geocerca_id)
+        for geocerca_id, geocerca in guardadas.items():
+            actual = self.geocercas.get(geocerca_id)
+            if actual is None or not actual.misma_definicion(geocerca):
+                self.agregar_geocerca(geocerca)
+
+    async def guardar_geocerca(self, geocerca):
+        await db.ejecutar(SQL_GUARDAR, [geocerca.id, geocerca.nombre, geocerca.tipo, Jsonb([list(p) for p in geocerca.poligono])])
+        self.cambios_geocercas += 1
+        self.agregar_geocerca(geocerca)
+
+    async def eliminar_geocerca(self, geocerca_id):
+        await db.ejecutar(SQL_ELIMINAR, [geocerca_id])
+        self.cambios_geocercas += 1
+        return self.quitar_geocerca(geocerca_id)
+
+    async def vigilar(self, intervalo=GEO_SINCRONIZACION):
+        """Resincroniza posiciones y geocercas; si la carga inicial falló, la reintenta"""
+        while True:
+            await asyncio.sleep(intervalo)
+            try:
+                if self.cargado:
+                    await self.sincronizar()
+                    await self.sincronizar_geocercas()
+                else:
+                    await self.cargar()
+                    print("✅ Índice de geocercas cargado")
+            except Exception as e:
+                print(f"❌ Error sincronizando posiciones y geocercas: {e}")
+
+
+geo = IndiceGeo()
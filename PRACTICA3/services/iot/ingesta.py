@@ -0,0 +1,202 @@
+"""Ingesta masiva de lecturas: parseo, validación con JSON Schema y escritura con COPY"""
+import json
+import os
+from datetime import timezone
+from pathlib import Path
+from dateutil import parser as date_parser
+from jsonschema import Draft7Validator
+import consultas
+import db
+import particiones
+from reglas import motor
+
+SCHEMAS_DIR = Path(os.getenv('SCHEMAS_DIR', Path(__file__).resolve().parents[3] / 'schemas'))
+MAX_LOTE = int(os.getenv('INGESTA_MAX_LOTE', '10000'))
+
+# Validador compilado una sola vez al importar. El estado lo calcula el motor de
+# reglas, así que en la ingesta no es obligatorio.
+with open(SCHEMAS_DIR / 'lectura.schema.json', encoding='utf-8-sig') as f:
+    _schema = json.load(f)
+_schema['required'] = [c for c in _schema['required'] if c != 'estado']
+lectura_validator = Draft7Validator(_schema)
+
+COLUMNAS = (
+    'id', 'sensor_id', 'ubicacion_id', 'timestamp', 'temperatura', 'latitud', 'longitud',
+    'altitud', 'estado', 'alerta_activa', 'tiempo_fuera_rango', 'cadena_rota'
+)
+
+
+class LoteInvalidoError(Exception):
+    """El cuerpo de la petición no es un array JSON ni NDJSON válido"""
+
+
+def parsear_cuerpo(cuerpo, content_type=''):
+    """Devuelve la lista de lecturas de un cuerpo JSON (array) o NDJSON"""
+    texto = cuerpo.decode('utf-8-sig').strip()
+    if not texto:
+        return []
+
+    if 'ndjson' not in content_type and texto.startswith('['):
+        try:
+            lecturas = json.loads(texto)
+        except ValueError as e:
+            raise LoteInvalidoError(f"JSON inválido: {e}")
+        if not isinstance(lecturas, list):
+            raise LoteInvalidoError("Se esperaba un array de lecturas")
+        return lecturas
+
+    lecturas = []
+    for n, linea in enumerate(texto.splitlines(), start=1):
+        if not linea.strip():
+            continue
+        try:
+            lecturas.append(json.loads(linea))
+        except ValueError as e:
+            raise LoteInvalidoError(f"NDJSON inválido en la línea {n}: {e}")
+    return lecturas
+
+
+def _a_utc(valor):
+    ts = date_parser.isoparse(valor)
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def validar_lote(lecturas):
+    """Valida cada lectura contra el schema; devuelve (filas para COPY, índice de cada fila, rechazos)"""
+    filas = []
+    indices = []
+    rechazos = []
+
+    for indice, lectura in enumerate(lecturas):
+        errores = [e.message for e in lectura_validator.iter_errors(lectura)]
+        if not errores:
+            try:
+                ts = _a_utc(lectura['timestamp'])
+            except (ValueError, OverflowError):
+                errores = ["timestamp no es una fecha ISO 8601 válida"]
+
+        if errores:
+            rechazos.append({
+                "indice": indice,
+                "id": lectura.get('id') if isinstance(lectura, dict) else None,
+                "errores": errores
+            })
+            continue
+
+        gps = lectura['gps']
+        indices.append(indice)
+        filas.append((
+            lectura['id'],
+            lectura['sensorId'],
+            lectura['ubicacionId'],
+            ts,
+            lectura['temperatura'],
+            gps['latitud'],
+            gps['longitud'],
+            gps.get('altitud'),
+            None, None, None, None
+        ))
+
+    return filas, indices, rechazos
+
+
+def evaluar_lote(filas, indices):
+    """
+    Calcula estado, alerta, tiempo fuera de rango y cadena rota con el motor de reglas,
+    procesando en orden temporal. Devuelve (filas, índices, rechazos, estados), donde
+    `estados` asocia el índice de cada lectura que hace avanzar a su sensor con el par
+    (sensor_id, EstadoSensor) que hay que confirmar si llega a insertarse.
+    """
+    evaluadas = []
+    evaluadas_indices = []
+    rechazos = []
+    pendientes = {}
+    estados = {}
+
+    for indice, fila in sorted(zip(indices, filas), key=lambda par: par[1][3]):
+        sensor_id = fila[1]
+        if not motor.conoce(sensor_id):
+            rechazos.append({"indice": indice, "id": fila[0], "errores": [f"Sensor {sensor_id} no existe"]})
+            continue
+        anterior = pendientes.get(sensor_id)
+        evaluacion = motor.evaluar(sensor_id, fila[3], float(fila[4]), pendientes)
+        nuevo = pendientes.get(sensor_id)
+        if nuevo is not anterior:
+            estados[indice] = (sensor_id, nuevo)
+        evaluadas.append(fila[:8] + evaluacion)
+        evaluadas_indices.append(indice)
+
+    return evaluadas, evaluadas_indices, rechazos, estados
+
+
+SQL_TABLA_LOTE = consultas.registrar("ingesta_tabla_lote", """
+    CREATE TEMP TABLE IF NOT EXISTS lecturas_lote
+    (LIKE lecturas INCLUDING DEFAULTS, indice INTEGER) ON COMMIT DELETE ROWS
+""", escritura=True, preparar=False)
+SQL_COPIAR_LOTE = consultas.registrar(
+    "ingesta_copiar_lote",
+    f"COPY lecturas_lote ({', '.join(COLUMNAS)}, indice) FROM STDIN",
+    escritura=True, preparar=False
+)
+SQL_INSERTAR_LOTE = consultas.registrar("ingesta_insertar_lote", f"""
+    INSERT INTO lecturas ({', '.join(COLUMNAS)})
+    SELECT {', '.join('t.' + c for c in COLUMNAS)}
+    FROM lecturas_lote t
+    JOIN sensores s ON s.id = t.sensor_id
+    ORDER BY t.indice
+    ON CONFLICT DO NOTHING
+    RETURNING id, timestamp
+""", escritura=True)
+SQL_SENSORES_DESCONOCIDOS = consultas.registrar("ingesta_sensores_desconocidos", """
+    SELECT DISTINCT t.sensor_id
+    FROM lecturas_lote t
+    LEFT JOIN sensores s ON s.id = t.sensor_id
+    WHERE s.id IS NULL
+""", escritura=True)
+
+
+async def insertar_lote(filas, indices):
+    """
+    Inserta las filas en una única transacción del primario: COPY a una tabla temporal
+    e INSERT ... SELECT hacia lecturas en el orden del lote, descartando sensores
+    inexistentes. El trigger descartar_id_lectura_repetido descarta los ids ya usados
+    (también los repetidos dentro del lote: se queda la primera aparición) y ON CONFLICT
+    los que otro lote concurrente insertó en el mismo mes.
+    Devuelve ((id, timestamp) insertados, sensores desconocidos).
+    """
+    # Las particiones se crean fuera de la transacción del lote
+    await particiones.asegurar(fila[3] for fila in filas)
+    async with db.transaccion() as tx:
+        await tx.ejecutar(SQL_TABLA_LOTE)
+        await tx.copiar(SQL_COPIAR_LOTE, (fila + (indice,) for indice, fila in zip(indices, filas)))
+        insertados = {(fila['id'], fila['timestamp']) for fila in await tx.ejecutar(SQL_INSERTAR_LOTE)}
+        desconocidos = {fila['sensor_id'] for fila in await tx.ejecutar(SQL_SENSORES_DESCONOCIDOS)}
+
+    return insertados, desconocidos
+
+
+def conciliar(filas, indices, insertados, desconocidos):
+    """
+    Reparte las filas del lote entre insertadas y rechazadas a partir de los pares
+    (id, timestamp) que devolvió la inserción. De un id repetido en el lote solo
+    cuenta como insertada la primera aparición, como en la inserción.
+    Devuelve (filas insertadas en el orden de `filas`, rechazos).
+    """
+    vistos = set()
+    aceptadas = set()
+    rechazos = []
+    for indice, fila in sorted(zip(indices, filas), key=lambda par: par[0]):
+        lectura_id, sensor_id = fila[0], fila[1]
+        if sensor_id in desconocidos:
+            motivo = f"Sensor {sensor_id} no existe"
+        elif (lectura_id, fila[3]) not in insertados or lectura_id in vistos:
+            motivo = "Lectura con id duplicado"
+        else:
+            vistos.add(lectura_id)
+            aceptadas.add(indice)
+            continue
+        rechazos.append({"indice": indice, "id": lectura_id, "errores": [motivo]})
+    nuevas = [fila for indice, fila in zip(indices, filas) if indice in aceptadas]
+    return nuevas, rechazos
@@ -1,11 +1,27 @@
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from typing import Optional
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from dateutil import parser as date_parser
+import asyncio
+import csv
+import io
 import os
 from dotenv import load_dotenv
 import db
+from alertas import difusor
+from cache import cache
+import consultas
+from geocercas import Geocerca, geo, parsear_bbox
+import ingesta
+import metricas
+import paginacion
+import particiones
+from reglas import motor
+import rollups
+import serializacion
+import simplificacion
 
 load_dotenv()
 
@@ -24,16 +40,38 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Latencia por ruta (GET /metrics)
+app.add_middleware(metricas.MiddlewareMetricas)
+
 # Evento de startup para inicializar conexión a BD
 @app.on_event("startup")
 async def startup_event():
     try:
-        db.init_pool()
+        await db.init_pool()
+        await motor.cargar()
+        await difusor.cargar()
+        try:
+            await geo.cargar()
+        except Exception as e:
+            print(f"❌ Error cargando geocercas, se reintentará: {e}")
+        app.state.geo = asyncio.create_task(geo.vigilar())
+        if db.replicas:
+            app.state.replicas = asyncio.create_task(db.vigilar_replicas())
+        if os.getenv('PARTICIONES_MANTENIMIENTO', 'true').lower() == 'true':
+            app.state.particiones = asyncio.create_task(particiones.vigilar())
         print("✅ Conexión a PostgreSQL inicializada")
     except Exception as e:
         print(f"❌ Error al conectar con PostgreSQL: {e}")
         print("⚠️  El servicio continuará pero las consultas a BD fallarán")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    for nombre in ('particiones', 'geo', 'replicas'):
+        tarea = getattr(app.state, nombre, None)
+        if tarea:
+            tarea.cancel()
+    await db.close_pool()
+
 # ==================== SENSORES ====================
 
 @app.get("/sensores")
@@ -59,7 +97,7 @@ async def get_sensores(
         
         sql += " ORDER BY nombre"
         
-        sensores = db.query(sql, params if params else None)
+        sensores = await db.ejecutar(consultas.variante("sensores", sql), params if params else None)
         
         return {
             "total": len(sensores),
@@ -70,14 +108,13 @@ async def get_sensores(
         print(f"Error: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
+SQL_SENSOR = consultas.registrar("sensor", "SELECT * FROM sensores WHERE id = %s")
+
 @app.get("/sensores/{sensor_id}")
 async def get_sensor(sensor_id: str):
     """Obtener un sensor específico por ID"""
     try:
-        sensor = db.query_one(
-            "SELECT * FROM sensores WHERE id = %s",
-            (sensor_id,)
-        )
+        sensor = await db.ejecutar_uno(SQL_SENSOR, (sensor_id,))
         
         if not sensor:
             raise HTTPException(status_code=404, detail="Sensor no encontrado")
@@ -92,6 +129,61 @@ async def get_sensor(sensor_id: str):
 
 # ==================== LECTURAS ====================
 
+def filtrar_lecturas(sql, sensorId, ubicacionId, estado, cadenaRota, from_date, to_date):
+    """Añade a la consulta los filtros comunes de lecturas; devuelve (sql, params)"""
+    params = []
+    
+    if sensorId:
+        sql += " AND sensor_id = %s"
+        params.append(sensorId)
+    
+    if ubicacionId:
+        sql += " AND ubicacion_id = %s"
+        params.append(ubicacionId)
+    
+    if estado:
+        sql += " AND estado = %s"
+        params.append(estado)
+    
+    if cadenaRota is not None:
+        sql += " AND cadena_rota = %s"
+        params.append(cadenaRota)
+    
+    # Filtrar por fechas
+    if from_date:
+        try:
+            from_dt = date_parser.isoparse(from_date)
+            sql += " AND timestamp >= %s"
+            params.append(from_dt)
+        except ValueError:
+            raise HTTPException(
+                status_code=400,
+                detail="Formato de fecha 'from' inválido. Use ISO 8601"
+            )
+    
+    if to_date:
+        try:
+            to_dt = date_parser.isoparse(to_date)
+            sql += " AND timestamp <= %s"
+            params.append(to_dt)
+        except ValueError:
+            raise HTTPException(
+                status_code=400,
+                detail="Formato de fecha 'to' inválido. Use ISO 8601"
+            )
+    
+    # Validar que from < to
+    if from_date and to_date:
+        from_dt = date_parser.isoparse(from_date)
+        to_dt = date_parser.isoparse(to_date)
+        if from_dt > to_dt:
+            raise HTTPException(
+                status_code=400,
+                detail="La fecha 'from' debe ser anterior a 'to'"
+            )
+    
+    return sql, params
+
 @app.get("/lecturas")
 async def get_lecturas(
     sensorId: Optional[str] = None,
@@ -100,86 +192,27 @@ async def get_lecturas(
     cadenaRota: Optional[bool] = Query(None, description="Filtrar por rotura de cadena"),
     from_date: Optional[str] = Query(None, alias="from"),
     to_date: Optional[str] = Query(None, alias="to"),
-    limit: int = Query(100, ge=1, le=1000)
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente")
 ):
     """Obtener lecturas de temperatura con filtros"""
     try:
-        sql = "SELECT * FROM lecturas WHERE 1=1"
-        params = []
-        
-        if sensorId:
-            sql += " AND sensor_id = %s"
-            params.append(sensorId)
-        
-        if ubicacionId:
-            sql += " AND ubicacion_id = %s"
-            params.append(ubicacionId)
-        
-        if estado:
-            sql += " AND estado = %s"
-            params.append(estado)
-        
-        if cadenaRota is not None:
-            sql += " AND cadena_rota = %s"
-            params.append(cadenaRota)
-        
-        # Filtrar por fechas
-        if from_date:
-            try:
-                from_dt = date_parser.isoparse(from_date)
-                sql += " AND timestamp >= %s"
-                params.append(from_dt)
-            except ValueError:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Formato de fecha 'from' inválido. Use ISO 8601"
-                )
-        
-        if to_date:
-            try:
-                to_dt = date_parser.isoparse(to_date)
-                sql += " AND timestamp <= %s"
-                params.append(to_dt)
-            except ValueError:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Formato de fecha 'to' inválido. Use ISO 8601"
-                )
-        
-        # Validar que from < to
-        if from_date and to_date:
-            from_dt = date_parser.isoparse(from_date)
-            to_dt = date_parser.isoparse(to_date)
-            if from_dt > to_dt:
-                raise HTTPException(
-                    status_code=400,
-                    detail="La fecha 'from' debe ser anterior a 'to'"
-                )
+        sql, params = filtrar_lecturas(
+            "SELECT * FROM lecturas WHERE 1=1",
+            sensorId, ubicacionId, estado, cadenaRota, from_date, to_date
+        )
         
-        sql += " ORDER BY timestamp DESC LIMIT %s"
-        params.append(limit)
+        try:
+            sql = paginacion.aplicar_cursor(sql, params, cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        params.append(limit + 1)
         
-        lecturas = db.query(sql, params if params else None)
+        lecturas = await db.ejecutar(consultas.variante("lecturas", sql), params)
+        lecturas, next_cursor = paginacion.paginar(lecturas, limit)
         
         # Formatear respuesta
-        lecturas_formateadas = []
-        for l in lecturas:
-            lecturas_formateadas.append({
-                "id": l['id'],
-                "sensorId": l['sensor_id'],
-                "ubicacionId": l['ubicacion_id'],
-                "timestamp": l['timestamp'].isoformat() if l['timestamp'] else None,
-                "temperatura": float(l['temperatura']) if l['temperatura'] else None,
-                "gps": {
-                    "latitud": float(l['latitud']) if l['latitud'] else None,
-                    "longitud": float(l['longitud']) if l['longitud'] else None,
-                    "altitud": float(l['altitud']) if l['altitud'] else None
-                },
-                "estado": l['estado'],
-                "alertaActiva": l['alerta_activa'],
-                "tiempoFueraRango": l['tiempo_fuera_rango'],
-                "cadenRota": l['cadena_rota']
-            })
+        lecturas_formateadas = [serializacion.lectura(l) for l in lecturas]
         
         # Estadísticas
         total = len(lecturas_formateadas)
@@ -187,9 +220,10 @@ async def get_lecturas(
         criticas = len([l for l in lecturas_formateadas if l['estado'] == 'critico'])
         cadenas_rotas = len([l for l in lecturas_formateadas if l['cadenRota']])
         
-        return {
+        return serializacion.RespuestaJSON({
             "total": total,
             "limit": limit,
+            "next_cursor": next_cursor,
             "estadisticas": {
                 "alertas": alertas,
                 "criticas": criticas,
@@ -197,7 +231,7 @@ async def get_lecturas(
                 "porcentaje_normal": round((total - alertas) / total * 100, 2) if total > 0 else 0
             },
             "data": lecturas_formateadas
-        }
+        })
     
     except HTTPException:
         raise
@@ -206,71 +240,59 @@ async def get_lecturas(
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
 @app.get("/lecturas/alertas")
-async def get_alertas_activas():
+async def get_alertas_activas(
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente")
+):
     """Obtener solo las lecturas con alertas activas"""
     try:
-        lecturas = db.query("""
-            SELECT * FROM lecturas 
-            WHERE alerta_activa = true 
-            ORDER BY timestamp DESC
-        """)
-        
-        lecturas_formateadas = []
-        for l in lecturas:
-            lecturas_formateadas.append({
-                "id": l['id'],
-                "sensorId": l['sensor_id'],
-                "ubicacionId": l['ubicacion_id'],
-                "timestamp": l['timestamp'].isoformat(),
-                "temperatura": float(l['temperatura']),
-                "gps": {
-                    "latitud": float(l['latitud']),
-                    "longitud": float(l['longitud']),
-                    "altitud": float(l['altitud']) if l['altitud'] else None
-                },
-                "estado": l['estado'],
-                "alertaActiva": l['alerta_activa'],
-                "tiempoFueraRango": l['tiempo_fuera_rango'],
-                "cadenRota": l['cadena_rota']
-            })
+        params = []
+        try:
+            sql = paginacion.aplicar_cursor(
+                "SELECT * FROM lecturas WHERE alerta_activa = true", params, cursor
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        params.append(limit + 1)
         
-        return {
+        lecturas = await db.ejecutar(consultas.variante("lecturas_alertas", sql), params)
+        lecturas, next_cursor = paginacion.paginar(lecturas, limit)
+        
+        lecturas_formateadas = [serializacion.lectura(l) for l in lecturas]
+        
+        return serializacion.RespuestaJSON({
             "total": len(lecturas_formateadas),
+            "limit": limit,
+            "next_cursor": next_cursor,
             "data": lecturas_formateadas
-        }
+        })
     
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
 @app.get("/lecturas/cadena-rota")
-async def get_cadenas_rotas():
+async def get_cadenas_rotas(
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente")
+):
     """Obtener lecturas donde se ha detectado rotura de cadena"""
     try:
-        lecturas = db.query("""
-            SELECT * FROM lecturas 
-            WHERE cadena_rota = true 
-            ORDER BY timestamp DESC
-        """)
-        
-        lecturas_formateadas = []
-        for l in lecturas:
-            lecturas_formateadas.append({
-                "id": l['id'],
-                "sensorId": l['sensor_id'],
-                "ubicacionId": l['ubicacion_id'],
-                "timestamp": l['timestamp'].isoformat(),
-                "temperatura": float(l['temperatura']),
-                "gps": {
-                    "latitud": float(l['latitud']),
-                    "longitud": float(l['longitud']),
-                    "altitud": float(l['altitud']) if l['altitud'] else None
-                },
-                "estado": l['estado'],
-                "alertaActiva": l['alerta_activa'],
-                "tiempoFueraRango": l['tiempo_fuera_rango'],
-                "cadenRota": l['cadena_rota']
-            })
+        params = []
+        try:
+            sql = paginacion.aplicar_cursor(
+                "SELECT * FROM lecturas WHERE cadena_rota = true", params, cursor
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        params.append(limit + 1)
+        
+        lecturas = await db.ejecutar(consultas.variante("lecturas_cadena_rota", sql), params)
+        lecturas, next_cursor = paginacion.paginar(lecturas, limit)
+        
+        lecturas_formateadas = [serializacion.lectura(l) for l in lecturas]
         
         # Agrupar por sensor
         por_sensor = {}
@@ -280,49 +302,253 @@ async def get_cadenas_rotas():
                 por_sensor[sensor_id] = []
             por_sensor[sensor_id].append(lectura)
         
-        return {
+        return serializacion.RespuestaJSON({
             "total": len(lecturas_formateadas),
+            "limit": limit,
+            "next_cursor": next_cursor,
             "sensores_afectados": len(por_sensor),
             "por_sensor": por_sensor,
             "data": lecturas_formateadas
+        })
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error: {e}")
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+
+async def generar_export(consulta, params, formato, filas_por_bloque=500):
+    """Genera la exportación por bloques de texto sin materializar el resultado completo"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if formato == "csv" else None
+    if writer:
+        writer.writerow(serializacion.COLUMNAS_EXPORT)
+    
+    pendientes = 0
+    async for l in db.stream(consulta, params):
+        valores = serializacion.fila_export(l)
+        if writer:
+            writer.writerow(valores)
+        else:
+            buffer.write(serializacion.dumps(dict(zip(serializacion.COLUMNAS_EXPORT, valores))).decode("utf-8"))
+            buffer.write("\n")
+        pendientes += 1
+        if pendientes >= filas_por_bloque:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pendientes = 0
+    
+    if buffer.tell():
+        yield buffer.getvalue()
+
+@app.get("/lecturas/export")
+async def export_lecturas(
+    sensorId: Optional[str] = None,
+    ubicacionId: Optional[str] = None,
+    estado: Optional[str] = Query(None, description="normal, alerta, critico"),
+    cadenaRota: Optional[bool] = Query(None, description="Filtrar por rotura de cadena"),
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date: Optional[str] = Query(None, alias="to"),
+    formato: str = Query("ndjson", pattern="^(ndjson|csv)$", description="ndjson o csv")
+):
+    """Exportar lecturas en streaming (NDJSON o CSV) con los mismos filtros que /lecturas"""
+    sql, params = filtrar_lecturas(
+        "SELECT * FROM lecturas WHERE 1=1",
+        sensorId, ubicacionId, estado, cadenaRota, from_date, to_date
+    )
+    sql += " ORDER BY timestamp ASC, id ASC"
+    
+    media_type = "text/csv" if formato == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        generar_export(consultas.variante("lecturas_export", sql), params, formato),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="lecturas.{formato}"'}
+    )
+
+@app.post("/lecturas/batch")
+async def post_lecturas_batch(request: Request):
+    """Ingesta masiva de lecturas (array JSON o NDJSON) con rechazos por fila"""
+    try:
+        try:
+            lecturas = ingesta.parsear_cuerpo(
+                await request.body(),
+                request.headers.get("content-type", "")
+            )
+        except ingesta.LoteInvalidoError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        if len(lecturas) > ingesta.MAX_LOTE:
+            raise HTTPException(
+                status_code=413,
+                detail=f"El lote supera el máximo de {ingesta.MAX_LOTE} lecturas"
+            )
+        
+        filas, indices, rechazos = ingesta.validar_lote(lecturas)
+        
+        # Clasificación en el servidor con el motor de reglas de cadena de frío
+        sensor_ids = {fila[1] for fila in filas}
+        await motor.asegurar_sensores(sensor_ids)
+        
+        nuevas = []
+        # Un lote concurrente con los mismos sensores espera a que este confirme su estado
+        async with motor.bloquear(s for s in sensor_ids if motor.conoce(s)):
+            filas, indices, sin_sensor, estados = ingesta.evaluar_lote(filas, indices)
+            rechazos.extend(sin_sensor)
+            
+            if filas:
+                insertados, desconocidos = await ingesta.insertar_lote(filas, indices)
+                # Filas válidas que no llegaron a insertarse
+                nuevas, no_insertadas = ingesta.conciliar(filas, indices, insertados, desconocidos)
+                rechazos.extend(no_insertadas)
+                # Solo avanza el estado de los sensores con las lecturas escritas
+                descartadas = {r["indice"] for r in no_insertadas}
+                motor.confirmar(estado for indice, estado in estados.items() if indice not in descartadas)
+        
+        # Aviso en vivo a los suscriptores de /alertas/stream
+        await difusor.publicar_lote(nuevas)
+        geo.actualizar_lote(dict(zip(ingesta.COLUMNAS, fila)) for fila in nuevas)
+        
+        return {
+            "recibidas": len(lecturas),
+            "insertadas": len(nuevas),
+            "rechazadas": len(rechazos),
+            "rechazos": rechazos
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
 @app.get("/lecturas/estadisticas/{ubicacion_id}")
-async def get_estadisticas_ubicacion(ubicacion_id: str):
+async def get_estadisticas_ubicacion(
+    ubicacion_id: str,
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date: Optional[str] = Query(None, alias="to")
+):
     """Obtener estadísticas de temperatura de una ubicación específica"""
     try:
-        lecturas = db.query("""
-            SELECT * FROM lecturas 
+        # Sin rango: todo el histórico sale de los agregados diarios
+        if not from_date and not to_date:
+            stats = await db.ejecutar_uno(rollups.SQL_ESTADISTICAS_HISTORICO, [ubicacion_id])
+            return formatear_estadisticas(ubicacion_id, stats)
+        
+        # Agregación en PostgreSQL: una sola fila de resultado sea cual sea el histórico
+        sql = """
+            SELECT
+                COUNT(*) AS total_lecturas,
+                ROUND(AVG(temperatura), 2) AS temperatura_promedio,
+                MIN(temperatura) AS temperatura_minima,
+                MAX(temperatura) AS temperatura_maxima,
+                COUNT(*) FILTER (WHERE estado = 'normal') AS lecturas_normales,
+                COUNT(*) FILTER (WHERE estado = 'alerta') AS lecturas_alerta,
+                COUNT(*) FILTER (WHERE estado = 'critico') AS lecturas_criticas,
+                COALESCE(BOOL_OR(cadena_rota), false) AS cadena_rota,
+                MAX(tiempo_fuera_rango) AS tiempo_max_fuera_rango
+            FROM lecturas
             WHERE ubicacion_id = %s
-            ORDER BY timestamp DESC
-        """, (ubicacion_id,))
+        """
+        params = [ubicacion_id]
         
-        if not lecturas:
+        if from_date:
+            try:
+                from_dt = date_parser.isoparse(from_date)
+                sql += " AND timestamp >= %s"
+                params.append(from_dt)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Formato de fecha 'from' inválido")
+        
+        if to_date:
+            try:
+                to_dt = date_parser.isoparse(to_date)
+                sql += " AND timestamp <= %s"
+                params.append(to_dt)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Formato de fecha 'to' inválido")
+        
+        stats = await db.ejecutar_uno(consultas.variante("estadisticas", sql), params)
+        return formatear_estadisticas(ubicacion_id, stats)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error: {e}")
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+
+def formatear_estadisticas(ubicacion_id, stats):
+    if not stats or stats['total_lecturas'] == 0:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No hay lecturas para la ubicación {ubicacion_id}"
+        )
+    
+    return {
+        "ubicacionId": ubicacion_id,
+        "total_lecturas": int(stats['total_lecturas']),
+        "temperatura_promedio": float(stats['temperatura_promedio']),
+        "temperatura_minima": float(stats['temperatura_minima']),
+        "temperatura_maxima": float(stats['temperatura_maxima']),
+        "lecturas_normales": int(stats['lecturas_normales']),
+        "lecturas_alerta": int(stats['lecturas_alerta']),
+        "lecturas_criticas": int(stats['lecturas_criticas']),
+        "cadena_rota": stats['cadena_rota'],
+        "tiempo_max_fuera_rango": stats['tiempo_max_fuera_rango']
+    }
+
+@app.get("/lecturas/series")
+async def get_series_lecturas(
+    sensorId: Optional[str] = None,
+    ubicacionId: Optional[str] = None,
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date: Optional[str] = Query(None, alias="to"),
+    bucket: Optional[str] = Query(None, description="Tamaño del bucket: <n>m, <n>h o <n>d"),
+    max_points: int = Query(500, ge=1, le=5000)
+):
+    """Serie temporal agregada de un sensor o una ubicación a partir de los agregados"""
+    try:
+        if bool(sensorId) == bool(ubicacionId):
+            raise HTTPException(status_code=400, detail="Indique 'sensorId' o 'ubicacionId' (solo uno)")
+        
+        try:
+            to_dt = date_parser.isoparse(to_date) if to_date else datetime.now(timezone.utc)
+            from_dt = date_parser.isoparse(from_date) if from_date else to_dt - timedelta(hours=24)
+            # Fechas sin zona horaria: se interpretan en UTC
+            to_dt, from_dt = (d if d.tzinfo else d.replace(tzinfo=timezone.utc) for d in (to_dt, from_dt))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Formato de fecha inválido. Use ISO 8601")
+        
+        ventana = (to_dt - from_dt).total_seconds()
+        if ventana <= 0:
+            raise HTTPException(status_code=400, detail="'from' debe ser anterior a 'to'")
+        
+        try:
+            bucket_segundos = rollups.parsear_bucket(bucket) if bucket else rollups.elegir_bucket(ventana, max_points)
+            granularidad = rollups.elegir_granularidad(bucket_segundos)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        if ventana / bucket_segundos > max_points:
             raise HTTPException(
-                status_code=404,
-                detail=f"No hay lecturas para la ubicación {ubicacion_id}"
+                status_code=400,
+                detail=f"La ventana con bucket {rollups.formatear_bucket(bucket_segundos)} supera {max_points} puntos"
             )
         
-        temperaturas = [float(l['temperatura']) for l in lecturas]
+        ambito, clave = ('sensor', sensorId) if sensorId else ('ubicacion', ubicacionId)
+        consulta, intervalo = rollups.consulta_serie(ambito, bucket_segundos)
+        filas = await db.ejecutar(consulta, [intervalo, clave, granularidad, granularidad, from_dt, to_dt])
+        puntos = [rollups.punto_serie(f) for f in filas]
         
-        estadisticas = {
-            "ubicacionId": ubicacion_id,
-            "total_lecturas": len(lecturas),
-            "temperatura_promedio": round(sum(temperaturas) / len(temperaturas), 2),
-            "temperatura_minima": min(temperaturas),
-            "temperatura_maxima": max(temperaturas),
-            "lecturas_normales": len([l for l in lecturas if l['estado'] == 'normal']),
-            "lecturas_alerta": len([l for l in lecturas if l['estado'] == 'alerta']),
-            "lecturas_criticas": len([l for l in lecturas if l['estado'] == 'critico']),
-            "cadena_rota": any([l['cadena_rota'] for l in lecturas]),
-            "tiempo_max_fuera_rango": max([l['tiempo_fuera_rango'] for l in lecturas])
+        return {
+            "sensorId" if sensorId else "ubicacionId": clave,
+            "from": from_dt.isoformat(),
+            "to": to_dt.isoformat(),
+            "bucket": rollups.formatear_bucket(bucket_segundos),
+            "granularidad": granularidad,
+            "total_puntos": len(puntos),
+            "puntos": puntos
         }
-        
-        return estadisticas
     
     except HTTPException:
         raise
@@ -332,25 +558,138 @@ async def get_estadisticas_ubicacion(ubicacion_id: str):
 
 # ==================== VEHÍCULOS ====================
 
+SQL_VEHICULOS = consultas.registrar("vehiculos", "SELECT * FROM vehiculos ORDER BY matricula")
+
 @app.get("/vehiculos")
 async def get_vehiculos():
     """Obtener listado de vehículos"""
     try:
-        vehiculos = db.query("SELECT * FROM vehiculos ORDER BY matricula")
+        vehiculos = await db.ejecutar(SQL_VEHICULOS)
         return {"data": [dict(v) for v in vehiculos]}
     
     except Exception as e:
         print(f"Error: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
+# Última lectura de cada sensor activo en una sola consulta (tabla lecturas_ultimas)
+SQL_ESTADO_CADENA = """
+    SELECT
+        v.id AS vehiculo_id,
+        v.matricula,
+        s.id AS sensor_id,
+        s.nombre,
+        s.tipo_alimento,
+        s.rango_min,
+        s.rango_max,
+        l.temperatura,
+        l.estado,
+        l.alerta_activa,
+        l.tiempo_fuera_rango,
+        l.cadena_rota,
+        l.timestamp
+    FROM vehiculos v
+    LEFT JOIN sensores s ON s.ubicacion_id = v.id AND s.activo = true
+    LEFT JOIN lecturas_ultimas l ON l.sensor_id = s.id
+"""
+
+SQL_ESTADO_CADENA_FLOTA = consultas.registrar(
+    "estado_cadena_flota", SQL_ESTADO_CADENA + " ORDER BY v.matricula, s.id"
+)
+SQL_ESTADO_CADENA_IDS = consultas.registrar(
+    "estado_cadena_ids", SQL_ESTADO_CADENA + " WHERE v.id = ANY(%s) ORDER BY v.matricula, s.id"
+)
+SQL_ESTADO_CADENA_VEHICULO = consultas.registrar(
+    "estado_cadena_vehiculo", SQL_ESTADO_CADENA + " WHERE v.id = %s ORDER BY s.id"
+)
+
+def construir_estado_cadena(vehiculo_id, filas):
+    """Construye el estado de cadena de un vehículo a partir de sus filas (una por sensor)"""
+    matricula = filas[0]['matricula']
+    
+    if filas[0]['sensor_id'] is None:
+        return {
+            "vehiculoId": vehiculo_id,
+            "matricula": matricula,
+            "estado_general": "sin_sensores",
+            "zonas": []
+        }
+    
+    zonas = []
+    estado_general = "normal"
+    
+    for fila in filas:
+        if fila['timestamp'] is None:
+            continue
+        
+        zonas.append({
+            "sensorId": fila['sensor_id'],
+            "nombre": fila['nombre'],
+            "tipoAlimento": fila['tipo_alimento'],
+            "rangoOptimo": f"{fila['rango_min']:.2f}°C - {fila['rango_max']:.2f}°C",
+            "temperaturaActual": float(fila['temperatura']),
+            "estado": fila['estado'],
+            "alertaActiva": fila['alerta_activa'],
+            "tiempoFueraRango": fila['tiempo_fuera_rango'],
+            "cadenRota": fila['cadena_rota'],
+            "ultimaActualizacion": fila['timestamp'].isoformat()
+        })
+        
+        # Actualizar estado general
+        if fila['cadena_rota']:
+            estado_general = "cadena_rota"
+        elif fila['estado'] == 'critico' and estado_general != "cadena_rota":
+            estado_general = "critico"
+        elif fila['estado'] == 'alerta' and estado_general not in ["critico", "cadena_rota"]:
+            estado_general = "alerta"
+    
+    return {
+        "vehiculoId": vehiculo_id,
+        "matricula": matricula,
+        "estado_general": estado_general,
+        "total_zonas": len(zonas),
+        "zonas_normal": len([z for z in zonas if z['estado'] == 'normal']),
+        "zonas_alerta": len([z for z in zonas if z['estado'] == 'alerta']),
+        "zonas_criticas": len([z for z in zonas if z['estado'] == 'critico']),
+        "cadenas_rotas": len([z for z in zonas if z['cadenRota']]),
+        "zonas": zonas
+    }
+
+@app.get("/vehiculos/estado-cadena")
+async def get_estado_cadena_flota(
+    ids: Optional[str] = Query(None, description="IDs de vehículo separados por comas (todos si se omite)")
+):
+    """Estado de la cadena de temperatura de varios vehículos (o de toda la flota) en una llamada"""
+    try:
+        if ids:
+            filas = await db.ejecutar(
+                SQL_ESTADO_CADENA_IDS, [[i.strip() for i in ids.split(",") if i.strip()]]
+            )
+        else:
+            filas = await db.ejecutar(SQL_ESTADO_CADENA_FLOTA)
+        
+        # Agrupar filas por vehículo manteniendo el orden por matrícula
+        por_vehiculo = {}
+        for fila in filas:
+            por_vehiculo.setdefault(fila['vehiculo_id'], []).append(fila)
+        
+        vehiculos = [construir_estado_cadena(vid, f) for vid, f in por_vehiculo.items()]
+        
+        return {
+            "total": len(vehiculos),
+            "data": vehiculos
+        }
+    
+    except Exception as e:
+        print(f"Error: {e}")
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+
+SQL_VEHICULO = consultas.registrar("vehiculo", "SELECT * FROM vehiculos WHERE id = %s")
+
 @app.get("/vehiculos/{vehiculo_id}")
 async def get_vehiculo(vehiculo_id: str):
     """Obtener un vehículo específico por ID"""
     try:
-        vehiculo = db.query_one(
-            "SELECT * FROM vehiculos WHERE id = %s",
-            (vehiculo_id,)
-        )
+        vehiculo = await db.ejecutar_uno(SQL_VEHICULO, (vehiculo_id,))
         
         if not vehiculo:
             raise HTTPException(status_code=404, detail="Vehículo no encontrado")
@@ -367,76 +706,12 @@ async def get_vehiculo(vehiculo_id: str):
 async def get_estado_cadena_vehiculo(vehiculo_id: str):
     """Estado completo de la cadena de temperatura para un vehículo"""
     try:
-        # Verificar que el vehículo existe
-        vehiculo = db.query_one(
-            "SELECT * FROM vehiculos WHERE id = %s",
-            (vehiculo_id,)
-        )
+        filas = await db.ejecutar(SQL_ESTADO_CADENA_VEHICULO, (vehiculo_id,))
         
-        if not vehiculo:
+        if not filas:
             raise HTTPException(status_code=404, detail="Vehículo no encontrado")
         
-        # Obtener sensores del vehículo
-        sensores = db.query(
-            "SELECT * FROM sensores WHERE ubicacion_id = %s AND activo = true",
-            (vehiculo_id,)
-        )
-        
-        if not sensores:
-            return {
-                "vehiculoId": vehiculo_id,
-                "matricula": vehiculo['matricula'],
-                "estado_general": "sin_sensores",
-                "zonas": []
-            }
-        
-        zonas = []
-        estado_general = "normal"
-        
-        for sensor in sensores:
-            # Obtener última lectura del sensor
-            ultima_lectura = db.query_one("""
-                SELECT * FROM lecturas 
-                WHERE sensor_id = %s 
-                ORDER BY timestamp DESC 
-                LIMIT 1
-            """, (sensor['id'],))
-            
-            if ultima_lectura:
-                zona_info = {
-                    "sensorId": sensor['id'],
-                    "nombre": sensor['nombre'],
-                    "tipoAlimento": sensor['tipo_alimento'],
-                    "rangoOptimo": f"{sensor['rango_min']}°C - {sensor['rango_max']}°C",
-                    "temperaturaActual": float(ultima_lectura['temperatura']),
-                    "estado": ultima_lectura['estado'],
-                    "alertaActiva": ultima_lectura['alerta_activa'],
-                    "tiempoFueraRango": ultima_lectura['tiempo_fuera_rango'],
-                    "cadenRota": ultima_lectura['cadena_rota'],
-                    "ultimaActualizacion": ultima_lectura['timestamp'].isoformat()
-                }
-                
-                zonas.append(zona_info)
-                
-                # Actualizar estado general
-                if ultima_lectura['cadena_rota']:
-                    estado_general = "cadena_rota"
-                elif ultima_lectura['estado'] == 'critico' and estado_general != "cadena_rota":
-                    estado_general = "critico"
-                elif ultima_lectura['estado'] == 'alerta' and estado_general not in ["critico", "cadena_rota"]:
-                    estado_general = "alerta"
-        
-        return {
-            "vehiculoId": vehiculo_id,
-            "matricula": vehiculo['matricula'],
-            "estado_general": estado_general,
-            "total_zonas": len(zonas),
-            "zonas_normal": len([z for z in zonas if z['estado'] == 'normal']),
-            "zonas_alerta": len([z for z in zonas if z['estado'] == 'alerta']),
-            "zonas_criticas": len([z for z in zonas if z['estado'] == 'critico']),
-            "cadenas_rotas": len([z for z in zonas if z['cadenRota']]),
-            "zonas": zonas
-        }
+        return serializacion.RespuestaJSON(construir_estado_cadena(vehiculo_id, filas))
     
     except HTTPException:
         raise
@@ -446,22 +721,70 @@ async def get_estado_cadena_vehiculo(vehiculo_id: str):
 
 # ==================== TRACKING GPS ====================
 
+async def tracking_simplificado(ubicacion_id, sql_filtro, params, max_points):
+    """
+    Recorre con un cursor de servidor todas las lecturas de la ventana y devuelve la
+    ruta reducida a `max_points` puntos (más los de alerta/críticos).
+    """
+    # COUNT y recorrido en la misma instantánea y el mismo nodo: los buckets de LTTB
+    # se calculan con el número exacto de filas que devuelve el cursor
+    async with db.instantanea() as lectura:
+        total = await lectura.ejecutar_uno(
+            consultas.variante("tracking_total", f"SELECT COUNT(*) AS total FROM lecturas WHERE {sql_filtro}"),
+            params
+        )
+        total = total['total']
+        if not total:
+            raise HTTPException(
+                status_code=404,
+                detail=f"No hay lecturas para la ubicación {ubicacion_id}"
+            )
+
+        filas = lectura.stream(
+            consultas.variante(
+                "tracking_ruta",
+                "SELECT timestamp, latitud, longitud, altitud, temperatura, estado "
+                f"FROM lecturas WHERE {sql_filtro} ORDER BY timestamp ASC, id ASC"
+            ),
+            params
+        )
+
+        async def puntos():
+            async for fila in filas:
+                yield serializacion.punto_tracking(fila)
+
+        tracking_points = [p async for p in simplificacion.lttb(puntos(), total, max_points)]
+
+    return serializacion.RespuestaJSON({
+        "ubicacionId": ubicacion_id,
+        "total_puntos": len(tracking_points),
+        "total_original": total,
+        "simplificado": total > max_points,
+        "next_cursor": None,
+        "puntos": tracking_points
+    })
+
 @app.get("/lecturas/tracking/{ubicacion_id}")
 async def get_tracking_ubicacion(
     ubicacion_id: str,
     from_date: Optional[str] = Query(None, alias="from"),
     to_date: Optional[str] = Query(None, alias="to"),
-    limit: int = Query(50, ge=1, le=500)
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente"),
+    max_points: Optional[int] = Query(
+        None, ge=3, le=5000,
+        description="Devuelve la ruta completa de la ventana simplificada a este número de puntos"
+    )
 ):
     """Obtener el tracking (ruta GPS) de una ubicación"""
     try:
-        sql = "SELECT * FROM lecturas WHERE ubicacion_id = %s"
+        filtro = "ubicacion_id = %s"
         params = [ubicacion_id]
         
         if from_date:
             try:
                 from_dt = date_parser.isoparse(from_date)
-                sql += " AND timestamp >= %s"
+                filtro += " AND timestamp >= %s"
                 params.append(from_dt)
             except ValueError:
                 raise HTTPException(status_code=400, detail="Formato de fecha 'from' inválido")
@@ -469,38 +792,40 @@ async def get_tracking_ubicacion(
         if to_date:
             try:
                 to_dt = date_parser.isoparse(to_date)
-                sql += " AND timestamp <= %s"
+                filtro += " AND timestamp <= %s"
                 params.append(to_dt)
             except ValueError:
                 raise HTTPException(status_code=400, detail="Formato de fecha 'to' inválido")
         
-        sql += " ORDER BY timestamp ASC LIMIT %s"
-        params.append(limit)
+        if max_points is not None:
+            if cursor:
+                raise HTTPException(status_code=400, detail="'max_points' no admite 'cursor'")
+            return await tracking_simplificado(ubicacion_id, filtro, params, max_points)
+        
+        sql = "SELECT * FROM lecturas WHERE " + filtro
+        try:
+            sql = paginacion.aplicar_cursor(sql, params, cursor, descendente=False)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        params.append(limit + 1)
         
-        lecturas = db.query(sql, params)
+        lecturas = await db.ejecutar(consultas.variante("tracking", sql), params)
+        lecturas, next_cursor = paginacion.paginar(lecturas, limit)
         
-        if not lecturas:
+        if not lecturas and not cursor:
             raise HTTPException(
                 status_code=404,
                 detail=f"No hay lecturas para la ubicación {ubicacion_id}"
             )
         
-        tracking_points = []
-        for l in lecturas:
-            tracking_points.append({
-                "timestamp": l['timestamp'].isoformat(),
-                "latitud": float(l['latitud']),
-                "longitud": float(l['longitud']),
-                "altitud": float(l['altitud']) if l['altitud'] else None,
-                "temperatura": float(l['temperatura']),
-                "estado": l['estado']
-            })
+        tracking_points = [serializacion.punto_tracking(l) for l in lecturas]
         
-        return {
+        return serializacion.RespuestaJSON({
             "ubicacionId": ubicacion_id,
             "total_puntos": len(tracking_points),
+            "next_cursor": next_cursor,
             "puntos": tracking_points
-        }
+        })
     
     except HTTPException:
         raise
@@ -508,92 +833,172 @@ async def get_tracking_ubicacion(
         print(f"Error: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
+def exigir_indice_geo():
+    """Sin la carga inicial el índice estaría vacío o incompleto: 503 en lugar de datos erróneos"""
+    if not geo.cargado:
+        raise HTTPException(status_code=503, detail="Índice de posiciones y geocercas no disponible todavía")
+
 @app.get("/lecturas/mapa")
-async def get_mapa_todas_ubicaciones():
-    """Obtener la última posición GPS de todas las ubicaciones"""
+async def get_mapa_todas_ubicaciones(
+    bbox: Optional[str] = Query(None, description="minLon,minLat,maxLon,maxLat")
+):
+    """Obtener la última posición GPS de todas las ubicaciones (o de las que caen en bbox)"""
     try:
-        # Obtener última lectura por ubicación
-        lecturas = db.query("""
-            WITH ultima_lectura AS (
-                SELECT DISTINCT ON (ubicacion_id) *
-                FROM lecturas
-                ORDER BY ubicacion_id, timestamp DESC
-            )
-            SELECT * FROM ultima_lectura
-        """)
-        
-        ubicaciones_actuales = []
-        for l in lecturas:
-            ubicaciones_actuales.append({
-                "ubicacionId": l['ubicacion_id'],
-                "sensorId": l['sensor_id'],
-                "timestamp": l['timestamp'].isoformat(),
-                "latitud": float(l['latitud']),
-                "longitud": float(l['longitud']),
-                "altitud": float(l['altitud']) if l['altitud'] else None,
-                "temperatura": float(l['temperatura']),
-                "estado": l['estado'],
-                "alertaActiva": l['alerta_activa'],
-                "cadenRota": l['cadena_rota']
-            })
+        exigir_indice_geo()
+        # Últimas posiciones desde el índice espacial en memoria
+        if bbox:
+            try:
+                ubicaciones_actuales = geo.en_bbox(*parsear_bbox(bbox))
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        else:
+            ubicaciones_actuales = geo.todas()
         
-        return {
+        return serializacion.RespuestaJSON({
             "total_ubicaciones": len(ubicaciones_actuales),
             "ubicaciones": ubicaciones_actuales
-        }
+        })
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error: {e}")
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+
+# ==================== GEOCERCAS ====================
+
+@app.get("/geocercas")
+async def get_geocercas():
+    """Listado de geocercas con el número de vehículos dentro"""
+    exigir_indice_geo()
+    geocercas = geo.listar_geocercas()
+    return {"total": len(geocercas), "data": geocercas}
+
+@app.post("/geocercas", status_code=201)
+async def crear_geocerca(request: Request):
+    """Registrar (o reemplazar) una geocerca: {"nombre", "tipo", "poligono": [[lon, lat], ...]}"""
+    try:
+        exigir_indice_geo()
+        try:
+            geocerca = Geocerca.desde_json(await request.json())
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        await geo.guardar_geocerca(geocerca)
+        return geocerca.a_json(len(geo.dentro.get(geocerca.id, ())))
     
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
+@app.delete("/geocercas/{geocerca_id}")
+async def eliminar_geocerca(geocerca_id: str):
+    """Eliminar una geocerca"""
+    try:
+        exigir_indice_geo()
+        if geocerca_id not in geo.geocercas:
+            raise HTTPException(status_code=404, detail="Geocerca no encontrada")
+        await geo.eliminar_geocerca(geocerca_id)
+        return {"eliminada": geocerca_id}
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error: {e}")
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+
+@app.get("/geocercas/{geocerca_id}/vehiculos")
+async def get_vehiculos_geocerca(geocerca_id: str):
+    """Vehículos cuya última posición está dentro de la geocerca"""
+    exigir_indice_geo()
+    geocerca = geo.geocercas.get(geocerca_id)
+    if geocerca is None:
+        raise HTTPException(status_code=404, detail="Geocerca no encontrada")
+    
+    vehiculos = geo.vehiculos_en(geocerca_id)
+    return serializacion.RespuestaJSON({
+        "geocercaId": geocerca_id,
+        "nombre": geocerca.nombre,
+        "total": len(vehiculos),
+        "vehiculos": vehiculos
+    })
+
+# ==================== ALERTAS EN VIVO ====================
+
+@app.get("/alertas/stream")
+async def stream_alertas(
+    vehiculoId: Optional[str] = None,
+    sensorId: Optional[str] = None,
+    tipoAlimento: Optional[str] = Query(None, pattern="^(congelado|refrigerado|delicado)$")
+):
+    """
+    Suscripción Server-Sent Events a las lecturas en alerta, críticas o con cadena
+    rota y a los cambios de estado general de los vehículos, según los filtros.
+    """
+    if not difusor.admite():
+        raise HTTPException(status_code=503, detail="Demasiados suscriptores conectados")
+    
+    return StreamingResponse(
+        difusor.eventos(vehiculoId, sensorId, tipoAlimento),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/alertas/stats")
+async def stats_alertas():
+    """Suscriptores conectados y eventos publicados"""
+    return difusor.stats()
+
 # ==================== DASHBOARD ====================
 
+SQL_DASHBOARD = consultas.registrar("dashboard_resumen", """
+    SELECT
+        (SELECT COALESCE(json_object_agg(tipo_alimento, total), '{}'::json)
+         FROM (SELECT tipo_alimento, COUNT(*) AS total
+               FROM sensores
+               WHERE activo = true
+               GROUP BY tipo_alimento) s) AS sensores_por_tipo,
+        (SELECT COALESCE(json_object_agg(estado, total), '{}'::json)
+         FROM (SELECT estado, COUNT(*) AS total
+               FROM lecturas
+               WHERE timestamp >= LOCALTIMESTAMP - INTERVAL '24 hours'
+               GROUP BY estado) l) AS lecturas_por_estado,
+        (SELECT COUNT(*) FROM lecturas WHERE alerta_activa = true) AS alertas_activas,
+        (SELECT COUNT(*) FROM lecturas WHERE cadena_rota = true) AS cadenas_rotas,
+        (SELECT COUNT(*) FROM vehiculos) AS total_vehiculos
+""")
+
+async def calcular_dashboard_resumen():
+    """Calcula el resumen del dashboard en una sola consulta"""
+    resumen = await db.ejecutar_uno(SQL_DASHBOARD)
+    
+    sensores_por_tipo = resumen['sensores_por_tipo']
+    lecturas_por_estado = resumen['lecturas_por_estado']
+    total_sensores = sum(sensores_por_tipo.values())
+    total_lecturas = sum(lecturas_por_estado.values())
+    
+    return {
+        "timestamp_consulta": datetime.utcnow().isoformat() + "Z",
+        "total_sensores": total_sensores,
+        "sensores_por_tipo_alimento": sensores_por_tipo,
+        "total_lecturas_24h": total_lecturas,
+        "lecturas_por_estado": lecturas_por_estado,
+        "total_vehiculos": resumen['total_vehiculos'],
+        "alertas_activas": resumen['alertas_activas'],
+        "cadenas_rotas": resumen['cadenas_rotas'],
+        "porcentaje_salud": round(
+            (lecturas_por_estado.get('normal', 0) / total_lecturas * 100) if total_lecturas > 0 else 100,
+            2
+        )
+    }
+
 @app.get("/dashboard/resumen")
 async def get_dashboard_resumen():
     """Resumen general del sistema de monitoreo"""
     try:
-        # Contar sensores por tipo de alimento
-        sensores_stats = db.query("""
-            SELECT tipo_alimento, COUNT(*) as total
-            FROM sensores
-            WHERE activo = true
-            GROUP BY tipo_alimento
-        """)
-        
-        sensores_por_tipo = {row['tipo_alimento']: row['total'] for row in sensores_stats}
-        
-        # Estadísticas de lecturas
-        lecturas_stats = db.query("""
-            SELECT estado, COUNT(*) as total
-            FROM lecturas
-            WHERE timestamp >= NOW() - INTERVAL '24 hours'
-            GROUP BY estado
-        """)
-        
-        lecturas_por_estado = {row['estado']: row['total'] for row in lecturas_stats}
-        
-        # Alertas y cadenas rotas
-        alertas = db.query("SELECT COUNT(*) as total FROM lecturas WHERE alerta_activa = true")
-        cadenas_rotas = db.query("SELECT COUNT(*) as total FROM lecturas WHERE cadena_rota = true")
-        
-        total_sensores = sum(sensores_por_tipo.values())
-        total_lecturas = sum(lecturas_por_estado.values())
-        total_vehiculos = db.query("SELECT COUNT(*) as total FROM vehiculos")[0]['total']
-        
-        return {
-            "timestamp_consulta": datetime.utcnow().isoformat() + "Z",
-            "total_sensores": total_sensores,
-            "sensores_por_tipo_alimento": sensores_por_tipo,
-            "total_lecturas_24h": total_lecturas,
-            "lecturas_por_estado": lecturas_por_estado,
-            "total_vehiculos": total_vehiculos,
-            "alertas_activas": alertas[0]['total'],
-            "cadenas_rotas": cadenas_rotas[0]['total'],
-            "porcentaje_salud": round(
-                (lecturas_por_estado.get('normal', 0) / total_lecturas * 100) if total_lecturas > 0 else 100,
-                2
-            )
-        }
+        return await cache.get_or_set("dashboard:resumen", calcular_dashboard_resumen)
     
     except Exception as e:
         print(f"Error: {e}")
@@ -632,20 +1037,67 @@ async def root():
         "endpoints": [
             "GET /sensores",
             "GET /lecturas",
+            "GET /lecturas/export",
+            "POST /lecturas/batch",
+            "GET /lecturas/series",
+            "GET /alertas/stream",
+            "GET /geocercas",
+            "POST /geocercas",
             "GET /vehiculos",
+            "GET /vehiculos/estado-cadena",
             "GET /dashboard/resumen",
+            "GET /cache/stats",
+            "DELETE /cache",
+            "GET /pool/stats",
+            "GET /metrics",
             "GET /docs - Documentación Swagger"
         ]
     }
 
+# En el primario: es donde van todas las escrituras
+SQL_SALUD = consultas.registrar("salud", "SELECT 1", primario=True)
+
 @app.get("/health")
 async def health_check():
-    """Verificar estado de la conexión a base de datos"""
+    """Verificar estado de la conexión a base de datos (primario) y de las réplicas"""
+    replicas = {r.nombre: ("disponible" if r.disponible else "expulsada") for r in db.replicas}
     try:
-        db.query("SELECT 1")
-        return {"status": "healthy", "database": "connected"}
+        await db.ejecutar(SQL_SALUD)
+        salud = {"status": "healthy", "database": "connected"}
     except Exception as e:
-        return {"status": "unhealthy", "database": "disconnected", "error": str(e)}
+        salud = {"status": "unhealthy", "database": "disconnected", "error": str(e)}
+    if replicas:
+        salud["replicas"] = replicas
+    return salud
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Estadísticas de la caché en memoria (hits, misses, claves)"""
+    return cache.stats()
+
+@app.delete("/cache")
+async def clear_cache():
+    """Vaciar la caché en memoria"""
+    cache.delete()
+    return {"message": "Caché vaciada"}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Métricas en formato Prometheus: latencia por ruta, por consulta SQL y del pool"""
+    return PlainTextResponse(
+        metricas.exposicion(metricas.registro, db.metrics, db.replicas),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+@app.get("/metrics/consultas")
+async def get_metrics_consultas(top: int = Query(20, ge=1, le=200)):
+    """Consultas SQL que más tiempo acumulan, con percentiles estimados"""
+    return {"consultas": metricas.registro.resumen_consultas(top)}
+
+@app.get("/pool/stats")
+async def get_pool_stats():
+    """Estadísticas del pool de conexiones (en uso, en espera, latencia de adquisición)"""
+    return db.pool_stats()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,273 @@
+"""Instrumentación: histogramas de latencia por ruta, por consulta SQL y del pool, en formato Prometheus"""
+import bisect
+import re
+import time
+from collections import defaultdict
+from functools import lru_cache
+
+# Límites (segundos) de los histogramas de latencia
+LATENCIA_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Límites (ms) del histograma de espera para obtener conexión del pool
+ACQUIRE_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Longitud máxima de la huella SQL usada como etiqueta
+MAX_HUELLA = 300
+
+
+class Histograma:
+    """Histograma acumulativo de buckets fijos (compatible con Prometheus)"""
+    __slots__ = ("limites", "buckets", "suma", "total")
+
+    def __init__(self, limites=LATENCIA_BUCKETS):
+        self.limites = limites
+        self.buckets = [0] * (len(limites) + 1)
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        self.buckets[bisect.bisect_left(self.limites, valor)] += 1
+        self.suma += valor
+        self.total += 1
+
+    def acumulados(self):
+        """Pares (límite, recuento acumulado) incluyendo +Inf"""
+        acumulado = 0
+        for limite, n in zip(self.limites + (float('inf'),), self.buckets):
+            acumulado += n
+            yield limite, acumulado
+
+    def percentil(self, q):
+        """Estimación del percentil q (0-1) interpolando dentro del bucket"""
+        if not self.total:
+            return 0.0
+        objetivo = q * self.total
+        inferior, anterior = 0.0, 0
+        for limite, acumulado in self.acumulados():
+            if acumulado >= objetivo:
+                if limite == float('inf'):
+                    return inferior
+                dentro = acumulado - anterior
+                return inferior + (limite - inferior) * ((objetivo - anterior) / dentro if dentro else 0)
+            inferior, anterior = limite, acumulado
+        return inferior
+
+
+class PoolMetrics:
+    """Contadores del pool: conexiones en uso, peticiones en espera y latencia de adquisición"""
+
+    def __init__(self):
+        self.in_use = 0
+        self.waiting = 0
+        self.timeouts = 0
+        self.espera = Histograma(tuple(ms / 1000 for ms in ACQUIRE_BUCKETS_MS))
+
+    @property
+    def acquired(self):
+        return self.espera.total
+
+    def observe_acquire(self, elapsed_ms):
+        self.espera.observar(elapsed_ms / 1000)
+
+    def snapshot(self):
+        histograma = {
+            str(limite): acumulado
+            for limite, (_, acumulado) in zip(ACQUIRE_BUCKETS_MS + ('+Inf',), self.espera.acumulados())
+        }
+        return {
+            "in_use": self.in_use,
+            "waiting": self.waiting,
+            "acquired": self.acquired,
+            "timeouts": self.timeouts,
+            "acquire_ms_avg": round(self.espera.suma / self.acquired * 1000, 3) if self.acquired else 0,
+            "acquire_ms_histogram": histograma
+        }
+
+
+_LITERAL_TEXTO = re.compile(r"'(?:[^']|'')*'")
+_LITERAL_NUMERO = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAMETRO = re.compile(r"%s|%\(\w+\)s")
+_ESPACIOS = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def huella_sql(sql):
+    """Normaliza una sentencia: literales y parámetros como ?, espacios colapsados"""
+    huella = _LITERAL_TEXTO.sub("?", sql)
+    huella = _PARAMETRO.sub("?", huella)
+    huella = _LITERAL_NUMERO.sub("?", huella)
+    huella = _ESPACIOS.sub(" ", huella).strip()
+    return huella[:MAX_HUELLA]
+
+
+class EstadisticaConsulta:
+    __slots__ = ("latencia", "filas", "errores")
+
+    def __init__(self):
+        self.latencia = Histograma()
+        self.filas = 0
+        self.errores = 0
+
+
+class Registro:
+    """Métricas del proceso: peticiones HTTP por ruta y consultas SQL por huella"""
+
+    def __init__(self):
+        self.peticiones = defaultdict(int)            # (método, ruta, estado) -> total
+        self.latencia_rutas = defaultdict(Histograma)  # (método, ruta) -> histograma
+        self.consultas = defaultdict(EstadisticaConsulta)
+
+    def observar_peticion(self, metodo, ruta, estado, segundos):
+        self.peticiones[(metodo, ruta, estado)] += 1
+        self.latencia_rutas[(metodo, ruta)].observar(segundos)
+
+    def observar_consulta(self, sql, segundos, filas=0, error=False):
+        estadistica = self.consultas[huella_sql(sql)]
+        estadistica.latencia.observar(segundos)
+        estadistica.filas += filas
+        if error:
+            estadistica.errores += 1
+
+    def resumen_consultas(self, top=20):
+        """Consultas ordenadas por tiempo total, con percentiles estimados (ms)"""
+        filas = []
+        for huella, e in self.consultas.items():
+            h = e.latencia
+            filas.append({
+                "sql": huella,
+                "llamadas": h.total,
+                "errores": e.errores,
+                "filas": e.filas,
+                "total_ms": round(h.suma * 1000, 3),
+                "media_ms": round(h.suma / h.total * 1000, 3) if h.total else 0,
+                "p50_ms": round(h.percentil(0.50) * 1000, 3),
+                "p95_ms": round(h.percentil(0.95) * 1000, 3),
+                "p99_ms": round(h.percentil(0.99) * 1000, 3)
+            })
+        filas.sort(key=lambda f: f["total_ms"], reverse=True)
+        return filas[:top]
+
+
+class MiddlewareMetricas:
+    """
+    Middleware ASGI que mide cada petición HTTP por plantilla de ruta (p. ej.
+    /lecturas/tracking/{ubicacion_id}) hasta el último byte de la respuesta.
+    """
+
+    def __init__(self, app, registro_metricas=None):
+        self.app = app
+        self.registro = registro_metricas or registro
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        inicio = time.perf_counter()
+        estado = 500
+
+        async def enviar(mensaje):
+            nonlocal estado
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            # El router deja la ruta resuelta en el scope; sin ella se agrupa para no crear una serie por URL
+            ruta = scope.get("route")
+            self.registro.observar_peticion(
+                scope["method"], getattr(ruta, "path", "sin_ruta"), estado, time.perf_counter() - inicio
+            )
+
+
+def _etiquetas(**etiquetas):
+    partes = []
+    for clave, valor in etiquetas.items():
+        valor = str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        partes.append(f'{clave}="{valor}"')
+    return "{" + ",".join(partes) + "}"
+
+
+def _formatear_le(limite):
+    return "+Inf" if limite == float('inf') else repr(float(limite))
+
+
+def _histograma_prometheus(lineas, nombre, histograma, **etiquetas):
+    for limite, acumulado in histograma.acumulados():
+        lineas.append(f"{nombre}_bucket{_etiquetas(**etiquetas, le=_formatear_le(limite))} {acumulado}")
+    lineas.append(f"{nombre}_sum{_etiquetas(**etiquetas)} {histograma.suma}")
+    lineas.append(f"{nombre}_count{_etiquetas(**etiquetas)} {histograma.total}")
+
+
+def exposicion(registro, pool, replicas=()):
+    """Texto en formato de exposición de Prometheus (text/plain; version=0.0.4)"""
+    lineas = [
+        "# HELP iot_http_requests_total Peticiones HTTP por ruta y código de estado",
+        "# TYPE iot_http_requests_total counter"
+    ]
+    for (metodo, ruta, estado), total in sorted(registro.peticiones.items()):
+        lineas.append(f"iot_http_requests_total{_etiquetas(method=metodo, route=ruta, status=estado)} {total}")
+
+    lineas += [
+        "# HELP iot_http_request_duration_seconds Latencia de las peticiones HTTP por ruta",
+        "# TYPE iot_http_request_duration_seconds histogram"
+    ]
+    for (metodo, ruta), histograma in sorted(registro.latencia_rutas.items()):
+        _histograma_prometheus(lineas, "iot_http_request_duration_seconds", histograma, method=metodo, route=ruta)
+
+    lineas += [
+        "# HELP iot_db_query_duration_seconds Duración de las consultas por huella SQL",
+        "# TYPE iot_db_query_duration_seconds histogram"
+    ]
+    for huella, e in sorted(registro.consultas.items()):
+        _histograma_prometheus(lineas, "iot_db_query_duration_seconds", e.latencia, query=huella)
+    lineas += [
+        "# HELP iot_db_query_rows_total Filas devueltas o afectadas por huella SQL",
+        "# TYPE iot_db_query_rows_total counter"
+    ]
+    for huella, e in sorted(registro.consultas.items()):
+        lineas.append(f"iot_db_query_rows_total{_etiquetas(query=huella)} {e.filas}")
+    lineas += [
+        "# HELP iot_db_query_errors_total Consultas fallidas por huella SQL",
+        "# TYPE iot_db_query_errors_total counter"
+    ]
+    for huella, e in sorted(registro.consultas.items()):
+        lineas.append(f"iot_db_query_errors_total{_etiquetas(query=huella)} {e.errores}")
+
+    lineas += [
+        "# HELP iot_db_pool_acquire_seconds Espera para obtener una conexión del pool",
+        "# TYPE iot_db_pool_acquire_seconds histogram"
+    ]
+    _histograma_prometheus(lineas, "iot_db_pool_acquire_seconds", pool.espera)
+    lineas += [
+        "# HELP iot_db_pool_in_use Conexiones del pool en uso",
+        "# TYPE iot_db_pool_in_use gauge",
+        f"iot_db_pool_in_use {pool.in_use}",
+        "# HELP iot_db_pool_waiting Peticiones esperando una conexión",
+        "# TYPE iot_db_pool_waiting gauge",
+        f"iot_db_pool_waiting {pool.waiting}",
+        "# HELP iot_db_pool_timeouts_total Esperas de conexión agotadas",
+        "# TYPE iot_db_pool_timeouts_total counter",
+        f"iot_db_pool_timeouts_total {pool.timeouts}"
+    ]
+
+    if replicas:
+        series = (
+            ("iot_db_replica_up", "gauge", "Réplica disponible para lecturas (1) o expulsada (0)",
+             lambda r: int(r.disponible)),
+            ("iot_db_replica_reads_total", "counter", "Lecturas servidas por la réplica", lambda r: r.lecturas),
+            ("iot_db_replica_ejections_total", "counter", "Veces que se ha expulsado la réplica",
+             lambda r: r.expulsiones),
+            ("iot_db_replica_in_use", "gauge", "Conexiones en uso en el pool de la réplica",
+             lambda r: r.metrics.in_use)
+        )
+        for nombre, tipo, ayuda, valor in series:
+            lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} {tipo}"]
+            for replica in replicas:
+                lineas.append(f"{nombre}{_etiquetas(replica=replica.nombre)} {valor(replica)}")
+    return "\n".join(lineas) + "\n"
+
+
+registro = Registro()
@@ -0,0 +1,45 @@
+"""Paginación por cursor (keyset) sobre (timestamp, id)"""
+import base64
+import json
+from datetime import datetime
+
+
+def codificar_cursor(fila):
+    """Cursor opaco con la posición de la última fila devuelta"""
+    posicion = {"t": fila['timestamp'].isoformat(), "id": fila['id']}
+    return base64.urlsafe_b64encode(json.dumps(posicion).encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    """Devuelve (timestamp, id); lanza ValueError si el cursor no es válido"""
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        posicion = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        return datetime.fromisoformat(posicion['t']), str(posicion['id'])
+    except Exception:
+        raise ValueError("Cursor inválido")
+
+
+def aplicar_cursor(sql, params, cursor, descendente=True):
+    """
+    Añade la condición keyset y el orden estable (timestamp, id) a la consulta. La
+    comparación de filas no sirve para descartar particiones, así que se repite la
+    condición sobre timestamp sola: las páginas siguientes solo leen los meses que quedan.
+    """
+    if cursor:
+        timestamp, lectura_id = decodificar_cursor(cursor)
+        if descendente:
+            sql += " AND timestamp <= %s AND (timestamp, id) < (%s, %s)"
+        else:
+            sql += " AND timestamp >= %s AND (timestamp, id) > (%s, %s)"
+        params.extend([timestamp, timestamp, lectura_id])
+    orden = "DESC" if descendente else "ASC"
+    return sql + f" ORDER BY timestamp {orden}, id {orden} LIMIT %s"
+
+
+def paginar(filas, limit):
+    """Recorta la fila extra pedida (limit + 1) y calcula el siguiente cursor"""
+    if len(filas) > limit:
+        filas = filas[:limit]
+        return filas, codificar_cursor(filas[-1])
+    return filas, None
@@ -0,0 +1,70 @@
+"""Mantenimiento de las particiones mensuales de lecturas: creación anticipada y retención"""
+import asyncio
+import os
+import consultas
+import db
+
+# Meses futuros con partición ya creada
+MESES_ADELANTE = int(os.getenv('LECTURAS_MESES_ADELANTE', '3'))
+# Meses de histórico que se conservan (0 = sin retención)
+RETENCION_MESES = int(os.getenv('LECTURAS_RETENCION_MESES', '0'))
+# Cada cuántos segundos se ejecuta el mantenimiento
+INTERVALO = float(os.getenv('PARTICIONES_INTERVALO', '3600'))
+
+# Funciones que crean o eliminan tablas: son escrituras aunque la sentencia sea un SELECT
+SQL_ASEGURAR = consultas.registrar("particiones_asegurar", """
+    SELECT crear_particion_lecturas(mes)
+    FROM (SELECT DISTINCT date_trunc('month', t::timestamp) AS mes
+          FROM unnest(%s::timestamptz[]) AS t) m
+""", escritura=True)
+
+SQL_CREAR = consultas.registrar(
+    "particiones_crear",
+    "SELECT crear_particiones_lecturas(LOCALTIMESTAMP, %s) AS particion",
+    escritura=True
+)
+
+SQL_PURGAR = consultas.registrar(
+    "particiones_purgar",
+    "SELECT purgar_particiones_lecturas(make_interval(months => %s)) AS particion",
+    escritura=True
+)
+
+# Meses (año, mes) con partición confirmada, para no consultar en cada lote
+_conocidas = set()
+
+
+async def asegurar(timestamps):
+    """Crea las particiones que falten para los timestamps de un lote antes de insertarlo"""
+    timestamps = list(timestamps)
+    meses = {(ts.year, ts.month) for ts in timestamps}
+    if meses <= _conocidas:
+        return
+    # El mes se calcula en PostgreSQL para usar la misma conversión de zona que el INSERT
+    await db.ejecutar(SQL_ASEGURAR, [timestamps])
+    _conocidas.update(meses)
+
+
+async def mantener():
+    """Crea las particiones de los próximos meses y elimina las que superan la retención"""
+    creadas = await db.ejecutar(SQL_CREAR, [MESES_ADELANTE])
+    eliminadas = []
+    if RETENCION_MESES > 0:
+        eliminadas = await db.ejecutar(SQL_PURGAR, [RETENCION_MESES])
+        _conocidas.clear()
+    return {
+        "particiones": [fila['particion'] for fila in creadas],
+        "eliminadas": [fila['particion'] for fila in eliminadas]
+    }
+
+
+async def vigilar(intervalo=INTERVALO):
+    """Ejecuta el mantenimiento al arrancar y después periódicamente"""
+    while True:
+        try:
+            resultado = await mantener()
+            if resultado['eliminadas']:
+                print(f"🗑️  Particiones eliminadas por retención: {resultado['eliminadas']}")
+        except Exception as e:
+            print(f"❌ Error en el mantenimiento de particiones: {e}")
+        await asyncio.sleep(intervalo)
@@ -0,0 +1,155 @@
+"""Motor de reglas de cadena de frío: clasificación de lecturas y tiempo fuera de rango por sensor"""
+import asyncio
+from collections import defaultdict
+from contextlib import asynccontextmanager
+import consultas
+import db
+
+# Minutos máximos fuera de rango antes de considerar rota la cadena (ver GET /)
+TIEMPO_MAXIMO_FUERA_RANGO = {
+    "congelado": 15,
+    "refrigerado": 30,
+    "delicado": 15
+}
+
+# El estado del motor decide cómo se clasifican las escrituras: se lee siempre del primario
+SQL_UMBRALES = consultas.registrar("reglas_umbrales", """
+    SELECT id, tipo_alimento, umbral_alerta, umbral_critico, intervalo_lectura
+    FROM sensores
+""", primario=True)
+
+SQL_ESTADOS = consultas.registrar("reglas_estados", """
+    SELECT sensor_id, timestamp, estado, tiempo_fuera_rango
+    FROM lecturas_ultimas
+""", primario=True)
+
+# Solo los sensores que faltan en caché (sensores dados de alta después de cargar)
+SQL_UMBRALES_IDS = consultas.registrar(
+    "reglas_umbrales_ids", SQL_UMBRALES.sql + "    WHERE id = ANY(%s)\n", primario=True
+)
+SQL_ESTADOS_IDS = consultas.registrar(
+    "reglas_estados_ids", SQL_ESTADOS.sql + "    WHERE sensor_id = ANY(%s)\n", primario=True
+)
+
+
+class Umbrales:
+    __slots__ = ("umbral_alerta", "umbral_critico", "intervalo_min", "tiempo_maximo")
+
+    def __init__(self, sensor):
+        self.umbral_alerta = float(sensor['umbral_alerta'])
+        self.umbral_critico = float(sensor['umbral_critico'])
+        self.intervalo_min = (sensor['intervalo_lectura'] or 300) / 60
+        self.tiempo_maximo = TIEMPO_MAXIMO_FUERA_RANGO.get(sensor['tipo_alimento'], 15)
+
+
+class EstadoSensor:
+    """Última lectura evaluada y minutos acumulados fuera de rango"""
+    __slots__ = ("timestamp", "fuera_rango", "tiempo_fuera_rango")
+
+    def __init__(self, timestamp, fuera_rango, tiempo_fuera_rango):
+        self.timestamp = timestamp
+        self.fuera_rango = fuera_rango
+        self.tiempo_fuera_rango = tiempo_fuera_rango
+
+    @classmethod
+    def desde_fila(cls, ultima):
+        """Estado a partir de una fila de lecturas_ultimas"""
+        return cls(ultima['timestamp'], ultima['estado'] != 'normal', ultima['tiempo_fuera_rango'] or 0)
+
+
+class MotorCadenaFrio:
+    """
+    Clasifica cada lectura con los umbrales cacheados de su sensor y mantiene de
+    forma incremental el tiempo fuera de rango, sin consultar la BD por lectura.
+    """
+
+    def __init__(self):
+        self.umbrales = {}
+        self.estados = {}
+        self.cerrojos = defaultdict(asyncio.Lock)  # sensor_id -> lote en curso
+
+    async def cargar(self):
+        """Carga umbrales de sensores y el estado actual desde lecturas_ultimas"""
+        sensores = await db.ejecutar(SQL_UMBRALES)
+        self.umbrales = {s['id']: Umbrales(s) for s in sensores}
+
+        ultimas = await db.ejecutar(SQL_ESTADOS)
+        self.estados = {u['sensor_id']: EstadoSensor.desde_fila(u) for u in ultimas}
+
+    async def asegurar_sensores(self, sensor_ids):
+        """
+        Carga los umbrales y el estado de los sensores del lote que no están en caché.
+        Solo consulta esos ids: un sensorId inexistente no provoca una recarga completa.
+        """
+        faltan = [s for s in set(sensor_ids) if s not in self.umbrales]
+        if not faltan:
+            return
+        for sensor in await db.ejecutar(SQL_UMBRALES_IDS, [faltan]):
+            self.umbrales[sensor['id']] = Umbrales(sensor)
+        for u in await db.ejecutar(SQL_ESTADOS_IDS, [faltan]):
+            self.estados.setdefault(u['sensor_id'], EstadoSensor.desde_fila(u))
+
+    @asynccontextmanager
+    async def bloquear(self, sensor_ids):
+        """
+        Serializa evaluar -> insertar -> confirmar entre lotes que comparten sensores:
+        cada lote parte del estado que dejó el anterior. Los cerrojos se toman en orden
+        para que dos lotes con los mismos sensores no se bloqueen mutuamente.
+        """
+        adquiridos = []
+        try:
+            for sensor_id in sorted(set(sensor_ids)):
+                cerrojo = self.cerrojos[sensor_id]
+                await cerrojo.acquire()
+                adquiridos.append(cerrojo)
+            yield
+        finally:
+            for cerrojo in reversed(adquiridos):
+                cerrojo.release()
+
+    def conoce(self, sensor_id):
+        return sensor_id in self.umbrales
+
+    def clasificar(self, umbrales, temperatura):
+        if temperatura > umbrales.umbral_critico:
+            return "critico"
+        if temperatura > umbrales.umbral_alerta:
+            return "alerta"
+        return "normal"
+
+    def evaluar(self, sensor_id, timestamp, temperatura, pendientes):
+        """
+        Evalúa una lectura y devuelve (estado, alerta_activa, tiempo_fuera_rango, cadena_rota).
+        El nuevo estado del sensor se deja en `pendientes` hasta confirmar la escritura.
+        """
+        umbrales = self.umbrales[sensor_id]
+        estado = self.clasificar(umbrales, temperatura)
+        fuera_rango = estado != "normal"
+
+        anterior = pendientes.get(sensor_id) or self.estados.get(sensor_id)
+
+        if anterior is not None and timestamp < anterior.timestamp:
+            # Lectura atrasada: se clasifica pero no altera el acumulado del sensor
+            tiempo = round(umbrales.intervalo_min) if fuera_rango else 0
+            return estado, fuera_rango, tiempo, tiempo > umbrales.tiempo_maximo
+
+        if not fuera_rango:
+            tiempo = 0
+        elif anterior is not None and anterior.fuera_rango:
+            minutos = (timestamp - anterior.timestamp).total_seconds() / 60
+            tiempo = anterior.tiempo_fuera_rango + round(minutos)
+        else:
+            tiempo = round(umbrales.intervalo_min)
+
+        pendientes[sensor_id] = EstadoSensor(timestamp, fuera_rango, tiempo)
+        return estado, fuera_rango, tiempo, tiempo > umbrales.tiempo_maximo
+
+    def confirmar(self, estados):
+        """Aplica los estados (sensor_id, EstadoSensor) de las lecturas que se escribieron"""
+        for sensor_id, nuevo in estados:
+            actual = self.estados.get(sensor_id)
+            if actual is None or nuevo.timestamp >= actual.timestamp:
+                self.estados[sensor_id] = nuevo
+
+
+motor = MotorCadenaFrio()
@@ -0,0 +1,115 @@
+"""Series temporales servidas desde los agregados lecturas_rollup_* en lugar de las lecturas"""
+import re
+from datetime import timedelta
+import consultas
+
+# Granularidades disponibles en las tablas de agregados, de mayor a menor
+GRANULARIDADES = (('day', 86400), ('hour', 3600), ('minute', 60))
+
+# Tamaños de bucket que se eligen automáticamente si no se indica ninguno (segundos)
+ESCALA_BUCKETS = (60, 300, 900, 1800, 3600, 10800, 21600, 43200, 86400, 604800)
+
+AMBITOS = {
+    'sensor': ('lecturas_rollup_sensor', 'sensor_id'),
+    'ubicacion': ('lecturas_rollup_ubicacion', 'ubicacion_id')
+}
+
+_UNIDADES = {'m': 60, 'h': 3600, 'd': 86400}
+_BUCKET = re.compile(r'^(\d+)([mhd])$')
+
+
+def parsear_bucket(texto):
+    """'15m', '1h', '1d' -> segundos; el bucket debe ser múltiplo de un minuto"""
+    coincidencia = _BUCKET.match(texto or '')
+    if not coincidencia or int(coincidencia.group(1)) == 0:
+        raise ValueError("Bucket inválido. Use <n>m, <n>h o <n>d (p. ej. 15m, 1h, 1d)")
+    return int(coincidencia.group(1)) * _UNIDADES[coincidencia.group(2)]
+
+
+def formatear_bucket(segundos):
+    for unidad, tam in (('d', 86400), ('h', 3600), ('m', 60)):
+        if segundos % tam == 0:
+            return f"{segundos // tam}{unidad}"
+
+
+def elegir_bucket(ventana_segundos, max_puntos):
+    """Menor bucket de la escala que deja la ventana en como mucho `max_puntos` puntos"""
+    for segundos in ESCALA_BUCKETS:
+        if ventana_segundos / segundos <= max_puntos:
+            return segundos
+    return ESCALA_BUCKETS[-1]
+
+
+def elegir_granularidad(bucket_segundos):
+    """Agregado más grueso cuyo tamaño divide exactamente al bucket pedido"""
+    for granularidad, tam in GRANULARIDADES:
+        if bucket_segundos % tam == 0:
+            return granularidad
+    raise ValueError("El bucket debe ser múltiplo de un minuto")
+
+
+def _sql_serie(tabla, columna):
+    return f"""
+        SELECT
+            date_bin(%s, bucket, TIMESTAMP '2000-01-01') AS inicio,
+            SUM(total) AS total_lecturas,
+            ROUND(SUM(suma_temperatura) / SUM(total), 2) AS temperatura_promedio,
+            MIN(temperatura_min) AS temperatura_minima,
+            MAX(temperatura_max) AS temperatura_maxima,
+            SUM(lecturas_normales) AS lecturas_normales,
+            SUM(lecturas_alerta) AS lecturas_alerta,
+            SUM(lecturas_criticas) AS lecturas_criticas,
+            MAX(tiempo_max_fuera_rango) AS tiempo_max_fuera_rango,
+            BOOL_OR(cadena_rota) AS cadena_rota
+        FROM {tabla}
+        WHERE {columna} = %s
+          AND granularidad = %s
+          AND bucket >= date_trunc(%s, %s::timestamp)
+          AND bucket <= %s
+        GROUP BY inicio
+        ORDER BY inicio
+    """
+
+
+# Una consulta por ámbito; el bucket y la granularidad van como parámetros
+CONSULTAS_SERIE = {
+    ambito: consultas.registrar(f"serie_{ambito}", _sql_serie(tabla, columna))
+    for ambito, (tabla, columna) in AMBITOS.items()
+}
+
+
+def consulta_serie(ambito, bucket_segundos):
+    """Consulta que reagrupa los agregados en buckets del tamaño pedido, y el intervalo del bucket"""
+    return CONSULTAS_SERIE[ambito], timedelta(seconds=bucket_segundos)
+
+
+# Estadísticas de todo el histórico de una ubicación a partir de los agregados diarios
+SQL_ESTADISTICAS_HISTORICO = consultas.registrar("estadisticas_historico", """
+    SELECT
+        COALESCE(SUM(total), 0) AS total_lecturas,
+        ROUND(SUM(suma_temperatura) / NULLIF(SUM(total), 0), 2) AS temperatura_promedio,
+        MIN(temperatura_min) AS temperatura_minima,
+        MAX(temperatura_max) AS temperatura_maxima,
+        COALESCE(SUM(lecturas_normales), 0) AS lecturas_normales,
+        COALESCE(SUM(lecturas_alerta), 0) AS lecturas_alerta,
+        COALESCE(SUM(lecturas_criticas), 0) AS lecturas_criticas,
+        COALESCE(BOOL_OR(cadena_rota), false) AS cadena_rota,
+        MAX(tiempo_max_fuera_rango) AS tiempo_max_fuera_rango
+    FROM lecturas_rollup_ubicacion
+    WHERE ubicacion_id = %s AND granularidad = 'day'
+""")
+
+
+def punto_serie(fila):
+    return {
+        "timestamp": fila['inicio'].isoformat(),
+        "total_lecturas": int(fila['total_lecturas']),
+        "temperatura_promedio": float(fila['temperatura_promedio']),
+        "temperatura_minima": float(fila['temperatura_minima']),
+        "temperatura_maxima": float(fila['temperatura_maxima']),
+        "lecturas_normales": int(fila['lecturas_normales']),
+        "lecturas_alerta": int(fila['lecturas_alerta']),
+        "lecturas_criticas": int(fila['lecturas_criticas']),
+        "tiempo_max_fuera_rango": fila['tiempo_max_fuera_rango'],
+        "cadena_rota": fila['cadena_rota']
+    }
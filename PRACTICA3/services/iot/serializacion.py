@@ -0,0 +1,111 @@
+"""Serialización de lecturas: conversión fila -> JSON compartida y respuesta JSON directa a bytes"""
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional: sin él se usa json de la librería estándar
+    orjson = None
+
+
+def _por_defecto(valor):
+    if isinstance(valor, Decimal):
+        return float(valor)
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(valor).__name__}")
+
+
+def dumps(contenido):
+    """Serializa a bytes UTF-8"""
+    if orjson is not None:
+        return orjson.dumps(contenido, default=_por_defecto)
+    return json.dumps(
+        contenido, ensure_ascii=False, separators=(",", ":"), default=_por_defecto
+    ).encode("utf-8")
+
+
+class RespuestaJSON(JSONResponse):
+    """
+    Respuesta que escribe los bytes directamente. Los endpoints la devuelven ya
+    construida para que FastAPI no recorra el contenido con jsonable_encoder.
+    """
+
+    def render(self, content):
+        return dumps(content)
+
+
+# Conversión de filas. Los NUMERIC llegan ya como float (ver db._configurar_conexion).
+
+def lectura(l):
+    """Lectura completa con la posición anidada en `gps`"""
+    return {
+        "id": l['id'],
+        "sensorId": l['sensor_id'],
+        "ubicacionId": l['ubicacion_id'],
+        "timestamp": l['timestamp'].isoformat(),
+        "temperatura": l['temperatura'],
+        "gps": {
+            "latitud": l['latitud'],
+            "longitud": l['longitud'],
+            "altitud": l['altitud']
+        },
+        "estado": l['estado'],
+        "alertaActiva": l['alerta_activa'],
+        "tiempoFueraRango": l['tiempo_fuera_rango'],
+        "cadenRota": l['cadena_rota']
+    }
+
+
+def punto_tracking(l):
+    """Punto de la ruta GPS"""
+    return {
+        "timestamp": l['timestamp'].isoformat(),
+        "latitud": l['latitud'],
+        "longitud": l['longitud'],
+        "altitud": l['altitud'],
+        "temperatura": l['temperatura'],
+        "estado": l['estado']
+    }
+
+
+def posicion(l):
+    """Última posición conocida de una ubicación (mapa)"""
+    return {
+        "ubicacionId": l['ubicacion_id'],
+        "sensorId": l['sensor_id'],
+        "timestamp": l['timestamp'].isoformat(),
+        "latitud": l['latitud'],
+        "longitud": l['longitud'],
+        "altitud": l['altitud'],
+        "temperatura": l['temperatura'],
+        "estado": l['estado'],
+        "alertaActiva": l['alerta_activa'],
+        "cadenRota": l['cadena_rota']
+    }
+
+
+COLUMNAS_EXPORT = [
+    "id", "sensorId", "ubicacionId", "timestamp", "temperatura", "latitud", "longitud",
+    "altitud", "estado", "alertaActiva", "tiempoFueraRango", "cadenRota"
+]
+
+
+def fila_export(l):
+    """Fila plana de una lectura para la exportación"""
+    return [
+        l['id'],
+        l['sensor_id'],
+        l['ubicacion_id'],
+        l['timestamp'].isoformat(),
+        l['temperatura'],
+        l['latitud'],
+        l['longitud'],
+        l['altitud'],
+        l['estado'],
+        l['alerta_activa'],
+        l['tiempo_fuera_rango'],
+        l['cadena_rota']
+    ]
@@ -0,0 +1,74 @@
+"""Simplificación de rutas GPS en streaming (Largest-Triangle-Three-Buckets)"""
+
+
+def _es_relevante(punto):
+    # Los puntos en alerta o críticos se conservan siempre
+    return punto['estado'] != 'normal'
+
+
+def _xy(punto):
+    return punto['longitud'], punto['latitud']
+
+
+def _area(a, b, c):
+    """Doble del área del triángulo a-b-c en el plano (longitud, latitud)"""
+    return abs((a[0] - c[0]) * (b[1] - a[1]) - (a[0] - b[0]) * (c[1] - a[1]))
+
+
+def _centroide(bucket):
+    return (
+        sum(p['longitud'] for p in bucket) / len(bucket),
+        sum(p['latitud'] for p in bucket) / len(bucket)
+    )
+
+
+async def _agrupar(puntos, total, tam_bucket):
+    """Agrupa la secuencia en buckets consecutivos; el primer y el último punto van solos"""
+    bucket, clave_actual = [], None
+    indice = 0
+    async for punto in puntos:
+        if indice == 0 or indice >= total - 1:
+            clave = ('extremo', indice)
+        else:
+            clave = int((indice - 1) // tam_bucket)
+        if bucket and clave != clave_actual:
+            yield bucket
+            bucket = []
+        bucket.append(punto)
+        clave_actual = clave
+        indice += 1
+    if bucket:
+        yield bucket
+
+
+async def lttb(puntos, total, max_puntos):
+    """
+    Reduce una secuencia ordenada de `total` puntos a `max_puntos` con LTTB en el
+    plano (longitud, latitud), conservando además los puntos en alerta o críticos.
+    Solo mantiene en memoria el bucket que se decide y el siguiente.
+    """
+    if total <= max_puntos or max_puntos < 3:
+        async for punto in puntos:
+            yield punto
+        return
+
+    tam_bucket = (total - 2) / (max_puntos - 2)
+    anterior = None
+    pendiente = None
+
+    async for bucket in _agrupar(puntos, total, tam_bucket):
+        if pendiente is not None:
+            if anterior is None:
+                elegido = pendiente[0]
+            else:
+                centroide = _centroide(bucket)
+                elegido = max(pendiente, key=lambda p: _area(_xy(anterior), _xy(p), centroide))
+            for punto in pendiente:
+                if punto is elegido or _es_relevante(punto):
+                    yield punto
+            anterior = elegido
+        pendiente = bucket
+
+    # El último bucket es el punto final
+    for punto in pendiente or ():
+        yield punto
@@ -0,0 +1,36 @@
+"""Eventos de estado de vehículo de lotes con sensores que el difusor no tenía en caché"""
+import asyncio
+from datetime import datetime
+
+import alertas
+from alertas import DifusorAlertas
+
+T1 = datetime(2025, 11, 20, 10, 0)
+
+
+def _fila(sensor_id, estado):
+    return ('L1', sensor_id, 'VEH001', T1, -12.0, 40.4, -3.7, 650.0, estado, True, 5, False)
+
+
+def test_sensor_nuevo_publica_el_cambio_de_estado_del_vehiculo(monkeypatch):
+    consultas_hechas = []
+
+    async def ejecutar(consulta, params=None):
+        consultas_hechas.append((consulta.nombre, params))
+        # lecturas_ultimas ya contiene la lectura del lote
+        return [{'id': 'SENS002', 'ubicacion_id': 'VEH001', 'tipo_alimento': 'congelado',
+                 'timestamp': T1, 'estado': 'critico', 'cadena_rota': False}]
+
+    monkeypatch.setattr(alertas.db, 'ejecutar', ejecutar)
+    difusor = DifusorAlertas()
+    difusor.sensores = {'SENS001': ('VEH001', 'congelado')}
+    difusor.por_vehiculo['VEH001'].add('SENS001')
+    difusor.estados = {'SENS001': (T1, 'normal')}
+    suscripcion = difusor.suscribir(vehiculo_id='VEH001')
+
+    asyncio.run(difusor.publicar_lote([_fila('SENS002', 'critico')]))
+
+    assert consultas_hechas == [('alertas_sensores_ids', [['SENS002']])]
+    mensajes = [suscripcion.cola.get_nowait() for _ in range(suscripcion.cola.qsize())]
+    assert [m.split('\n')[0] for m in mensajes] == ['event: critico', 'event: estado_vehiculo']
+    assert '"estado_anterior": "normal"' in mensajes[1]
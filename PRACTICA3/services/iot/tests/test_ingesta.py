@@ -0,0 +1,92 @@
+"""Unicidad del id de lectura en la ingesta por lotes"""
+import asyncio
+import os
+from datetime import datetime
+
+import pytest
+
+import ingesta
+
+T1 = datetime(2025, 11, 20, 10, 0)
+T2 = datetime(2025, 11, 20, 10, 5)
+
+
+def _fila(lectura_id, timestamp, sensor_id='SENS001'):
+    return (lectura_id, sensor_id, 'VEH001', timestamp, -18.5, 40.4, -3.7, 650.0,
+            'normal', False, 0, False)
+
+
+def test_id_reenviado_con_otro_timestamp_se_rechaza():
+    # La lectura L1 ya existía con T1: la base de datos no devuelve el par (L1, T2)
+    filas = [_fila('L1', T2), _fila('L2', T2)]
+    nuevas, rechazos = ingesta.conciliar(filas, [0, 1], {('L2', T2)}, set())
+
+    assert [f[0] for f in nuevas] == ['L2']
+    assert rechazos == [{"indice": 0, "id": 'L1', "errores": ["Lectura con id duplicado"]}]
+
+
+def test_id_repetido_en_el_lote_inserta_solo_la_primera_aparicion():
+    # Filas en orden temporal (como las deja evaluar_lote): la de T1 es la segunda del lote
+    filas = [_fila('L1', T1), _fila('L1', T2)]
+    indices = [1, 0]
+    nuevas, rechazos = ingesta.conciliar(filas, indices, {('L1', T2)}, set())
+
+    assert nuevas == [_fila('L1', T2)]
+    assert rechazos == [{"indice": 1, "id": 'L1', "errores": ["Lectura con id duplicado"]}]
+
+
+def test_id_repetido_con_el_mismo_timestamp():
+    filas = [_fila('L1', T1), _fila('L1', T1)]
+    nuevas, rechazos = ingesta.conciliar(filas, [0, 1], {('L1', T1)}, set())
+
+    assert len(nuevas) == 1
+    assert [r["indice"] for r in rechazos] == [1]
+
+
+def test_sensor_desconocido():
+    filas = [_fila('L1', T1, sensor_id='NOEXISTE')]
+    nuevas, rechazos = ingesta.conciliar(filas, [0], set(), {'NOEXISTE'})
+
+    assert nuevas == []
+    assert rechazos[0]["errores"] == ["Sensor NOEXISTE no existe"]
+
+
+# Contra PostgreSQL (esquema de crear_tablas.sql y datos semilla). Escribe lecturas del
+# sensor SENS001, así que solo se ejecuta con IOT_TEST_DB=1 sobre una base desechable.
+@pytest.fixture
+def base_de_datos():
+    if os.getenv('IOT_TEST_DB') != '1':
+        pytest.skip("IOT_TEST_DB=1 para ejecutar contra PostgreSQL")
+    import db
+    return db
+
+
+def test_insertar_lote_garantiza_ids_unicos(base_de_datos):
+    db = base_de_datos
+    sufijo = datetime.now().strftime('%H%M%S%f')
+    a, b = f'TEST-A-{sufijo}', f'TEST-B-{sufijo}'
+
+    async def probar():
+        await db.init_pool()
+        try:
+            # Mismo id dos veces en el lote con timestamps distintos
+            filas = [_fila(a, T1), _fila(a, T2), _fila(b, T1)]
+            insertados, _ = await ingesta.insertar_lote(filas, [0, 1, 2])
+            nuevas, rechazos = ingesta.conciliar(filas, [0, 1, 2], insertados, set())
+            assert [f[0] for f in nuevas] == [a, b]
+            assert [r["indice"] for r in rechazos] == [1]
+
+            # Reenvío del mismo id con otro timestamp
+            filas = [_fila(b, T2)]
+            insertados, _ = await ingesta.insertar_lote(filas, [0])
+            assert insertados == set()
+
+            fila = await db.query_one(
+                "SELECT COUNT(*) AS total FROM lecturas WHERE id = ANY(%s)", [[a, b]]
+            )
+            assert fila['total'] == 2
+        finally:
+            await db.query("DELETE FROM lecturas WHERE id = ANY(%s)", [[a, b]])
+            await db.close_pool()
+
+    asyncio.run(probar())
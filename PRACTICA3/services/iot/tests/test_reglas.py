@@ -0,0 +1,55 @@
+"""Estado del motor de reglas con lotes concurrentes y lecturas rechazadas"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import ingesta
+from reglas import MotorCadenaFrio, Umbrales
+
+T0 = datetime(2025, 11, 20, 10, 0)
+
+
+@pytest.fixture
+def motor(monkeypatch):
+    motor = MotorCadenaFrio()
+    motor.umbrales['SENS001'] = Umbrales({
+        'umbral_alerta': -15, 'umbral_critico': -10, 'intervalo_lectura': 300, 'tipo_alimento': 'congelado'
+    })
+    monkeypatch.setattr(ingesta, 'motor', motor)
+    return motor
+
+
+def _fila(lectura_id, minutos, temperatura):
+    return (lectura_id, 'SENS001', 'VEH001', T0 + timedelta(minutes=minutos), temperatura,
+            40.4, -3.7, 650.0, None, None, None, None)
+
+
+def test_solo_se_confirma_el_estado_de_las_lecturas_insertadas(motor):
+    filas = [_fila('L1', 0, -12), _fila('L2', 5, -12)]
+    filas, indices, _, estados = ingesta.evaluar_lote(filas, [0, 1])
+
+    # L2 se rechazó como id duplicado: el sensor se queda en L1
+    motor.confirmar(estado for indice, estado in estados.items() if indice != 1)
+
+    assert motor.estados['SENS001'].timestamp == T0
+    assert motor.estados['SENS001'].tiempo_fuera_rango == 5
+
+
+def test_lotes_concurrentes_del_mismo_sensor_se_encadenan(motor):
+    async def lote(filas):
+        async with motor.bloquear(['SENS001']):
+            filas, indices, _, estados = ingesta.evaluar_lote(filas, list(range(len(filas))))
+            await asyncio.sleep(0)  # la inserción cede el bucle de eventos
+            motor.confirmar(estados.values())
+            return filas
+
+    async def probar():
+        return await asyncio.gather(lote([_fila('L1', 0, -12)]), lote([_fila('L2', 10, -12)]))
+
+    primero, segundo = asyncio.run(probar())
+
+    # El segundo lote parte del estado que confirmó el primero
+    assert primero[0][10] == 5
+    assert segundo[0][10] == 15
+    assert motor.estados['SENS001'].tiempo_fuera_rango == 15
@@ -0,0 +1,330 @@
+"""
+Generador de carga concurrente para los servicios IoT.
+
+Recorre uno a uno los endpoints del servicio elegido (PRACTICA3/services/iot o
+services/iot), lanzando N peticiones con C clientes concurrentes por endpoint, y
+guarda throughput y latencias p50/p95/p99 de cada uno en un JSON comparable entre
+ejecuciones (ver comparar.py). Las URLs se construyen con los ids del manifiesto
+que escribe flota.py y una semilla fija, así que dos ejecuciones piden lo mismo.
+
+    python carga.py --servicio practica3 --url http://localhost:8001 \
+        --manifiesto salida/manifiesto.json --peticiones 500 --concurrencia 20 \
+        --salida salida/resultados.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import platform
+import random
+import re
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import httpx
+
+
+def _fecha(texto):
+    return datetime.fromisoformat(texto.replace('Z', '+00:00'))
+
+
+def _iso(fecha):
+    return fecha.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class Contexto:
+    """Ids y rango temporal de la flota generada, compartidos por todos los endpoints"""
+
+    def __init__(self, manifiesto, lote=100):
+        self.vehiculos = manifiesto['vehiculos']
+        self.sensores = manifiesto['sensores']
+        # Solo en manifiestos recientes; sin ellos no se pueden generar escrituras coherentes
+        self.sensores_vehiculo = manifiesto.get('sensores_vehiculo')
+        self.posiciones = manifiesto.get('posiciones') or {}
+        self.desde = _fecha(manifiesto['desde'])
+        self.hasta = _fecha(manifiesto['hasta'])
+        self.lote = lote
+        # Las escrituras usan ids y timestamps nuevos en cada ejecución para no chocar con las anteriores
+        self.prefijo_escritura = f"LB{int(time.time())}"
+        self.escritas = 0
+
+    def vehiculo(self, rnd):
+        return rnd.choice(self.vehiculos)
+
+    def sensor(self, rnd):
+        return rnd.choice(self.sensores)
+
+    def ventana(self, rnd, horas=6):
+        """Intervalo [from, to] de `horas` dentro del rango de la flota"""
+        duracion = timedelta(hours=horas)
+        margen = max((self.hasta - self.desde - duracion).total_seconds(), 0)
+        inicio = self.desde + timedelta(seconds=rnd.uniform(0, margen))
+        return f"from={_iso(inicio)}&to={_iso(min(inicio + duracion, self.hasta))}"
+
+    def lote_lecturas(self, rnd):
+        """
+        Cuerpo de POST /lecturas/batch con lecturas nuevas posteriores a la flota. Cada
+        lectura va al vehículo de su sensor y cerca de la posición base del vehículo.
+        """
+        if not self.sensores_vehiculo:
+            raise ValueError("El manifiesto no tiene 'sensores_vehiculo': regenera la flota con flota.py")
+        lecturas = []
+        for _ in range(self.lote):
+            self.escritas += 1
+            sensor_id = self.sensor(rnd)
+            vehiculo_id = self.sensores_vehiculo[sensor_id]
+            lat, lon = self.posiciones.get(vehiculo_id, (40.4, -3.7))
+            lecturas.append({
+                "id": f"{self.prefijo_escritura}{self.escritas:07d}",
+                "sensorId": sensor_id,
+                "ubicacionId": vehiculo_id,
+                "timestamp": _iso(self.hasta + timedelta(seconds=self.escritas)),
+                "temperatura": round(rnd.uniform(-22, 8), 1),
+                "gps": {
+                    "latitud": round(lat + rnd.uniform(-0.01, 0.01), 7),
+                    "longitud": round(lon + rnd.uniform(-0.01, 0.01), 7),
+                    "altitud": round(rnd.uniform(5, 40))
+                },
+                "estado": "normal"
+            })
+        return lecturas
+
+
+class Endpoint:
+    """Endpoint a medir: `construir(rnd, contexto)` devuelve la URL (y el cuerpo en escrituras)"""
+    __slots__ = ("nombre", "metodo", "construir", "escritura")
+
+    def __init__(self, nombre, construir, metodo="GET", escritura=False):
+        self.nombre = nombre
+        self.metodo = metodo
+        self.construir = construir if callable(construir) else (lambda rnd, ctx, url=construir: url)
+        self.escritura = escritura
+
+
+def _bbox(rnd, ctx):
+    lat, lon = rnd.uniform(36.5, 43.5), rnd.uniform(-6, 2.5)
+    return f"/lecturas/mapa?bbox={lon - 0.5:.4f},{lat - 0.5:.4f},{lon + 0.5:.4f},{lat + 0.5:.4f}"
+
+
+# PRACTICA3/services/iot/main.py. Sin /alertas/stream (SSE sin fin) ni los endpoints que
+# modifican geocercas o la caché, que alterarían las mediciones del resto.
+ENDPOINTS_PRACTICA3 = [
+    Endpoint("GET /", "/"),
+    Endpoint("GET /health", "/health"),
+    Endpoint("GET /sensores", "/sensores"),
+    Endpoint("GET /sensores?tipoAlimento", lambda rnd, ctx: f"/sensores?tipoAlimento={rnd.choice(('congelado', 'refrigerado', 'delicado'))}"),
+    Endpoint("GET /sensores/{sensor_id}", lambda rnd, ctx: f"/sensores/{ctx.sensor(rnd)}"),
+    Endpoint("GET /lecturas", "/lecturas?limit=100"),
+    Endpoint("GET /lecturas?sensorId", lambda rnd, ctx: f"/lecturas?sensorId={ctx.sensor(rnd)}&limit=100"),
+    Endpoint("GET /lecturas?ubicacionId&from&to", lambda rnd, ctx: f"/lecturas?ubicacionId={ctx.vehiculo(rnd)}&{ctx.ventana(rnd)}&limit=500"),
+    Endpoint("GET /lecturas/alertas", "/lecturas/alertas?limit=100"),
+    Endpoint("GET /lecturas/cadena-rota", "/lecturas/cadena-rota?limit=100"),
+    Endpoint("GET /lecturas/export", lambda rnd, ctx: f"/lecturas/export?ubicacionId={ctx.vehiculo(rnd)}&{ctx.ventana(rnd, 24)}"),
+    Endpoint("GET /lecturas/estadisticas/{ubicacion_id}", lambda rnd, ctx: f"/lecturas/estadisticas/{ctx.vehiculo(rnd)}"),
+    Endpoint("GET /lecturas/estadisticas/{ubicacion_id}?from&to", lambda rnd, ctx: f"/lecturas/estadisticas/{ctx.vehiculo(rnd)}?{ctx.ventana(rnd)}"),
+    Endpoint("GET /lecturas/series?ubicacionId", lambda rnd, ctx: f"/lecturas/series?ubicacionId={ctx.vehiculo(rnd)}&{ctx.ventana(rnd, 24)}&bucket=1h"),
+    Endpoint("GET /lecturas/series?sensorId", lambda rnd, ctx: f"/lecturas/series?sensorId={ctx.sensor(rnd)}&{ctx.ventana(rnd, 24)}"),
+    Endpoint("GET /lecturas/tracking/{ubicacion_id}", lambda rnd, ctx: f"/lecturas/tracking/{ctx.vehiculo(rnd)}"),
+    Endpoint("GET /lecturas/tracking/{ubicacion_id}?max_points", lambda rnd, ctx: f"/lecturas/tracking/{ctx.vehiculo(rnd)}?{ctx.ventana(rnd, 24)}&max_points=200"),
+    Endpoint("GET /lecturas/mapa", "/lecturas/mapa"),
+    Endpoint("GET /lecturas/mapa?bbox", _bbox),
+    Endpoint("GET /vehiculos", "/vehiculos"),
+    Endpoint("GET /vehiculos/estado-cadena", "/vehiculos/estado-cadena"),
+    Endpoint("GET /vehiculos/{vehiculo_id}", lambda rnd, ctx: f"/vehiculos/{ctx.vehiculo(rnd)}"),
+    Endpoint("GET /vehiculos/{vehiculo_id}/estado-cadena", lambda rnd, ctx: f"/vehiculos/{ctx.vehiculo(rnd)}/estado-cadena"),
+    Endpoint("GET /geocercas", "/geocercas"),
+    Endpoint("GET /dashboard/resumen", "/dashboard/resumen"),
+    Endpoint("GET /alertas/stats", "/alertas/stats"),
+    Endpoint("GET /cache/stats", "/cache/stats"),
+    Endpoint("GET /pool/stats", "/pool/stats"),
+    Endpoint("GET /metrics", "/metrics"),
+    Endpoint("GET /metrics/consultas", "/metrics/consultas"),
+    Endpoint("POST /lecturas/batch", lambda rnd, ctx: ("/lecturas/batch", ctx.lote_lecturas(rnd)), metodo="POST", escritura=True)
+]
+
+# services/iot/routes
+ENDPOINTS_JSON = [
+    Endpoint("GET /sensores", "/sensores"),
+    Endpoint("GET /sensores?tipo", lambda rnd, ctx: f"/sensores?tipo={rnd.choice(('congelado', 'refrigerado', 'delicado'))}"),
+    Endpoint("GET /sensores/{sensor_id}", lambda rnd, ctx: f"/sensores/{ctx.sensor(rnd)}"),
+    Endpoint("GET /lecturas", "/lecturas?limit=100"),
+    Endpoint("GET /lecturas?sensorId", lambda rnd, ctx: f"/lecturas?sensorId={ctx.sensor(rnd)}&limit=100"),
+    Endpoint("GET /lecturas?ubicacionId&from&to", lambda rnd, ctx: f"/lecturas?ubicacionId={ctx.vehiculo(rnd)}&{ctx.ventana(rnd)}&limit=500"),
+    Endpoint("GET /lecturas/estadisticas/{ubicacion_id}", lambda rnd, ctx: f"/lecturas/estadisticas/{ctx.vehiculo(rnd)}"),
+    Endpoint("GET /lecturas/estadisticas/{ubicacion_id}?from&to", lambda rnd, ctx: f"/lecturas/estadisticas/{ctx.vehiculo(rnd)}?{ctx.ventana(rnd)}"),
+    Endpoint("GET /lecturas/tracking/{ubicacion_id}", lambda rnd, ctx: f"/lecturas/tracking/{ctx.vehiculo(rnd)}"),
+    Endpoint("GET /lecturas/tracking/{ubicacion_id}?from&to", lambda rnd, ctx: f"/lecturas/tracking/{ctx.vehiculo(rnd)}?{ctx.ventana(rnd, 24)}&limit=500"),
+    Endpoint("GET /vehiculos", "/vehiculos"),
+    Endpoint("GET /vehiculos/{vehiculo_id}", lambda rnd, ctx: f"/vehiculos/{ctx.vehiculo(rnd)}")
+]
+
+SERVICIOS = {
+    "practica3": ENDPOINTS_PRACTICA3,
+    "json": ENDPOINTS_JSON
+}
+
+
+def percentil(ordenadas, q):
+    """Percentil por rango más cercano sobre una lista ordenada"""
+    if not ordenadas:
+        return 0.0
+    return ordenadas[max(math.ceil(q * len(ordenadas)) - 1, 0)]
+
+
+async def medir_endpoint(cliente, endpoint, contexto, peticiones, concurrencia, calentamiento, semilla):
+    """Lanza `peticiones` peticiones con `concurrencia` clientes; devuelve el resumen del endpoint"""
+    # Generador propio por endpoint: las URLs no dependen del orden ni de los filtros
+    rnd = random.Random(f"{semilla}:{endpoint.nombre}")
+    latencias = []
+    codigos = Counter()
+    excepciones = Counter()
+    transcurrido = 0.0
+
+    async def una(registrar):
+        destino = endpoint.construir(rnd, contexto)
+        url, cuerpo = destino if isinstance(destino, tuple) else (destino, None)
+        inicio = time.perf_counter()
+        try:
+            respuesta = await cliente.request(endpoint.metodo, url, json=cuerpo)
+            codigo = respuesta.status_code
+        except httpx.HTTPError as e:
+            codigo = None
+            if registrar:
+                excepciones[type(e).__name__] += 1
+        duracion = time.perf_counter() - inicio
+        if registrar and codigo is not None:
+            codigos[codigo] += 1
+            latencias.append(duracion)
+
+    async def trabajador(turnos, registrar):
+        for _ in turnos:
+            await una(registrar)
+
+    for registrar, total in ((False, calentamiento), (True, peticiones)):
+        if not total:
+            continue
+        # Iterador compartido: cada trabajador toma la siguiente petición libre
+        turnos = iter(range(total))
+        inicio = time.perf_counter()
+        await asyncio.gather(*(trabajador(turnos, registrar) for _ in range(min(concurrencia, total))))
+        transcurrido = time.perf_counter() - inicio
+
+    latencias.sort()
+    completadas = len(latencias)
+    errores = sum(n for codigo, n in codigos.items() if codigo >= 400) + sum(excepciones.values())
+    ms = lambda segundos: round(segundos * 1000, 3)
+    return {
+        "nombre": endpoint.nombre,
+        "metodo": endpoint.metodo,
+        "peticiones": peticiones,
+        "completadas": completadas,
+        "errores": errores,
+        "codigos": {str(c): n for c, n in sorted(codigos.items())},
+        "excepciones": dict(excepciones),
+        "duracion_s": round(transcurrido, 3),
+        "rps": round(completadas / transcurrido, 2) if transcurrido else 0,
+        "latencia_ms": {
+            "media": ms(sum(latencias) / completadas) if completadas else 0,
+            "min": ms(latencias[0]) if completadas else 0,
+            "p50": ms(percentil(latencias, 0.50)),
+            "p95": ms(percentil(latencias, 0.95)),
+            "p99": ms(percentil(latencias, 0.99)),
+            "max": ms(latencias[-1]) if completadas else 0
+        }
+    }
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def ejecutar(args, endpoints, manifiesto):
+    contexto = Contexto(manifiesto, lote=args.lote)
+    limites = httpx.Limits(max_connections=args.concurrencia, max_keepalive_connections=args.concurrencia)
+    resultados = []
+    async with httpx.AsyncClient(base_url=args.url, limits=limites, timeout=args.timeout) as cliente:
+        for endpoint in endpoints:
+            resultado = await medir_endpoint(
+                cliente, endpoint, contexto, args.peticiones, args.concurrencia, args.calentamiento, args.semilla
+            )
+            resultados.append(resultado)
+            lat = resultado["latencia_ms"]
+            print(f"{endpoint.nombre:<58} {resultado['rps']:>9.1f} rps  p50 {lat['p50']:>8.2f}  "
+                  f"p95 {lat['p95']:>8.2f}  p99 {lat['p99']:>8.2f} ms  errores {resultado['errores']}",
+                  file=sys.stderr)
+    return resultados
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prueba de carga por endpoint de los servicios IoT")
+    parser.add_argument('--servicio', choices=sorted(SERVICIOS), default='practica3')
+    parser.add_argument('--url', default='http://localhost:8001')
+    parser.add_argument('--manifiesto', default='salida/manifiesto.json', help="Manifiesto escrito por flota.py")
+    parser.add_argument('--peticiones', type=int, default=200, help="Peticiones medidas por endpoint")
+    parser.add_argument('--concurrencia', type=int, default=10)
+    parser.add_argument('--calentamiento', type=int, default=20, help="Peticiones previas no medidas por endpoint")
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--endpoints', help="Expresión regular sobre el nombre de los endpoints a medir")
+    parser.add_argument('--escrituras', action='store_true', help="Incluye POST /lecturas/batch (inserta lecturas nuevas)")
+    parser.add_argument('--lote', type=int, default=100, help="Lecturas por POST /lecturas/batch")
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--etiqueta', help="Texto libre para identificar la ejecución")
+    parser.add_argument('--listar', action='store_true', help="Muestra los endpoints y termina")
+    parser.add_argument('--salida', default='salida/resultados.json')
+    args = parser.parse_args(argv)
+
+    endpoints = [e for e in SERVICIOS[args.servicio] if args.escrituras or not e.escritura]
+    if args.endpoints:
+        patron = re.compile(args.endpoints)
+        endpoints = [e for e in endpoints if patron.search(e.nombre)]
+    if args.listar:
+        for e in endpoints:
+            print(e.nombre)
+        return
+    if not endpoints:
+        parser.error("Ningún endpoint coincide con el filtro")
+
+    with open(args.manifiesto, encoding='utf-8') as f:
+        manifiesto = json.load(f)
+    if args.escrituras and 'sensores_vehiculo' not in manifiesto:
+        parser.error("El manifiesto no incluye 'sensores_vehiculo'; regenera la flota con flota.py para usar --escrituras")
+
+    inicio = datetime.now(timezone.utc)
+    resultados = asyncio.run(ejecutar(args, endpoints, manifiesto))
+
+    informe = {
+        "version": 1,
+        "etiqueta": args.etiqueta,
+        "fecha": inicio.isoformat(),
+        "commit": _commit(),
+        "servicio": args.servicio,
+        "url": args.url,
+        "entorno": {"python": platform.python_version(), "plataforma": platform.platform()},
+        "config": {
+            "peticiones": args.peticiones,
+            "concurrencia": args.concurrencia,
+            "calentamiento": args.calentamiento,
+            "escrituras": args.escrituras,
+            "lote": args.lote,
+            "semilla": args.semilla
+        },
+        "flota": {**manifiesto["parametros"], "semilla": manifiesto["semilla"], "total_lecturas": manifiesto["total_lecturas"]},
+        "endpoints": resultados
+    }
+    salida = Path(args.salida)
+    salida.parent.mkdir(parents=True, exist_ok=True)
+    salida.write_text(json.dumps(informe, indent=2, ensure_ascii=False), encoding='utf-8')
+    print(f"✅ Resultados en {salida}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
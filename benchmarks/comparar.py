@@ -0,0 +1,87 @@
+"""
+Compara dos ejecuciones de carga.py endpoint a endpoint.
+
+Marca como regresión los endpoints cuyo p50, p95 o p99 empeora, o cuyo throughput
+baja, más del umbral indicado. Sale con código 1 si hay alguna regresión, para
+poder usarlo en un script o en CI.
+
+    python comparar.py salida/base.json salida/resultados.json --umbral 10
+"""
+import argparse
+import json
+import sys
+
+METRICAS = ("p50", "p95", "p99")
+
+
+def _cambio(antes, despues):
+    """Variación relativa en %; None si no hay referencia"""
+    if not antes:
+        return None
+    return (despues - antes) / antes * 100
+
+
+def comparar(base, nuevo, umbral):
+    """Devuelve (filas, regresiones) por endpoint común a las dos ejecuciones"""
+    previos = {e["nombre"]: e for e in base["endpoints"]}
+    filas = []
+    regresiones = []
+    for actual in nuevo["endpoints"]:
+        anterior = previos.get(actual["nombre"])
+        if anterior is None:
+            continue
+        fila = {"nombre": actual["nombre"], "regresion": []}
+        for metrica in METRICAS:
+            cambio = _cambio(anterior["latencia_ms"][metrica], actual["latencia_ms"][metrica])
+            fila[metrica] = (anterior["latencia_ms"][metrica], actual["latencia_ms"][metrica], cambio)
+            if cambio is not None and cambio > umbral:
+                fila["regresion"].append(metrica)
+        cambio = _cambio(anterior["rps"], actual["rps"])
+        fila["rps"] = (anterior["rps"], actual["rps"], cambio)
+        if cambio is not None and cambio < -umbral:
+            fila["regresion"].append("rps")
+        if actual["errores"] > anterior["errores"]:
+            fila["regresion"].append("errores")
+        filas.append(fila)
+        if fila["regresion"]:
+            regresiones.append(fila)
+    return filas, regresiones
+
+
+def _formatear(valores):
+    antes, despues, cambio = valores
+    signo = "" if cambio is None else f" ({cambio:+.1f}%)"
+    return f"{antes:.2f}→{despues:.2f}{signo}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compara dos resultados de carga.py")
+    parser.add_argument('base')
+    parser.add_argument('nuevo')
+    parser.add_argument('--umbral', type=float, default=10, help="Empeoramiento máximo tolerado en %%")
+    args = parser.parse_args(argv)
+
+    with open(args.base, encoding='utf-8') as f:
+        base = json.load(f)
+    with open(args.nuevo, encoding='utf-8') as f:
+        nuevo = json.load(f)
+
+    if base.get("config") != nuevo.get("config") or base.get("flota") != nuevo.get("flota"):
+        print("⚠️  Las ejecuciones usan configuración o flota distintas; la comparación puede no ser válida")
+
+    filas, regresiones = comparar(base, nuevo, args.umbral)
+    print(f"{base.get('commit') or base['fecha']} → {nuevo.get('commit') or nuevo['fecha']}")
+    for fila in filas:
+        marca = "❌" if fila["regresion"] else "  "
+        print(f"{marca} {fila['nombre']:<58} " + "  ".join(
+            f"{m} {_formatear(fila[m])}" for m in METRICAS + ("rps",)
+        ))
+
+    if regresiones:
+        print(f"\n{len(regresiones)} endpoint(s) empeoran más de un {args.umbral:g}%")
+        sys.exit(1)
+    print(f"\n✅ Sin regresiones por encima del {args.umbral:g}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+"""
+Generador de una flota sintética para las pruebas de carga.
+
+Crea vehículos, sensores por vehículo y lecturas por sensor con la misma forma que
+los datos reales (schemas/*.schema.json y PRACTICA3/database/crear_tablas.sql) y
+los escribe en los JSON de services/iot o en PostgreSQL (PRACTICA3). Con la misma
+semilla y los mismos parámetros se obtienen exactamente los mismos datos.
+
+    python flota.py --destino json --dir salida/datos --vehiculos 50 --lecturas-por-sensor 500
+    python flota.py --destino postgres --limpiar --vehiculos 200 --lecturas-por-sensor 2000
+
+Junto a los datos se escribe un manifiesto (ids y rango temporal) que usa carga.py
+para construir las URLs.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+# Mismos tipos y umbrales que datos_semilla.sql; minutos máximos fuera de rango como reglas.py
+TIPOS = {
+    "congelado": {"rangoMin": -22, "rangoMax": -18, "umbralAlerta": -15, "umbralCritico": -12,
+                  "intervaloLectura": 300, "tiempoMaximo": 15},
+    "refrigerado": {"rangoMin": 0, "rangoMax": 4, "umbralAlerta": 4, "umbralCritico": 7,
+                    "intervaloLectura": 300, "tiempoMaximo": 30},
+    "delicado": {"rangoMin": 0, "rangoMax": 2, "umbralAlerta": 2, "umbralCritico": 3,
+                 "intervaloLectura": 180, "tiempoMaximo": 15}
+}
+ZONAS = {"congelado": "Congelados", "refrigerado": "Refrigerados", "delicado": "Delicados"}
+
+# Ciudades de salida de las rutas (latitud, longitud)
+BASES = [
+    (37.3886, -5.9845),   # Sevilla
+    (40.4168, -3.7038),   # Madrid
+    (41.3874, 2.1686),    # Barcelona
+    (39.4699, -0.3763),   # Valencia
+    (36.7213, -4.4214),   # Málaga
+    (43.2630, -2.9350)    # Bilbao
+]
+
+LETRAS_MATRICULA = "BCDFGHJKLMNPRSTVWXYZ"
+
+# Fin por defecto fijo para que dos ejecuciones generen las mismas lecturas
+FIN_POR_DEFECTO = "2025-11-22T12:00:00Z"
+
+
+def _parsear_fecha(texto):
+    fecha = datetime.fromisoformat(texto.replace('Z', '+00:00'))
+    if fecha.tzinfo is not None:
+        fecha = fecha.astimezone(timezone.utc).replace(tzinfo=None)
+    return fecha
+
+
+def _iso(fecha):
+    return fecha.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class Flota:
+    """Flota determinista a partir de una semilla; las lecturas se generan en streaming"""
+
+    def __init__(self, vehiculos=10, sensores_por_vehiculo=3, lecturas_por_sensor=100,
+                 tasa_alerta=0.05, tasa_critico=0.01, fin=FIN_POR_DEFECTO, semilla=42):
+        if tasa_alerta < 0 or tasa_critico < 0 or tasa_alerta + tasa_critico > 1:
+            raise ValueError("Las tasas de alerta y crítico deben sumar como mucho 1")
+        self.n_vehiculos = vehiculos
+        self.sensores_por_vehiculo = sensores_por_vehiculo
+        self.lecturas_por_sensor = lecturas_por_sensor
+        self.tasa_alerta = tasa_alerta
+        self.tasa_critico = tasa_critico
+        self.fin = _parsear_fecha(fin)
+        self.semilla = semilla
+
+        ancho_v = max(3, len(str(vehiculos)))
+        ancho_s = max(3, len(str(vehiculos * sensores_por_vehiculo)))
+        self.ancho_lectura = max(7, len(str(vehiculos * sensores_por_vehiculo * lecturas_por_sensor)))
+
+        rnd = random.Random(semilla)
+        tipos = list(TIPOS)
+        self.vehiculos = []
+        self.sensores = []
+        for v in range(1, vehiculos + 1):
+            lat, lon = rnd.choice(BASES)
+            vehiculo_id = f"VEH{v:0{ancho_v}d}"
+            self.vehiculos.append({
+                "id": vehiculo_id,
+                "matricula": f"{v:04d}{''.join(rnd.choice(LETRAS_MATRICULA) for _ in range(3))}",
+                "capacidadKg": rnd.choice((2000, 2500, 2800, 3000, 3500)),
+                "gps": f"{lat + rnd.uniform(-0.05, 0.05):.4f},{lon + rnd.uniform(-0.05, 0.05):.4f}",
+                "temperatura": round(rnd.uniform(-20, 5), 1)
+            })
+            for k in range(sensores_por_vehiculo):
+                tipo = tipos[k % len(tipos)]
+                umbrales = TIPOS[tipo]
+                zona = ZONAS[tipo] if k < len(tipos) else f"{ZONAS[tipo]} {k // len(tipos) + 1}"
+                self.sensores.append({
+                    "id": f"SENS{len(self.sensores) + 1:0{ancho_s}d}",
+                    "nombre": f"Sensor Vehículo {v} - Zona {zona}",
+                    "ubicacionId": vehiculo_id,
+                    "tipoProducto": tipo,
+                    "rangoMin": umbrales["rangoMin"],
+                    "rangoMax": umbrales["rangoMax"],
+                    "umbralAlerta": umbrales["umbralAlerta"],
+                    "umbralCritico": umbrales["umbralCritico"],
+                    "intervaloLectura": umbrales["intervaloLectura"]
+                })
+
+        intervalo_max = max(TIPOS[s["tipoProducto"]]["intervaloLectura"] for s in self.sensores) if self.sensores else 300
+        self.inicio = self.fin - timedelta(seconds=intervalo_max * max(lecturas_por_sensor - 1, 0))
+
+    @property
+    def total_lecturas(self):
+        return len(self.sensores) * self.lecturas_por_sensor
+
+    def _temperatura(self, rnd, umbrales):
+        """Temperatura dentro de rango, en alerta o crítica según las tasas configuradas"""
+        sorteo = rnd.random()
+        if sorteo < self.tasa_critico:
+            return round(umbrales["umbralCritico"] + rnd.uniform(0.1, 4), 1)
+        if sorteo < self.tasa_critico + self.tasa_alerta:
+            return round(rnd.uniform(umbrales["umbralAlerta"] + 0.1, umbrales["umbralCritico"]), 1)
+        return round(rnd.uniform(umbrales["rangoMin"], umbrales["rangoMax"]), 1)
+
+    def lecturas(self):
+        """
+        Genera las lecturas sensor a sensor y en orden temporal. Estado, alerta y
+        tiempo fuera de rango siguen las mismas reglas que el motor del servicio.
+        """
+        numero = 0
+        por_vehiculo = {}
+        for s in self.sensores:
+            por_vehiculo.setdefault(s["ubicacionId"], []).append(s)
+
+        for vehiculo in self.vehiculos:
+            # Las lecturas de un vehículo comparten la ruta GPS (paseo aleatorio desde su base)
+            rnd = random.Random(f"{self.semilla}:{vehiculo['id']}")
+            lat, lon = (float(v) for v in vehiculo["gps"].split(','))
+            ruta = []
+            for _ in range(self.lecturas_por_sensor):
+                lat = min(max(lat + rnd.uniform(-0.002, 0.002), -90), 90)
+                lon = min(max(lon + rnd.uniform(-0.002, 0.002), -180), 180)
+                ruta.append((round(lat, 7), round(lon, 7), round(rnd.uniform(5, 40))))
+
+            for sensor in por_vehiculo.get(vehiculo["id"], ()):
+                umbrales = TIPOS[sensor["tipoProducto"]]
+                intervalo = sensor["intervaloLectura"]
+                minutos = round(intervalo / 60)
+                primera = self.fin - timedelta(seconds=intervalo * (self.lecturas_por_sensor - 1))
+                tiempo = 0
+                for i, (latitud, longitud, altitud) in enumerate(ruta):
+                    numero += 1
+                    temperatura = self._temperatura(rnd, umbrales)
+                    if temperatura > umbrales["umbralCritico"]:
+                        estado = "critico"
+                    elif temperatura > umbrales["umbralAlerta"]:
+                        estado = "alerta"
+                    else:
+                        estado = "normal"
+                    tiempo = tiempo + minutos if estado != "normal" else 0
+                    yield {
+                        "id": f"LECT{numero:0{self.ancho_lectura}d}",
+                        "sensorId": sensor["id"],
+                        "ubicacionId": vehiculo["id"],
+                        "timestamp": _iso(primera + timedelta(seconds=intervalo * i)),
+                        "temperatura": temperatura,
+                        "gps": {"latitud": latitud, "longitud": longitud, "altitud": altitud},
+                        "estado": estado,
+                        "alertaActiva": estado != "normal",
+                        "tiempoFueraRango": tiempo,
+                        "cadenRota": tiempo > umbrales["tiempoMaximo"]
+                    }
+
+    def manifiesto(self, destino):
+        return {
+            "destino": destino,
+            "semilla": self.semilla,
+            "parametros": {
+                "vehiculos": self.n_vehiculos,
+                "sensores_por_vehiculo": self.sensores_por_vehiculo,
+                "lecturas_por_sensor": self.lecturas_por_sensor,
+                "tasa_alerta": self.tasa_alerta,
+                "tasa_critico": self.tasa_critico
+            },
+            "desde": _iso(self.inicio),
+            "hasta": _iso(self.fin),
+            "total_lecturas": self.total_lecturas,
+            "vehiculos": [v["id"] for v in self.vehiculos],
+            "sensores": [s["id"] for s in self.sensores],
+            # Vehículo de cada sensor y posición base de cada vehículo, para que las
+            # escrituras de carga.py sean coherentes con la flota
+            "sensores_vehiculo": {s["id"]: s["ubicacionId"] for s in self.sensores},
+            "posiciones": {v["id"]: [float(c) for c in v["gps"].split(',')] for v in self.vehiculos},
+            "siguiente_lectura": self.total_lecturas + 1
+        }
+
+
+# ---------- destino JSON (services/iot) ----------
+
+def _escribir_array(ruta, elementos):
+    """Escribe un array JSON elemento a elemento, sin construir la lista en memoria"""
+    with open(ruta, 'w', encoding='utf-8') as f:
+        f.write('[')
+        for i, elemento in enumerate(elementos):
+            f.write(',\n  ' if i else '\n  ')
+            f.write(json.dumps(elemento, ensure_ascii=False))
+        f.write('\n]\n')
+
+
+def escribir_json(flota, directorio):
+    directorio = Path(directorio)
+    directorio.mkdir(parents=True, exist_ok=True)
+    _escribir_array(directorio / 'vehiculos.json', flota.vehiculos)
+    _escribir_array(directorio / 'sensores.json', flota.sensores)
+    _escribir_array(directorio / 'lecturas.json', flota.lecturas())
+
+
+# ---------- destino PostgreSQL (PRACTICA3) ----------
+
+def conninfo():
+    """Misma configuración de conexión que PRACTICA3/services/iot/db.py"""
+    import psycopg
+    return psycopg.conninfo.make_conninfo(
+        host=os.getenv('DB_HOST', 'localhost'),
+        port=os.getenv('DB_PORT', '5432'),
+        dbname=os.getenv('DB_NAME', 'freshgo'),
+        user=os.getenv('DB_USER', 'postgres'),
+        password=os.getenv('DB_PASSWORD')
+    )
+
+
+def escribir_postgres(flota, limpiar=False):
+    import psycopg
+
+    with psycopg.connect(conninfo()) as conn:
+        with conn.cursor() as cur:
+            if limpiar:
+                cur.execute("""
+                    TRUNCATE TABLE lecturas_rollup_ubicacion, lecturas_rollup_sensor,
+                                   lecturas_ultimas, lecturas, sensores, vehiculos CASCADE
+                """)
+
+            # Particiones mensuales que cubren todo el rango generado
+            mes = flota.inicio.replace(day=1, hour=0, minute=0, second=0)
+            while mes <= flota.fin:
+                cur.execute("SELECT crear_particion_lecturas(%s)", [mes])
+                mes = (mes + timedelta(days=32)).replace(day=1)
+
+            with cur.copy("COPY vehiculos (id, matricula, capacidad_kg, gps, temperatura) FROM STDIN") as copy:
+                for v in flota.vehiculos:
+                    copy.write_row((v["id"], v["matricula"], v["capacidadKg"], v["gps"], v["temperatura"]))
+
+            with cur.copy("""
+                COPY sensores (id, nombre, ubicacion_id, tipo_alimento, rango_min, rango_max,
+                               umbral_alerta, umbral_critico, intervalo_lectura) FROM STDIN
+            """) as copy:
+                for s in flota.sensores:
+                    copy.write_row((
+                        s["id"], s["nombre"], s["ubicacionId"], s["tipoProducto"], s["rangoMin"],
+                        s["rangoMax"], s["umbralAlerta"], s["umbralCritico"], s["intervaloLectura"]
+                    ))
+
+            with cur.copy("""
+                COPY lecturas (id, sensor_id, ubicacion_id, timestamp, temperatura, latitud, longitud,
+                               altitud, estado, alerta_activa, tiempo_fuera_rango, cadena_rota) FROM STDIN
+            """) as copy:
+                for l in flota.lecturas():
+                    gps = l["gps"]
+                    copy.write_row((
+                        l["id"], l["sensorId"], l["ubicacionId"], _parsear_fecha(l["timestamp"]),
+                        l["temperatura"], gps["latitud"], gps["longitud"], gps["altitud"], l["estado"],
+                        l["alertaActiva"], l["tiempoFueraRango"], l["cadenRota"]
+                    ))
+
+            cur.execute("ANALYZE lecturas")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera una flota sintética para las pruebas de carga")
+    parser.add_argument('--destino', choices=('json', 'postgres'), default='json')
+    parser.add_argument('--dir', default='salida/datos', help="Directorio de los JSON (destino json)")
+    parser.add_argument('--manifiesto', help="Ruta del manifiesto (por defecto <dir>/manifiesto.json o salida/manifiesto.json)")
+    parser.add_argument('--limpiar', action='store_true', help="Vacía las tablas IoT antes de cargar (destino postgres)")
+    parser.add_argument('--vehiculos', type=int, default=10)
+    parser.add_argument('--sensores-por-vehiculo', type=int, default=3)
+    parser.add_argument('--lecturas-por-sensor', type=int, default=100)
+    parser.add_argument('--tasa-alerta', type=float, default=0.05)
+    parser.add_argument('--tasa-critico', type=float, default=0.01)
+    parser.add_argument('--fin', default=FIN_POR_DEFECTO, help="Timestamp de la última lectura (ISO 8601)")
+    parser.add_argument('--semilla', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    try:
+        flota = Flota(
+            vehiculos=args.vehiculos,
+            sensores_por_vehiculo=args.sensores_por_vehiculo,
+            lecturas_por_sensor=args.lecturas_por_sensor,
+            tasa_alerta=args.tasa_alerta,
+            tasa_critico=args.tasa_critico,
+            fin=args.fin,
+            semilla=args.semilla
+        )
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.destino == 'json':
+        escribir_json(flota, args.dir)
+        manifiesto = Path(args.manifiesto or Path(args.dir) / 'manifiesto.json')
+    else:
+        escribir_postgres(flota, limpiar=args.limpiar)
+        manifiesto = Path(args.manifiesto or 'salida/manifiesto.json')
+
+    manifiesto.parent.mkdir(parents=True, exist_ok=True)
+    manifiesto.write_text(json.dumps(flota.manifiesto(args.destino), indent=2), encoding='utf-8')
+    print(f"✅ {len(flota.vehiculos)} vehículos, {len(flota.sensores)} sensores, "
+          f"{flota.total_lecturas} lecturas -> {args.destino} (manifiesto: {manifiesto})", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
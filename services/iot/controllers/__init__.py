@@ -1,14 +1,11 @@
 """CONTROLLERS - Lógica de negocio"""
 from dateutil import parser as date_parser
+from data import epoch
 
 class SensorController:
     @staticmethod
     def get_all(data, tipo=None, ubicacionId=None, validator=None):
-        filtered = data['sensores']
-        if tipo:
-            filtered = [s for s in filtered if s.get('tipo') == tipo]
-        if ubicacionId:
-            filtered = [s for s in filtered if s.get('ubicacionId') == ubicacionId]
+        filtered = data.filtrar_sensores(tipo=tipo, ubicacionId=ubicacionId)
         for sensor in filtered:
             if not validator.validate_sensor(sensor):
                 return {'error': 'Datos no conformes con el schema', 'status': 500}
@@ -16,60 +13,75 @@ class SensorController:
 
     @staticmethod
     def get_by_id(data, sensor_id, validator):
-        sensor = next((s for s in data['sensores'] if s['id'] == sensor_id), None)
+        sensor = data.get_sensor(sensor_id)
         if not sensor:
             return {'error': 'Sensor no encontrado', 'status': 404}
         if not validator.validate_sensor(sensor):
             return {'error': 'Datos no conformes con el schema', 'status': 500}
         return sensor
 
+def parse_rango(from_date, to_date):
+    """Convierte from/to ISO 8601 a epochs; devuelve (desde, hasta, error)"""
+    desde = None
+    hasta = None
+    
+    if from_date:
+        try:
+            desde = epoch(date_parser.isoparse(from_date))
+        except ValueError:
+            return None, None, {'error': "Formato de fecha 'from' inválido. Use ISO 8601", 'status': 400}
+    
+    if to_date:
+        try:
+            hasta = epoch(date_parser.isoparse(to_date))
+        except ValueError:
+            return None, None, {'error': "Formato de fecha 'to' inválido. Use ISO 8601", 'status': 400}
+    
+    if desde is not None and hasta is not None and desde > hasta:
+        return None, None, {'error': "La fecha 'from' debe ser anterior a 'to'", 'status': 400}
+    
+    return desde, hasta, None
+
 class LecturaController:
     @staticmethod
     def get_all(data, sensorId=None, ubicacionId=None, from_date=None, to_date=None, limit=100, validator=None):
-        filtered = data['lecturas']
-        if sensorId:
-            filtered = [l for l in filtered if l.get('sensorId') == sensorId]
-        if ubicacionId:
-            filtered = [l for l in filtered if l.get('ubicacionId') == ubicacionId]
-        
-        from_dt = None
-        to_dt = None
-        
-        if from_date:
-            try:
-                from_dt = date_parser.isoparse(from_date)
-            except ValueError:
-                return {'error': "Formato de fecha 'from' inválido. Use ISO 8601", 'status': 400}
-        
-        if to_date:
-            try:
-                to_dt = date_parser.isoparse(to_date)
-            except ValueError:
-                return {'error': "Formato de fecha 'to' inválido. Use ISO 8601", 'status': 400}
-        
-        if from_dt and to_dt and from_dt > to_dt:
-            return {'error': "La fecha 'from' debe ser anterior a 'to'", 'status': 400}
+        desde, hasta, error = parse_rango(from_date, to_date)
+        if error:
+            return error
         
-        if from_dt or to_dt:
-            date_filtered = []
-            for lectura in filtered:
-                timestamp_str = lectura.get('timestamp')
-                if timestamp_str:
-                    timestamp = date_parser.isoparse(timestamp_str)
-                    if from_dt and timestamp < from_dt:
-                        continue
-                    if to_dt and timestamp > to_dt:
-                        continue
-                    date_filtered.append(lectura)
-            filtered = date_filtered
-        
-        filtered = filtered[:limit]
+        filtered = data.filtrar_lecturas(
+            sensorId=sensorId,
+            ubicacionId=ubicacionId,
+            desde=desde,
+            hasta=hasta,
+            limit=limit
+        )
         for lectura in filtered:
             if not validator.validate_lectura(lectura):
                 return {'error': 'Datos no conformes con el schema', 'status': 500}
         
         return {"total": len(filtered), "limit": limit, "data": filtered}
 
+    @staticmethod
+    def get_estadisticas(data, ubicacion_id, from_date=None, to_date=None):
+        desde, hasta, error = parse_rango(from_date, to_date)
+        if error:
+            return error
+        estadisticas = data.estadisticas_ubicacion(ubicacion_id, desde, hasta)
+        if estadisticas is None:
+            return {'error': f'No hay lecturas para la ubicación {ubicacion_id}', 'status': 404}
+        return estadisticas
+
+    @staticmethod
+    def get_tracking(data, ubicacion_id, from_date=None, to_date=None, limit=50):
+        desde, hasta, error = parse_rango(from_date, to_date)
+        if error:
+            return error
+        puntos = data.tracking_ubicacion(ubicacion_id, desde, hasta, limit)
+        if not puntos:
+            return {'error': f'No hay lecturas para la ubicación {ubicacion_id}', 'status': 404}
+        return {"ubicacionId": ubicacion_id, "total_puntos": len(puntos), "puntos": puntos}
+
 class VehiculoController:
     @staticmethod
     def get_all(data, validator):
@@ -80,7 +92,7 @@ class VehiculoController:
 
     @staticmethod
     def get_by_id(data, vehiculo_id, validator):
-        vehiculo = next((v for v in data['vehiculos'] if v['id'] == vehiculo_id), None)
+        vehiculo = data.get_vehiculo(vehiculo_id)
         if not vehiculo:
             return {'error': 'Vehículo no encontrado', 'status': 404}
         if not validator.validate_vehiculo(vehiculo):
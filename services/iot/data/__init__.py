@@ -1,7 +1,216 @@
 """DATA - Carga de datos desde JSON"""
-import json
+import os
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import timezone
 from pathlib import Path
+from dateutil import parser as date_parser
+from .columnar import ESTADOS, ColumnasLecturas, LecturasColumnar, np, promedio, punto_tracking
 
-sensores = json.load(open(Path(__file__).parent / '../data/sensores.json', encoding='utf-8-sig'))
-lecturas = json.load(open(Path(__file__).parent / '../data/lecturas.json', encoding='utf-8-sig'))
-vehiculos = json.load(open(Path(__file__).parent / '../data/vehiculos.json', encoding='utf-8-sig'))
+# Directorio de los JSON (p. ej. una flota generada con benchmarks/flota.py)
+DATA_DIR = Path(os.getenv('DATA_DIR', Path(__file__).parent))
+
+# Columnas NumPy para estadísticas y tracking (solo si numpy está instalado)
+COLUMNAR = os.getenv('DATA_COLUMNAR', 'true').lower() == 'true' and np is not None
+
+def _indexar(registros, clave):
+    indice = defaultdict(list)
+    for registro in registros:
+        indice[clave(registro)].append(registro)
+    return dict(indice)
+
+
+def _tipo_sensor(sensor):
+    # El filtro 'tipo' corresponde al campo tipoProducto del schema de sensor
+    return sensor.get('tipo', sensor.get('tipoProducto'))
+
+
+def epoch(fecha):
+    """Segundos desde epoch de un datetime (los naive se interpretan como UTC)"""
+    if fecha.tzinfo is None:
+        fecha = fecha.replace(tzinfo=timezone.utc)
+    return fecha.timestamp()
+
+
+def epoch_lectura(lectura):
+    timestamp = lectura.get('timestamp')
+    if not timestamp:
+        return None
+    try:
+        return epoch(date_parser.isoparse(timestamp))
+    except (ValueError, OverflowError):
+        return None
+
+
+class SerieTemporal:
+    """Lecturas ordenadas por timestamp con sus epochs en un array paralelo para bisect"""
+
+    def __init__(self, pares):
+        # Las lecturas sin timestamp válido van al principio y solo salen sin filtro de fechas
+        ordenados = sorted(pares, key=lambda par: float('-inf') if par[0] is None else par[0])
+        self.sin_fecha = sum(1 for e, _ in ordenados if e is None)
+        self.epochs = [e for e, _ in ordenados[self.sin_fecha:]]
+        self.lecturas = [l for _, l in ordenados]
+
+    def __len__(self):
+        return len(self.lecturas)
+
+    def rango(self, desde=None, hasta=None):
+        """Devuelve (inicio, fin) de las lecturas con desde <= epoch <= hasta"""
+        if desde is None and hasta is None:
+            return 0, len(self.lecturas)
+        inicio = bisect_left(self.epochs, desde) if desde is not None else 0
+        fin = bisect_right(self.epochs, hasta) if hasta is not None else len(self.epochs)
+        return inicio + self.sin_fecha, fin + self.sin_fecha
+
+
+class DataStore:
+    """
+    Datos en memoria con índices hash construidos una sola vez al cargar.
+    Sigue admitiendo data['sensores'] / data['lecturas'] / data['vehiculos'].
+    """
+
+    def __init__(self, sensores, lecturas, vehiculos, epochs=None, columnas=None):
+        self.colecciones = {
+            'sensores': sensores,
+            'lecturas': lecturas,
+            'vehiculos': vehiculos
+        }
+
+        self.sensores_por_id = {s['id']: s for s in sensores}
+        self.lecturas_por_id = {l['id']: l for l in lecturas}
+        self.vehiculos_por_id = {v['id']: v for v in vehiculos}
+
+        self.sensores_por_tipo = _indexar(sensores, _tipo_sensor)
+        self.sensores_por_ubicacion = _indexar(sensores, lambda s: s.get('ubicacionId'))
+
+        # Timestamps parseados una sola vez (o tomados del snapshot);
+        # series ordenadas globales, por sensor y por ubicación
+        if epochs is None:
+            epochs = [epoch_lectura(l) for l in lecturas]
+        pares = list(zip(epochs, lecturas))
+        self.serie_lecturas = SerieTemporal(pares)
+        self.lecturas_por_sensor = {
+            k: SerieTemporal(v) for k, v in _indexar(pares, lambda par: par[1].get('sensorId')).items()
+        }
+        self.lecturas_por_ubicacion = {
+            k: SerieTemporal(v) for k, v in _indexar(pares, lambda par: par[1].get('ubicacionId')).items()
+        }
+        self.columnar = None
+        if COLUMNAR:
+            if columnas is None:
+                columnas = ColumnasLecturas.desde_registros(lecturas, epochs)
+            self.columnar = LecturasColumnar(columnas)
+
+    def __getitem__(self, coleccion):
+        return self.colecciones[coleccion]
+
+    def get_sensor(self, sensor_id):
+        return self.sensores_por_id.get(sensor_id)
+
+    def get_lectura(self, lectura_id):
+        return self.lecturas_por_id.get(lectura_id)
+
+    def get_vehiculo(self, vehiculo_id):
+        return self.vehiculos_por_id.get(vehiculo_id)
+
+    def filtrar_sensores(self, tipo=None, ubicacionId=None):
+        if tipo and ubicacionId:
+            por_tipo = self.sensores_por_tipo.get(tipo, [])
+            por_ubicacion = self.sensores_por_ubicacion.get(ubicacionId, [])
+            if len(por_tipo) <= len(por_ubicacion):
+                return [s for s in por_tipo if s.get('ubicacionId') == ubicacionId]
+            return [s for s in por_ubicacion if _tipo_sensor(s) == tipo]
+        if tipo:
+            return self.sensores_por_tipo.get(tipo, [])
+        if ubicacionId:
+            return self.sensores_por_ubicacion.get(ubicacionId, [])
+        return self.colecciones['sensores']
+
+    def filtrar_lecturas(self, sensorId=None, ubicacionId=None, desde=None, hasta=None, limit=None):
+        """
+        Lecturas en orden cronológico filtradas por sensor/ubicación y por epoch
+        [desde, hasta]: O(log n + k) con bisect sobre la serie más pequeña.
+        """
+        if sensorId and ubicacionId:
+            por_sensor = self.lecturas_por_sensor.get(sensorId)
+            por_ubicacion = self.lecturas_por_ubicacion.get(ubicacionId)
+            if por_sensor is None or por_ubicacion is None:
+                return []
+            if len(por_sensor) <= len(por_ubicacion):
+                serie, campo, valor = por_sensor, 'ubicacionId', ubicacionId
+            else:
+                serie, campo, valor = por_ubicacion, 'sensorId', sensorId
+            inicio, fin = serie.rango(desde, hasta)
+            filtradas = [l for l in serie.lecturas[inicio:fin] if l.get(campo) == valor]
+            return filtradas[:limit] if limit is not None else filtradas
+
+        if sensorId:
+            serie = self.lecturas_por_sensor.get(sensorId)
+        elif ubicacionId:
+            serie = self.lecturas_por_ubicacion.get(ubicacionId)
+        else:
+            serie = self.serie_lecturas
+        if serie is None:
+            return []
+
+        inicio, fin = serie.rango(desde, hasta)
+        if limit is not None:
+            fin = min(fin, inicio + limit)
+        return serie.lecturas[inicio:fin]
+
+    def estadisticas_ubicacion(self, ubicacionId, desde=None, hasta=None):
+        """Estadísticas de temperatura de una ubicación; None si no hay lecturas"""
+        if self.columnar is not None:
+            return self.columnar.estadisticas(ubicacionId, desde, hasta)
+
+        lecturas = self.filtrar_lecturas(ubicacionId=ubicacionId, desde=desde, hasta=hasta)
+        if not lecturas:
+            return None
+        minima, maxima = float('inf'), float('-inf')
+        por_estado = dict.fromkeys(ESTADOS, 0)
+        cadena_rota, tiempo_max = False, 0
+        temperaturas = []
+        for l in lecturas:
+            t = float(l['temperatura'])
+            temperaturas.append(t)
+            minima = min(minima, t)
+            maxima = max(maxima, t)
+            por_estado[l.get('estado')] = por_estado.get(l.get('estado'), 0) + 1
+            cadena_rota = cadena_rota or bool(l.get('cadenRota'))
+            tiempo_max = max(tiempo_max, int(l.get('tiempoFueraRango') or 0))
+        return {
+            "ubicacionId": ubicacionId,
+            "total_lecturas": len(lecturas),
+            "temperatura_promedio": round(promedio(temperaturas), 2),
+            "temperatura_minima": minima,
+            "temperatura_maxima": maxima,
+            "lecturas_normales": por_estado['normal'],
+            "lecturas_alerta": por_estado['alerta'],
+            "lecturas_criticas": por_estado['critico'],
+            "cadena_rota": cadena_rota,
+            "tiempo_max_fuera_rango": tiempo_max
+        }
+
+    def tracking_ubicacion(self, ubicacionId, desde=None, hasta=None, limit=None):
+        """Puntos GPS de una ubicación en orden cronológico"""
+        if self.columnar is not None:
+            return self.columnar.tracking(ubicacionId, desde, hasta, limit)
+
+        return [
+            punto_tracking(l)
+            for l in self.filtrar_lecturas(ubicacionId=ubicacionId, desde=desde, hasta=hasta, limit=limit)
+        ]
+
+
+from .cargador import GestorDatos
+
+# Carga perezosa: los ficheros se leen en el primer acceso
+store = GestorDatos(DATA_DIR, DataStore)
+
+
+def __getattr__(nombre):
+    # Compatibilidad con `from data import sensores, lecturas, vehiculos`
+    if nombre in ('sensores', 'lecturas', 'vehiculos'):
+        return store[nombre]
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
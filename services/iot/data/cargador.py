@@ -0,0 +1,263 @@
+"""DATA - Carga incremental, snapshot y recarga en caliente de los JSON"""
+import asyncio
+import json
+import os
+import threading
+from pathlib import Path
+from .columnar import ColumnasLecturas, np
+
+ARCHIVOS = {
+    'sensores': 'sensores.json',
+    'lecturas': 'lecturas.json',
+    'vehiculos': 'vehiculos.json'
+}
+
+# Directorio privado (0700) del snapshot; por defecto `.snapshot/` dentro de DATA_DIR
+SNAPSHOT_DIR = os.getenv('DATA_SNAPSHOT_DIR')
+SNAPSHOT_VERSION = 3
+RECARGA_INTERVALO = float(os.getenv('DATA_RECARGA_INTERVALO', '2'))
+
+_decoder = json.JSONDecoder()
+_ESPACIOS = ' \t\r\n'
+_DELIMITADORES = _ESPACIOS + ',]'
+
+
+def iterar_array_json(ruta, tam_bloque=1 << 16):
+    """
+    Recorre un array JSON de nivel superior elemento a elemento leyendo el fichero
+    por bloques, sin cargar el documento completo ni construir la lista entera.
+    """
+    with open(ruta, encoding='utf-8-sig') as f:
+        buffer = ''
+        pos = 0
+        dentro = False
+        fin_fichero = False
+
+        while True:
+            # Saltar espacios y separadores entre elementos
+            while pos < len(buffer) and (buffer[pos] in _ESPACIOS or (dentro and buffer[pos] == ',')):
+                pos += 1
+
+            if pos < len(buffer):
+                if not dentro:
+                    if buffer[pos] != '[':
+                        raise ValueError(f"{ruta}: se esperaba un array JSON")
+                    dentro = True
+                    pos += 1
+                    continue
+                if buffer[pos] == ']':
+                    return
+                try:
+                    elemento, fin = _decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if fin_fichero:
+                        raise
+                else:
+                    # Un número al final del buffer (o cortado en "1." / "1e") podría
+                    # estar incompleto: solo se acepta si le sigue un delimitador
+                    if fin_fichero or (fin < len(buffer) and buffer[fin] in _DELIMITADORES):
+                        yield elemento
+                        pos = fin
+                        continue
+            elif fin_fichero:
+                raise ValueError(f"{ruta}: array JSON sin cerrar")
+
+            bloque = f.read(tam_bloque)
+            if not bloque:
+                fin_fichero = True
+            buffer = buffer[pos:] + bloque
+            pos = 0
+
+
+def huella(data_dir):
+    """Ruta, tamaño y fecha de modificación de cada fichero, para detectar cambios"""
+    resultado = {'directorio': str(data_dir.resolve())}
+    for nombre in ARCHIVOS.values():
+        stat = (data_dir / nombre).stat()
+        # Listas y no tuplas: la huella se compara también con la guardada en el snapshot (JSON)
+        resultado[nombre] = [stat.st_size, stat.st_mtime_ns]
+    return resultado
+
+
+def ruta_snapshot(data_dir):
+    directorio = Path(SNAPSHOT_DIR) if SNAPSHOT_DIR else data_dir / '.snapshot'
+    return directorio / 'datos.npz'
+
+
+def _es_privado(ruta):
+    """Del usuario del proceso y sin escritura para grupo ni otros"""
+    if not hasattr(os, 'getuid'):
+        return True
+    stat = ruta.stat()
+    return stat.st_uid == os.getuid() and not stat.st_mode & 0o022
+
+
+def _textos_a_arrays(textos):
+    """Textos -> (bytes UTF-8 concatenados, desplazamientos en caracteres)"""
+    longitudes = np.fromiter((len(t) for t in textos), np.int64, len(textos))
+    desplazamientos = np.concatenate(([0], np.cumsum(longitudes)))
+    return np.frombuffer(''.join(textos).encode('utf-8'), np.uint8), desplazamientos
+
+
+def _arrays_a_textos(datos, desplazamientos):
+    texto = datos.tobytes().decode('utf-8')
+    limites = desplazamientos.tolist()
+    return np.array([texto[a:b] for a, b in zip(limites, limites[1:])], dtype=object)
+
+
+def _leer_snapshot(ruta, huella_actual):
+    """
+    Devuelve (sensores, vehiculos, ColumnasLecturas) o None si no hay snapshot válido.
+    np.load con allow_pickle=False: un fichero manipulado no puede ejecutar código,
+    solo invalidarse.
+    """
+    if np is None:
+        return None
+    try:
+        if not (_es_privado(ruta.parent) and _es_privado(ruta)):
+            print(f"⚠️  Se ignora el snapshot {ruta}: no es privado del usuario del servicio")
+            return None
+        with np.load(ruta, allow_pickle=False) as npz:
+            meta = json.loads(npz['meta'].tobytes().decode('utf-8'))
+            if meta.get('version') != SNAPSHOT_VERSION or meta.get('huella') != huella_actual:
+                return None
+            columnas = {nombre: npz[nombre] for nombre in ColumnasLecturas.nombres()
+                        if nombre not in ColumnasLecturas.TEXTOS}
+            for nombre in ColumnasLecturas.TEXTOS:
+                columnas[nombre] = _arrays_a_textos(npz[nombre], npz[nombre + '_desplazamientos'])
+    except (OSError, ValueError, KeyError, TypeError, UnicodeDecodeError):
+        return None
+
+    n = len(columnas['epoch'])
+    vocabularios = {'sensor': meta['sensores_lecturas'], 'ubicacion': meta['ubicaciones'], 'estado': meta['estados']}
+    if any(len(c) != n for c in columnas.values()) or any(
+            n and (columnas[nombre].min() < 0 or columnas[nombre].max() >= len(vocabulario))
+            for nombre, vocabulario in vocabularios.items()):
+        return None
+    irregulares = {int(i): lectura for i, lectura in meta['irregulares']}
+    # El texto guardado de las lecturas irregulares es un hueco: se toma de la lectura
+    for i, lectura in irregulares.items():
+        columnas['timestamp'][i] = lectura.get('timestamp')
+    lecturas = ColumnasLecturas(columnas, meta['sensores_lecturas'], meta['ubicaciones'], meta['estados'], irregulares)
+    return meta['sensores'], meta['vehiculos'], lecturas
+
+
+def _escribir_snapshot(ruta, huella_actual, sensores, vehiculos, columnas):
+    """
+    Snapshot binario: las columnas de las lecturas como arrays NumPy (.npz sin
+    comprimir) y, en el array `meta`, un JSON pequeño con la huella, sensores,
+    vehículos, vocabularios y las lecturas que no siguen el formato del schema.
+    """
+    if np is None:
+        return
+    # Escritura atómica: fichero temporal + rename, ambos en el directorio privado
+    try:
+        ruta.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        if not _es_privado(ruta.parent):
+            print(f"⚠️  No se guarda el snapshot: {ruta.parent} no es privado del usuario del servicio")
+            return
+        meta = {
+            'version': SNAPSHOT_VERSION,
+            'huella': huella_actual,
+            'sensores': sensores,
+            'vehiculos': vehiculos,
+            'sensores_lecturas': columnas.sensores,
+            'ubicaciones': columnas.ubicaciones,
+            'estados': columnas.estados,
+            'irregulares': [[i, lectura] for i, lectura in columnas.irregulares.items()]
+        }
+        arrays = {nombre: columnas[nombre] for nombre in ColumnasLecturas.nombres()
+                  if nombre not in ColumnasLecturas.TEXTOS}
+        for nombre in ColumnasLecturas.TEXTOS:
+            textos = [
+                '' if i in columnas.irregulares else t
+                for i, t in enumerate(columnas[nombre].tolist())
+            ]
+            arrays[nombre], arrays[nombre + '_desplazamientos'] = _textos_a_arrays(textos)
+        arrays['meta'] = np.frombuffer(
+            json.dumps(meta, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), np.uint8
+        )
+        tmp = ruta.with_suffix('.tmp')
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with open(fd, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, ruta)
+    except (OSError, TypeError, ValueError) as e:
+        print(f"⚠️  No se pudo guardar el snapshot de datos: {e}")
+
+
+class GestorDatos:
+    """
+    Mantiene el DataStore vigente. Se carga de forma perezosa en el primer acceso,
+    usa el snapshot si los JSON no han cambiado y, al detectar cambios,
+    construye un DataStore nuevo y lo sustituye de una vez: las peticiones en curso
+    terminan con el anterior y las nuevas ven el nuevo.
+    """
+
+    def __init__(self, data_dir, crear_store):
+        self.data_dir = Path(data_dir)
+        self.crear_store = crear_store
+        self.snapshot = ruta_snapshot(self.data_dir)
+        self.actual = None
+        self.huella = None
+        self.al_recargar = []
+        self.lock = threading.Lock()
+
+    def _construir(self):
+        from . import epoch_lectura
+
+        huella_actual = huella(self.data_dir)
+        snapshot = _leer_snapshot(self.snapshot, huella_actual)
+        if snapshot is not None:
+            sensores, vehiculos, columnas = snapshot
+            store = self.crear_store(sensores, columnas.registros(), vehiculos,
+                                     epochs=columnas.epochs(), columnas=columnas)
+            return store, huella_actual
+
+        colecciones = {
+            clave: list(iterar_array_json(self.data_dir / nombre))
+            for clave, nombre in ARCHIVOS.items()
+        }
+        if np is None:
+            return self.crear_store(**colecciones), huella_actual
+        # Las mismas columnas sirven para el DataStore y para el snapshot
+        epochs = [epoch_lectura(l) for l in colecciones['lecturas']]
+        columnas = ColumnasLecturas.desde_registros(colecciones['lecturas'], epochs)
+        store = self.crear_store(**colecciones, epochs=epochs, columnas=columnas)
+        _escribir_snapshot(self.snapshot, huella_actual, colecciones['sensores'], colecciones['vehiculos'], columnas)
+        return store, huella_actual
+
+    def obtener(self):
+        if self.actual is None:
+            with self.lock:
+                if self.actual is None:
+                    self.actual, self.huella = self._construir()
+        return self.actual
+
+    def recargar(self):
+        """Reconstruye el DataStore si los ficheros cambiaron; devuelve True si se sustituyó"""
+        with self.lock:
+            if self.actual is not None and huella(self.data_dir) == self.huella:
+                return False
+            store, huella_nueva = self._construir()
+            for callback in self.al_recargar:
+                callback(store)
+            self.actual, self.huella = store, huella_nueva
+        print("🔄 Datos recargados")
+        return True
+
+    async def vigilar(self, intervalo=RECARGA_INTERVALO):
+        """Comprueba periódicamente los ficheros y recarga en un hilo aparte"""
+        while True:
+            await asyncio.sleep(intervalo)
+            try:
+                await asyncio.to_thread(self.recargar)
+            except Exception as e:
+                print(f"❌ Error recargando datos, se mantiene la versión anterior: {e}")
+
+    # Acceso transparente al DataStore vigente (data['lecturas'], data.get_sensor(...))
+    def __getitem__(self, coleccion):
+        return self.obtener()[coleccion]
+
+    def __getattr__(self, nombre):
+        return getattr(self.obtener(), nombre)
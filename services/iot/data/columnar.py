@@ -0,0 +1,275 @@
+"""DATA - Representación columnar (NumPy) de las lecturas para analítica"""
+import math
+
+try:
+    import numpy as np
+except ImportError:  # numpy es opcional: sin él se usa el DataStore por registros
+    np = None
+
+ESTADOS = ('normal', 'alerta', 'critico')
+
+
+def _num(valor):
+    return float('nan') if valor is None else valor
+
+
+def _opcional(valor):
+    return None if valor is None else float(valor)
+
+
+def punto_tracking(lectura):
+    """Punto GPS de una lectura (números como float, como en el camino columnar)"""
+    return {
+        "timestamp": lectura['timestamp'],
+        "latitud": float(lectura['gps']['latitud']),
+        "longitud": float(lectura['gps']['longitud']),
+        "altitud": _opcional(lectura['gps'].get('altitud')),
+        "temperatura": float(lectura['temperatura']),
+        "estado": lectura['estado']
+    }
+
+
+def promedio(valores):
+    """
+    Media de las temperaturas. Con NumPy ambos caminos usan np.mean sobre las
+    lecturas en el mismo orden, así que el resultado es idéntico bit a bit.
+    """
+    if np is not None:
+        return float(np.mean(np.asarray(valores, dtype=np.float64)))
+    return math.fsum(valores) / len(valores)
+
+
+# Claves de una lectura del schema en su orden: las que cumplen este formato se
+# guardan en el snapshot solo como columnas y se reconstruyen tal cual
+CAMPOS = ('id', 'sensorId', 'ubicacionId', 'timestamp', 'temperatura', 'gps',
+          'estado', 'alertaActiva', 'tiempoFueraRango', 'cadenRota')
+_CAMPOS_GPS = (['latitud', 'longitud'], ['latitud', 'longitud', 'altitud'])
+# Enteros que float64 representa sin pérdida
+_MAX_ENTERO = 2 ** 53
+
+
+def _es_numero(valor):
+    if type(valor) is int:
+        return abs(valor) < _MAX_ENTERO
+    return type(valor) is float
+
+
+def _regular(l):
+    """True si la lectura se puede reconstruir exactamente desde las columnas"""
+    if not isinstance(l, dict) or tuple(l) != CAMPOS:
+        return False
+    gps = l['gps']
+    return (
+        all(type(l[c]) is str for c in ('id', 'sensorId', 'ubicacionId', 'timestamp', 'estado')) and
+        _es_numero(l['temperatura']) and
+        isinstance(gps, dict) and list(gps) in _CAMPOS_GPS and all(_es_numero(v) for v in gps.values()) and
+        type(l['alertaActiva']) is bool and type(l['cadenRota']) is bool and
+        type(l['tiempoFueraRango']) is int and abs(l['tiempoFueraRango']) < 2 ** 63
+    )
+
+
+def _codificar(valores, vocabulario):
+    codigo = {v: i for i, v in enumerate(vocabulario)}
+    return np.fromiter((codigo[v] for v in valores), np.int32, len(valores))
+
+
+class ColumnasLecturas:
+    """
+    Lecturas en columnas NumPy en el orden de carga. Alimentan LecturasColumnar y el
+    snapshot binario: las lecturas con el formato del schema (CAMPOS) se reconstruyen
+    desde las columnas; las demás se guardan aparte, completas, en `irregulares`.
+    """
+    NUMERICAS = ('epoch', 'temperatura', 'latitud', 'longitud', 'altitud')
+    ENTERAS = ('temperatura', 'latitud', 'longitud', 'altitud')
+    CODIGOS = ('sensor', 'ubicacion', 'estado')
+    BOOLEANAS = ('alerta_activa', 'cadena_rota')
+    TEXTOS = ('id', 'timestamp')
+
+    def __init__(self, columnas, sensores, ubicaciones, estados, irregulares):
+        self.columnas = columnas          # nombre -> array (ver `nombres`)
+        self.sensores = sensores          # vocabularios de los códigos
+        self.ubicaciones = ubicaciones
+        self.estados = estados
+        self.irregulares = irregulares    # índice -> lectura completa
+
+    @classmethod
+    def nombres(cls):
+        return (cls.NUMERICAS + tuple(c + '_entera' for c in cls.ENTERAS) + cls.CODIGOS +
+                cls.BOOLEANAS + ('tiempo_fuera_rango',) + cls.TEXTOS)
+
+    def __len__(self):
+        return len(self.columnas['epoch'])
+
+    def __getitem__(self, nombre):
+        return self.columnas[nombre]
+
+    @classmethod
+    def desde_registros(cls, lecturas, epochs):
+        n = len(lecturas)
+        irregulares = {i: l for i, l in enumerate(lecturas) if not _regular(l)}
+
+        def columna(valores, dtype):
+            return np.fromiter(valores, dtype, n)
+
+        def gps(l, campo):
+            return l['gps'].get(campo)
+
+        sensores = [l.get('sensorId') or '' for l in lecturas]
+        ubicaciones = [l.get('ubicacionId') or '' for l in lecturas]
+        estados = [l.get('estado') for l in lecturas]
+        vocabulario_estados = list(ESTADOS) + sorted(set(estados) - set(ESTADOS), key=str)
+        vocabulario_sensores = sorted(set(sensores))
+        vocabulario_ubicaciones = sorted(set(ubicaciones))
+
+        columnas = {
+            'epoch': columna((math.nan if e is None else e for e in epochs), np.float64),
+            'temperatura': columna((_num(l.get('temperatura')) for l in lecturas), np.float64),
+            'latitud': columna((_num(gps(l, 'latitud')) for l in lecturas), np.float64),
+            'longitud': columna((_num(gps(l, 'longitud')) for l in lecturas), np.float64),
+            'altitud': columna((_num(gps(l, 'altitud')) for l in lecturas), np.float64),
+            'temperatura_entera': columna((type(l.get('temperatura')) is int for l in lecturas), np.bool_),
+            'latitud_entera': columna((type(gps(l, 'latitud')) is int for l in lecturas), np.bool_),
+            'longitud_entera': columna((type(gps(l, 'longitud')) is int for l in lecturas), np.bool_),
+            'altitud_entera': columna((type(gps(l, 'altitud')) is int for l in lecturas), np.bool_),
+            'sensor': _codificar(sensores, vocabulario_sensores),
+            'ubicacion': _codificar(ubicaciones, vocabulario_ubicaciones),
+            'estado': _codificar(estados, vocabulario_estados),
+            'alerta_activa': columna((bool(l.get('alertaActiva')) for l in lecturas), np.bool_),
+            'cadena_rota': columna((bool(l.get('cadenRota')) for l in lecturas), np.bool_),
+            'tiempo_fuera_rango': columna((int(l.get('tiempoFueraRango') or 0) for l in lecturas), np.int64),
+            'id': np.array([l.get('id') for l in lecturas], dtype=object),
+            'timestamp': np.array([l.get('timestamp') for l in lecturas], dtype=object),
+        }
+        return cls(columnas, vocabulario_sensores, vocabulario_ubicaciones, vocabulario_estados, irregulares)
+
+    def epochs(self):
+        """Epochs en el orden de carga (None si la lectura no tiene timestamp válido)"""
+        return [None if e != e else e for e in self.columnas['epoch'].tolist()]
+
+    def registros(self):
+        """Reconstruye las lecturas (dicts) en el orden de carga"""
+        c = self.columnas
+        numeros = {}
+        for campo in self.ENTERAS:
+            valores = c[campo].tolist()
+            for i in np.flatnonzero(c[campo + '_entera']).tolist():
+                valores[i] = int(valores[i])
+            numeros[campo] = valores
+        sensores = [self.sensores[i] for i in c['sensor'].tolist()]
+        ubicaciones = [self.ubicaciones[i] for i in c['ubicacion'].tolist()]
+        estados = [self.estados[i] for i in c['estado'].tolist()]
+
+        lecturas = []
+        for (lectura_id, sensor_id, ubicacion_id, timestamp, temperatura, latitud, longitud, altitud,
+             estado, alerta, tiempo, cadena) in zip(
+                c['id'].tolist(), sensores, ubicaciones, c['timestamp'].tolist(), numeros['temperatura'],
+                numeros['latitud'], numeros['longitud'], numeros['altitud'], estados,
+                c['alerta_activa'].tolist(), c['tiempo_fuera_rango'].tolist(), c['cadena_rota'].tolist()):
+            if altitud != altitud:
+                gps = {"latitud": latitud, "longitud": longitud}
+            else:
+                gps = {"latitud": latitud, "longitud": longitud, "altitud": altitud}
+            lecturas.append({
+                "id": lectura_id,
+                "sensorId": sensor_id,
+                "ubicacionId": ubicacion_id,
+                "timestamp": timestamp,
+                "temperatura": temperatura,
+                "gps": gps,
+                "estado": estado,
+                "alertaActiva": alerta,
+                "tiempoFueraRango": tiempo,
+                "cadenRota": cadena
+            })
+        for i, lectura in self.irregulares.items():
+            lecturas[i] = lectura
+        return lecturas
+
+
+class LecturasColumnar:
+    """
+    Columnas NumPy ordenadas por (ubicación, timestamp): cada ubicación ocupa un
+    tramo contiguo y el rango temporal se resuelve con searchsorted. Los filtros y
+    agregados son vectorizados y las respuestas se construyen desde las columnas,
+    sin guardar referencias a los dicts de las lecturas. Solo el timestamp original
+    se guarda como texto, para devolverlo tal cual en el tracking.
+    """
+
+    def __init__(self, columnas):
+        self.ubicaciones = columnas.ubicaciones
+        self.estados = columnas.estados
+
+        # Las lecturas sin timestamp válido van al principio de su tramo (como en SerieTemporal)
+        epoch = np.nan_to_num(columnas['epoch'], nan=-math.inf, posinf=math.inf, neginf=-math.inf)
+        orden = np.lexsort((epoch, columnas['ubicacion']))
+
+        self.ubicacion = columnas['ubicacion'][orden]
+        self.epoch = epoch[orden]
+        self.timestamp = columnas['timestamp'][orden]
+        self.temperatura = columnas['temperatura'][orden]
+        self.latitud = columnas['latitud'][orden]
+        self.longitud = columnas['longitud'][orden]
+        self.altitud = columnas['altitud'][orden]
+        self.estado = columnas['estado'][orden]
+        self.tiempo_fuera_rango = columnas['tiempo_fuera_rango'][orden]
+        self.cadena_rota = columnas['cadena_rota'][orden]
+
+        # Tramo [inicio, fin) de cada ubicación
+        limites = np.searchsorted(self.ubicacion, np.arange(len(self.ubicaciones) + 1))
+        self.tramos = {
+            u: (int(limites[i]), int(limites[i + 1])) for i, u in enumerate(self.ubicaciones)
+        }
+
+    def rango(self, ubicacionId, desde=None, hasta=None):
+        """Índices [inicio, fin) de una ubicación entre los epochs desde/hasta (incluidos)"""
+        tramo = self.tramos.get(ubicacionId)
+        if tramo is None:
+            return 0, 0
+        inicio, fin = tramo
+        if desde is None and hasta is None:
+            return inicio, fin
+        epochs = self.epoch[inicio:fin]
+        # Con filtro de fechas quedan fuera las lecturas sin timestamp (-inf)
+        a = int(np.searchsorted(epochs, -math.inf if desde is None else desde, 'right' if desde is None else 'left'))
+        b = int(np.searchsorted(epochs, hasta, 'right')) if hasta is not None else fin - inicio
+        return inicio + a, inicio + b
+
+    def estadisticas(self, ubicacionId, desde=None, hasta=None):
+        inicio, fin = self.rango(ubicacionId, desde, hasta)
+        if inicio == fin:
+            return None
+        temperatura = self.temperatura[inicio:fin]
+        por_estado = np.bincount(self.estado[inicio:fin], minlength=len(self.estados))
+        return {
+            "ubicacionId": ubicacionId,
+            "total_lecturas": fin - inicio,
+            "temperatura_promedio": round(promedio(temperatura), 2),
+            "temperatura_minima": float(np.nanmin(temperatura)),
+            "temperatura_maxima": float(np.nanmax(temperatura)),
+            "lecturas_normales": int(por_estado[0]),
+            "lecturas_alerta": int(por_estado[1]),
+            "lecturas_criticas": int(por_estado[2]),
+            "cadena_rota": bool(self.cadena_rota[inicio:fin].any()),
+            "tiempo_max_fuera_rango": max(int(self.tiempo_fuera_rango[inicio:fin].max()), 0)
+        }
+
+    def tracking(self, ubicacionId, desde=None, hasta=None, limit=None):
+        inicio, fin = self.rango(ubicacionId, desde, hasta)
+        if limit is not None:
+            fin = min(fin, inicio + limit)
+        tramo = slice(inicio, fin)
+        return [
+            {
+                "timestamp": timestamp,
+                "latitud": latitud,
+                "longitud": longitud,
+                "altitud": None if altitud != altitud else altitud,
+                "temperatura": temperatura,
+                "estado": self.estados[estado]
+            }
+            for timestamp, latitud, longitud, altitud, temperatura, estado in zip(
+                self.timestamp[tramo].tolist(), self.latitud[tramo].tolist(),
+                self.longitud[tramo].tolist(), self.altitud[tramo].tolist(),
+                self.temperatura[tramo].tolist(), self.estado[tramo].tolist()
+            )
+        ]
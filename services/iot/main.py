@@ -0,0 +1,53 @@
+"""MAIN - Aplicación FastAPI del servicio IoT (datos JSON)"""
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+import asyncio
+import os
+from data import store
+from validator import SchemaValidator
+from routes import setup_routes
+from error_handlers import setup_exception_handlers
+
+app = FastAPI(
+    title="IoT Fresh&Go",
+    version="1.0.0",
+    description="Monitoreo de sensores, lecturas y vehículos (datos JSON)"
+)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+setup_exception_handlers(app)
+
+# Validación en carga: las peticiones solo consultan el resultado memoizado
+validator = SchemaValidator()
+
+def validar_datos(datos):
+    invalidos = validator.precalentar(datos)
+    print(f"✅ Datos validados (modo {validator.modo}): no conformes {invalidos}")
+
+# Al recargar, el nuevo conjunto se valida antes de sustituir al anterior
+store.al_recargar.append(validar_datos)
+
+app.include_router(setup_routes(store, validator))
+
+@app.on_event("startup")
+async def startup_event():
+    validar_datos(await asyncio.to_thread(store.obtener))
+    if os.getenv('DATA_RECARGA', 'true').lower() == 'true':
+        app.state.vigilancia = asyncio.create_task(store.vigilar())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    vigilancia = getattr(app.state, 'vigilancia', None)
+    if vigilancia:
+        vigilancia.cancel()
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv('PORT', 8001)))
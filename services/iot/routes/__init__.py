@@ -44,6 +44,35 @@ def setup_routes(data, validator):
                 raise ValidationError(result['error'])
         return result
 
+    @router.get("/lecturas/estadisticas/{ubicacion_id}")
+    async def get_estadisticas_ubicacion(
+        ubicacion_id: str,
+        from_date: Optional[str] = Query(None, alias="from"),
+        to_date: Optional[str] = Query(None, alias="to")
+    ):
+        result = LecturaController.get_estadisticas(data, ubicacion_id, from_date=from_date, to_date=to_date)
+        if isinstance(result, dict) and 'status' in result:
+            if result['status'] == 404:
+                raise NotFoundError(result['error'])
+            else:
+                raise ValidationError(result['error'])
+        return result
+
+    @router.get("/lecturas/tracking/{ubicacion_id}")
+    async def get_tracking_ubicacion(
+        ubicacion_id: str,
+        from_date: Optional[str] = Query(None, alias="from"),
+        to_date: Optional[str] = Query(None, alias="to"),
+        limit: int = Query(50, ge=1, le=500)
+    ):
+        result = LecturaController.get_tracking(data, ubicacion_id, from_date=from_date, to_date=to_date, limit=limit)
+        if isinstance(result, dict) and 'status' in result:
+            if result['status'] == 404:
+                raise NotFoundError(result['error'])
+            else:
+                raise ValidationError(result['error'])
+        return result
+
     @router.get("/vehiculos")
     async def get_vehiculos():
         result = VehiculoController.get_all(data, validator)
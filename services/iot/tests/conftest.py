@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Los paquetes del servicio se importan como en main.py (directorio del servicio en sys.path)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,82 @@
+"""El camino columnar (NumPy) devuelve exactamente lo mismo que el camino por registros"""
+import json
+
+import pytest
+
+import data
+from data import DataStore, epoch
+from data.cargador import ARCHIVOS, iterar_array_json
+from dateutil import parser as date_parser
+
+pytest.importorskip("numpy")
+
+
+def _lectura(lectura_id, timestamp, temperatura, altitud=650.0, estado='normal', ubicacion='VEH001'):
+    return {
+        "id": lectura_id,
+        "sensorId": "SENS001",
+        "ubicacionId": ubicacion,
+        "timestamp": timestamp,
+        "temperatura": temperatura,
+        "gps": {"latitud": 40.4168, "longitud": -3.7038, "altitud": altitud},
+        "estado": estado,
+        "alertaActiva": estado != 'normal',
+        "tiempoFueraRango": 0 if estado == 'normal' else 7,
+        "cadenRota": False
+    }
+
+
+LECTURAS = [
+    _lectura("L1", "2025-11-11T09:00:00+01:00", 2.123, altitud=12.3),
+    _lectura("L2", "2025-11-11T08:30:00Z", -18, altitud=None, estado='alerta'),
+    _lectura("L3", "2025-11-11T08:30:00Z", 4.455, estado='critico'),
+    _lectura("L4", None, 3.1),
+    _lectura("L5", "2025-11-11T10:15:00.123456Z", 0.1, estado='desconocido'),
+    _lectura("L6", "2025-11-11T07:00:00Z", 5.5, ubicacion='VEH002'),
+]
+
+VENTANAS = [
+    (None, None),
+    (epoch(date_parser.isoparse("2025-11-11T08:00:00Z")), None),
+    (None, epoch(date_parser.isoparse("2025-11-11T08:30:00Z"))),
+    (epoch(date_parser.isoparse("2025-11-11T08:30:00Z")), epoch(date_parser.isoparse("2025-11-11T09:00:00Z"))),
+    (epoch(date_parser.isoparse("2026-01-01T00:00:00Z")), None),
+]
+
+
+def _caminos(lecturas):
+    columnar = DataStore([], lecturas, [])
+    if columnar.columnar is None:
+        pytest.skip("DATA_COLUMNAR desactivado")
+    registros = DataStore([], lecturas, [])
+    registros.columnar = None
+    return columnar, registros
+
+
+def _comparar(columnar, registros, ubicaciones):
+    for ubicacion in ubicaciones:
+        for desde, hasta in VENTANAS:
+            for metodo, extra in (('estadisticas_ubicacion', {}), ('tracking_ubicacion', {}),
+                                  ('tracking_ubicacion', {'limit': 2})):
+                esperado = getattr(registros, metodo)(ubicacion, desde, hasta, **extra)
+                obtenido = getattr(columnar, metodo)(ubicacion, desde, hasta, **extra)
+                assert json.dumps(obtenido) == json.dumps(esperado), (metodo, ubicacion, desde, hasta)
+
+
+def test_columnar_igual_que_registros():
+    columnar, registros = _caminos(LECTURAS)
+    _comparar(columnar, registros, ['VEH001', 'VEH002', 'NOEXISTE'])
+
+
+def test_valores_originales():
+    columnar, _ = _caminos(LECTURAS)
+    puntos = columnar.tracking_ubicacion('VEH001', epoch(date_parser.isoparse("2025-11-11T08:00:00Z")))
+    l1 = next(p for p in puntos if p["temperatura"] == 2.123)
+    assert l1["altitud"] == 12.3
+    assert l1["timestamp"] == "2025-11-11T09:00:00+01:00"
+
+
+def test_datos_del_servicio():
+    lecturas = list(iterar_array_json(data.DATA_DIR / ARCHIVOS['lecturas']))
+    columnar, registros = _caminos(lecturas)
+    _comparar(columnar, registros, sorted({l['ubicacionId'] for l in lecturas}))
@@ -0,0 +1,49 @@
+"""El snapshot binario reconstruye exactamente los datos de los JSON"""
+import json
+
+import pytest
+
+from data import DataStore
+from data.cargador import ARCHIVOS, GestorDatos
+
+from test_columnar import LECTURAS
+
+pytest.importorskip("numpy")
+
+SENSORES = [{"id": "SENS001", "tipo": "congelado", "ubicacionId": "VEH001"}]
+VEHICULOS = [{"id": "VEH001", "matricula": "1234-ABC"}, {"id": "VEH002", "matricula": "5678-DEF"}]
+# Lecturas fuera del formato del schema: se guardan tal cual en los metadatos
+IRREGULARES = [
+    {"id": "L7", "sensorId": "SENS001", "ubicacionId": "VEH001", "timestamp": "2025-11-11T11:00:00Z",
+     "temperatura": 1.5, "gps": {"latitud": 40.4, "longitud": -3.7}, "estado": "normal",
+     "alertaActiva": False, "tiempoFueraRango": 0, "cadenRota": False, "notas": "extra"},
+    {"sensorId": "SENS001", "id": "L8", "ubicacionId": "VEH002", "timestamp": "2025-11-11T12:00:00Z",
+     "temperatura": 2.0, "gps": {"longitud": -3.7, "latitud": 40.4}, "estado": "alerta",
+     "alertaActiva": True, "tiempoFueraRango": 3, "cadenRota": False},
+]
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    colecciones = {'sensores': SENSORES, 'lecturas': LECTURAS + IRREGULARES, 'vehiculos': VEHICULOS}
+    for clave, nombre in ARCHIVOS.items():
+        (tmp_path / nombre).write_text(json.dumps(colecciones[clave]), encoding='utf-8')
+    return tmp_path
+
+
+def test_snapshot_ida_y_vuelta(data_dir):
+    frio = GestorDatos(data_dir, DataStore).obtener()
+    gestor = GestorDatos(data_dir, DataStore)
+    assert gestor.snapshot.exists()
+
+    caliente = gestor.obtener()
+    for coleccion in ('sensores', 'lecturas', 'vehiculos'):
+        assert json.dumps(caliente[coleccion]) == json.dumps(frio[coleccion])
+    assert caliente.estadisticas_ubicacion('VEH001') == frio.estadisticas_ubicacion('VEH001')
+
+
+def test_snapshot_de_otros_ficheros_se_descarta(data_dir):
+    GestorDatos(data_dir, DataStore).obtener()
+    (data_dir / ARCHIVOS['vehiculos']).write_text(json.dumps(VEHICULOS[:1]), encoding='utf-8')
+
+    assert GestorDatos(data_dir, DataStore).obtener()['vehiculos'] == VEHICULOS[:1]
@@ -0,0 +1,92 @@
+"""VALIDATOR - Validación con JSON Schema compilado y resultados memoizados por registro"""
+import json
+import os
+import zlib
+from pathlib import Path
+from jsonschema import Draft7Validator
+
+SCHEMAS_DIR = Path(os.getenv('SCHEMAS_DIR', Path(__file__).resolve().parent / '../../schemas'))
+
+# strict: valida todos los registros | sampled: solo una muestra | off: sin validación
+VALIDACION_MODO = os.getenv('VALIDACION_MODO', 'strict')
+VALIDACION_MUESTREO = float(os.getenv('VALIDACION_MUESTREO', '0.1'))
+
+MODOS = ('strict', 'sampled', 'off')
+
+
+def _compilar(nombre):
+    with open(SCHEMAS_DIR / nombre, encoding='utf-8-sig') as f:
+        return Draft7Validator(json.load(f))
+
+
+class SchemaValidator:
+    """
+    Los schemas se compilan una vez y cada registro se valida como mucho una vez:
+    el resultado se guarda por registro hasta que se invalida (cambio de datos).
+    """
+
+    def __init__(self, modo=VALIDACION_MODO, muestreo=VALIDACION_MUESTREO):
+        if modo not in MODOS:
+            raise ValueError(f"Modo de validación desconocido: {modo}")
+        self.modo = modo
+        self.muestreo = muestreo
+        self.validadores = {
+            'sensores': _compilar('sensor.schema.json'),
+            'lecturas': _compilar('lectura.schema.json'),
+            'vehiculos': _compilar('vehiculo.schema.json')
+        }
+        # id(registro) -> (registro, resultado); se guarda el registro para que su id no se reutilice
+        self.resultados = {}
+
+    def _en_muestra(self, registro):
+        # Muestreo determinista por id para que el resultado sea estable entre peticiones
+        clave = str(registro.get('id', id(registro))).encode()
+        return zlib.crc32(clave) % 10000 < self.muestreo * 10000
+
+    def _resultado(self, coleccion, registro):
+        if self.modo == 'sampled' and not self._en_muestra(registro):
+            return True
+        return self.validadores[coleccion].is_valid(registro)
+
+    def _validar(self, coleccion, registro):
+        if self.modo == 'off':
+            return True
+        memo = self.resultados.get(id(registro))
+        if memo is not None and memo[0] is registro:
+            return memo[1]
+        resultado = self._resultado(coleccion, registro)
+        self.resultados[id(registro)] = (registro, resultado)
+        return resultado
+
+    def validate_sensor(self, sensor):
+        return self._validar('sensores', sensor)
+
+    def validate_lectura(self, lectura):
+        return self._validar('lecturas', lectura)
+
+    def validate_vehiculo(self, vehiculo):
+        return self._validar('vehiculos', vehiculo)
+
+    def precalentar(self, data):
+        """
+        Valida todos los registros al cargar y sustituye de una vez los resultados
+        memoizados; devuelve el número de no conformes por colección.
+        """
+        resultados = {}
+        invalidos = {}
+        for coleccion in self.validadores:
+            invalidos[coleccion] = 0
+            for registro in data[coleccion]:
+                resultado = self.modo == 'off' or self._resultado(coleccion, registro)
+                resultados[id(registro)] = (registro, resultado)
+                if not resultado:
+                    invalidos[coleccion] += 1
+        self.resultados = resultados
+        return invalidos
+
+    def invalidar(self, registro=None):
+        """Descarta el resultado de un registro, o todos si no se indica ninguno"""
+        if registro is None:
+            self.resultados.clear()
+        else:
+            self.resultados.pop(id(registro), None)